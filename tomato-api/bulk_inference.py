@@ -0,0 +1,303 @@
+"""
+Inferensi massal offline untuk mengevaluasi model baru atau menilai ulang
+arsip foto lapangan.
+
+    python bulk_inference.py data/uji --model model_baru.keras --output hasil.csv
+    python bulk_inference.py foto-2024.tar --output hasil.parquet --batch-size 128
+
+Gambar dibaca dari direktori (rekursif) atau shard tar (boleh .tar.gz),
+di-decode di pool multiprocessing, lalu dijalankan ke model per batch.
+Nama folder induk setiap gambar dipetakan ke NAMA_KELAS sebagai label;
+bila ada label, confusion matrix ditulis ke <output>_confusion.csv.
+File prediksi CSV sekaligus menjadi checkpoint: menjalankan ulang perintah
+yang sama melewati gambar yang sudah tercatat.
+"""
+
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tarfile
+import threading
+import time
+
+import numpy as np
+
+from disease_service import NAMA_KELAS
+from image_service import load_image, to_model_pixels
+from inference_service import MODEL_PATH, is_confident, load_calibration, predict_probabilities
+
+logger = logging.getLogger("bulk_inference")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+COLUMNS = ("path", "label", "predicted", "confidence", "recognized", "error")
+PROGRESS_INTERVAL = 10.0
+
+
+def _normalize(name):
+    name = re.sub(r"[^a-z]", "", name.lower())
+    while name.startswith("tomato"):
+        name = name[len("tomato"):]
+    return name
+
+
+_KELAS_NORMAL = {_normalize(kelas): kelas for kelas in NAMA_KELAS}
+
+
+def map_label(folder):
+    """
+    Petakan nama folder ke NAMA_KELAS, toleran terhadap penamaan dataset
+    seperti 'Tomato___Tomato_Yellow_Leaf_Curl_Virus' atau
+    'Tomato___Spider_mites Two-spotted_spider_mite'. None bila tidak cocok.
+    """
+    name = _normalize(folder)
+    if not name:
+        return None
+    if name in _KELAS_NORMAL:
+        return _KELAS_NORMAL[name]
+    for normal, kelas in _KELAS_NORMAL.items():
+        if name.startswith(normal):
+            return kelas
+    return None
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_directory(root):
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if _is_image(name):
+                path = os.path.join(directory, name)
+                yield os.path.relpath(path, root), path, None
+
+
+def iter_tar(path):
+    # Mode stream: shard dibaca berurutan tanpa membangun indeks anggota
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and _is_image(member.name):
+                yield member.name, None, archive.extractfile(member).read()
+
+
+def iter_sources(source):
+    """
+    Hasilkan (nama, path, bytes) untuk setiap gambar di direktori atau shard tar
+    """
+    if not os.path.exists(source):
+        raise ValueError(f"{source} tidak ditemukan")
+    if os.path.isdir(source):
+        return iter_directory(source)
+    if tarfile.is_tarfile(source):
+        return iter_tar(source)
+    raise ValueError(f"{source} bukan direktori atau file tar")
+
+
+def label_for(name):
+    parent = os.path.basename(os.path.dirname(name))
+    return map_label(parent) if parent else None
+
+
+def decode(item):
+    """
+    Dijalankan di proses pool: decode satu gambar ke piksel uint8 ukuran input model
+    """
+    name, path, data = item
+    try:
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        return name, to_model_pixels(load_image(data)), None
+    except (OSError, ValueError) as e:
+        return name, None, str(e)
+
+
+def read_checkpoint(path):
+    """
+    Nama gambar yang sudah tercatat di file prediksi dari run sebelumnya
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["path"] for row in csv.DictReader(f)}
+
+
+def confusion_matrix(path):
+    """
+    Bangun confusion matrix (label -> prediksi) dari seluruh baris file prediksi
+    """
+    size = len(NAMA_KELAS)
+    matrix = np.zeros((size, size), dtype=np.int64)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["label"] in NAMA_KELAS and row["predicted"] in NAMA_KELAS:
+                matrix[NAMA_KELAS.index(row["label"]), NAMA_KELAS.index(row["predicted"])] += 1
+    return matrix
+
+
+def write_confusion(matrix, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["label"] + NAMA_KELAS)
+        for kelas, row in zip(NAMA_KELAS, matrix.tolist()):
+            writer.writerow([kelas] + row)
+
+
+def write_parquet(csv_path, parquet_path):
+    import pyarrow.csv
+    import pyarrow.parquet
+
+    pyarrow.parquet.write_table(pyarrow.csv.read_csv(csv_path), parquet_path)
+
+
+class Progress:
+    def __init__(self, skipped):
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.done = 0
+        self.failed = 0
+        self.skipped = skipped
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if force or now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            logger.info(
+                "%s gambar diproses (%s gagal, %s dilewati dari checkpoint), %.1f gambar/detik",
+                self.done, self.failed, self.skipped, self.rate(),
+            )
+
+
+def run(args):
+    # Sumber dicek sebelum model dimuat dan file output dibuat
+    sources = iter_sources(args.source)
+    parquet = args.output.endswith(".parquet")
+    if parquet:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Output Parquet membutuhkan paket pyarrow")
+    stem = os.path.splitext(args.output)[0]
+    # Output Parquet ditulis di akhir; selama proses berjalan prediksi dan
+    # checkpoint disimpan sebagai CSV
+    csv_path = stem + ".partial.csv" if parquet else args.output
+
+    done = read_checkpoint(csv_path)
+    if done:
+        logger.info("Melanjutkan dari checkpoint: %s gambar sudah diproses", len(done))
+
+    # Pool decode dibuat sebelum TensorFlow diimpor: fork dari proses yang
+    # thread pool TF-nya sudah berjalan bisa membuat proses anak macet
+    with multiprocessing.Pool(args.workers) as pool:
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(args.model, compile=False)
+        calibration = load_calibration(args.model)
+
+        # Batasi gambar yang sedang diproses pool agar shard besar tidak dimuat
+        # seluruhnya ke memori (imap membaca iterator input di thread terpisah).
+        # imap baru mengirim tugas setelah satu chunk penuh, jadi batas harus
+        # muat beberapa chunk untuk setiap proses; kurang dari itu pool macet.
+        in_flight = threading.BoundedSemaphore(max(args.batch_size * 4, args.chunksize * args.workers * 2))
+
+        def pending():
+            for item in sources:
+                if item[0] in done:
+                    continue
+                in_flight.acquire()
+                yield item
+
+        progress = Progress(len(done))
+        new_file = not os.path.exists(csv_path)
+        with open(csv_path, "a", newline="", encoding="utf-8") as out:
+            writer = csv.writer(out)
+            if new_file:
+                writer.writerow(COLUMNS)
+
+            names, pixels = [], []
+
+            def flush():
+                if names:
+                    batch = np.stack(pixels) / 255.0
+                    probabilities = predict_probabilities(model, batch, calibration)
+                    for name, row in zip(names, probabilities):
+                        index = int(np.argmax(row))
+                        confidence = float(row[index])
+                        writer.writerow(
+                            (name, label_for(name) or "", NAMA_KELAS[index], round(confidence, 6),
+                             is_confident(index, confidence, calibration), "")
+                        )
+                    progress.done += len(names)
+                    names.clear()
+                    pixels.clear()
+                # Checkpoint: setiap batch yang selesai langsung tersimpan di disk
+                out.flush()
+                os.fsync(out.fileno())
+                progress.report()
+
+            for name, array, error in pool.imap(decode, pending(), chunksize=args.chunksize):
+                in_flight.release()
+                if array is None:
+                    writer.writerow((name, label_for(name) or "", "", "", "", error))
+                    progress.failed += 1
+                    continue
+                names.append(name)
+                pixels.append(array)
+                if len(names) >= args.batch_size:
+                    flush()
+            flush()
+    progress.report(force=True)
+
+    matrix = confusion_matrix(csv_path)
+    if matrix.sum():
+        confusion_path = stem + "_confusion.csv"
+        write_confusion(matrix, confusion_path)
+        logger.info(
+            "Akurasi %.2f%% dari %s gambar berlabel, confusion matrix: %s",
+            100 * np.trace(matrix) / matrix.sum(), matrix.sum(), confusion_path,
+        )
+    if parquet:
+        write_parquet(csv_path, args.output)
+        os.remove(csv_path)
+    logger.info("Prediksi ditulis ke %s", args.output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inferensi massal gambar daun tomat secara offline")
+    parser.add_argument("source", help="Direktori gambar atau shard .tar/.tar.gz")
+    parser.add_argument(
+        "--model",
+        default=MODEL_PATH,
+        help="File model .keras (default MODEL_PATH)",
+    )
+    parser.add_argument("--output", default="predictions.csv", help="File hasil (.csv atau .parquet)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Jumlah gambar per panggilan model")
+    parser.add_argument(
+        "--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Jumlah proses decode"
+    )
+    parser.add_argument("--chunksize", type=int, default=8, help="Gambar per tugas yang dikirim ke proses decode")
+    args = parser.parse_args(argv)
+    for name in ("batch_size", "workers", "chunksize"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} minimal 1")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        run(args)
+    except ValueError as e:
+        logger.error("%s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,364 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import metrics_service as metrics
+from content_store import CONTENT_SYNC_INTERVAL, ContentStore
 from news_service import get_news_data
 from tip_service import get_tips_data
+from search_index import SearchIndex, tokenize
+from fuzzy_search import SynonymMap, ranked_search
+from disease_service import SINONIM_PENYAKIT
+
+logger = logging.getLogger(__name__)
+
+VALID_TYPES = ["berita", "tip"]
+
+# Jumlah maksimal konten terkait yang dikembalikan per kelas penyakit
+RELATED_CONTENT_LIMIT = int(os.getenv("RELATED_CONTENT_LIMIT", 10))
+# Tambahan skor bila frasa sinonim (lebih dari satu kata) muncul utuh di dokumen
+RELATED_PHRASE_BOOST = 2.0
+# Konten hanya dikaitkan ke kelas yang skornya minimal sebagian ini dari skor
+# kelas terbaik untuk konten tersebut (artikel Early Blight tidak ikut muncul
+# untuk Late Blight hanya karena sama-sama menyebut "hawar daun")
+RELATED_MIN_SHARE = 0.5
+# Kata yang muncul di hampir semua konten sehingga tidak membedakan penyakit
+_KATA_UMUM = {"tomat", "tomato", "tanaman"}
+# Kelas tanpa penyakit: konten yang membahas penyakit tertentu tidak dikaitkan
+_KELAS_SEHAT = "Healthy"
+# Field konten yang disertakan pada daftar konten terkait
+_RELATED_FIELDS = ("id", "type", "title", "description", "category", "imageUrl")
+
+# Index pencarian konten: diisi sekali saat startup, lalu di-update per dokumen
+content_index = SearchIndex()
+
+# Sinonim nama penyakit (Indonesia/Inggris) untuk ekspansi query fuzzy
+content_synonyms = SynonymMap(SINONIM_PENYAKIT)
+
+# Field teks konten yang diperiksa saat publikasi
+_CONTENT_TEXT_FIELDS = ("title", "description", "content", "category", "url", "imageUrl", "source", "publishedAt")
+
+# ID terbesar per type, untuk memberi ID konten baru bila penyimpanan
+# bersama nonaktif (selain itu ID diambil dari content_store)
+_max_ids = {content_type: 0 for content_type in VALID_TYPES}
+
+# Publikasi disimpan di SQLite bersama semua worker; setiap worker menerapkan
+# perubahan hingga versi _applied_version ke index miliknya
+content_store = ContentStore()
+_applied_version = 0
+_apply_lock = threading.Lock()
+
+# Kelas penyakit -> tuple (key konten, skor) terurut dari skor tertinggi.
+# Dibangun penuh saat startup, lalu diperbarui per dokumen saat publish/delete.
+related_index = {}
+_related_lock = threading.Lock()
+
+
+def load_content_index():
+    """
+    Muat data berita dan tips bawaan beserta konten yang sudah dipublikasikan
+    atau dihapus (dari content_store) ke index sebagai satu segmen awal
+    """
+    global _applied_version
+    entries = {
+        ("berita", news["id"]): {**news, "type": "berita"} for news in get_news_data()
+    }
+    entries.update({("tip", tip["id"]): {**tip, "type": "tip"} for tip in get_tips_data()})
+    for content_type, content_id in entries:
+        _max_ids[content_type] = max(_max_ids[content_type], content_id)
+
+    if content_store.enabled:
+        try:
+            content_store.open()
+            content_store.seed_ids(_max_ids)
+            for version, content_type, content_id, doc in content_store.changes_since(0):
+                if doc is None:
+                    entries.pop((content_type, content_id), None)
+                else:
+                    entries[(content_type, content_id)] = doc
+                _applied_version = version
+        except sqlite3.Error as e:
+            logger.error("Database konten %s tidak dapat dibuka, publikasi hanya di memori: %s", content_store.path, e)
+            content_store.close()
+            content_store.path = ""
+
+    content_index.bulk_load(entries.items())
+    refresh_related_index()
+
+
+def build_related_queries(groups=SINONIM_PENYAKIT):
+    """
+    Kata kunci konten terkait per kelas dari kelompok sinonim. Kata yang
+    dipakai beberapa kelas ('daun', 'bercak', 'hawar', 'virus', ...) diberi
+    bobot 1/jumlah kelas tersebut. Frasa pembeda adalah frasa yang memuat
+    minimal satu kata khas kelas itu; konten harus memuat salah satunya.
+    Mengembalikan dict kelas -> (bobot term, frasa pembeda, kata khas).
+    """
+    terms = {
+        kelas: {term for phrase in phrases for term in tokenize(phrase) if term not in _KATA_UMUM}
+        for kelas, phrases in groups.items()
+    }
+    usage = Counter(term for kelas_terms in terms.values() for term in kelas_terms)
+    queries = {}
+    for kelas, phrases in groups.items():
+        distinctive = {term for term in terms[kelas] if usage[term] == 1}
+        queries[kelas] = (
+            {term: 1.0 / usage[term] for term in terms[kelas]},
+            tuple(phrase for phrase in phrases if distinctive.intersection(tokenize(phrase))),
+            distinctive,
+        )
+    return queries
+
+
+_RELATED_QUERIES = build_related_queries()
+
+
+def _assign_related(scores, mentions_disease):
+    """
+    Pilih kelas untuk satu konten dari skor kelas yang memenuhi syarat:
+    kelas dengan skor di bawah RELATED_MIN_SHARE x skor terbaik dibuang
+    """
+    if mentions_disease:
+        scores.pop(_KELAS_SEHAT, None)
+    if not scores:
+        return {}
+    best = max(scores.values())
+    return {kelas: score for kelas, score in scores.items() if score >= RELATED_MIN_SHARE * best}
+
+
+def _rank(entries):
+    return tuple(sorted(entries, key=lambda item: (-item[1], item[0])))
+
+
+def build_related_index(snapshot, queries=None):
+    """
+    Skor setiap konten terhadap kata kunci tiap kelas penyakit dengan BM25,
+    ditambah bonus untuk frasa yang muncul utuh. Mengembalikan dict
+    kelas -> tuple (key, skor) terurut dari skor tertinggi.
+    """
+    queries = queries or _RELATED_QUERIES
+    per_key = {}
+    disease_keys = set()
+    for kelas, (weights, phrases, distinctive) in queries.items():
+        scores = snapshot.score(weights)
+        matched = set()
+        for phrase in phrases:
+            keys = snapshot.search_keys(phrase)
+            matched.update(keys)
+            if len(tokenize(phrase)) > 1:
+                for key in keys:
+                    scores[key] = scores.get(key, 0.0) + RELATED_PHRASE_BOOST
+        for key in matched:
+            per_key.setdefault(key, {})[kelas] = scores.get(key, 0.0)
+        if kelas != _KELAS_SEHAT:
+            disease_keys.update(snapshot.score(dict.fromkeys(distinctive, 1.0)))
+
+    table = {kelas: [] for kelas in queries}
+    for key, scores in per_key.items():
+        for kelas, score in _assign_related(scores, key in disease_keys).items():
+            table[kelas].append((key, round(score, 3)))
+    return {kelas: _rank(entries) for kelas, entries in table.items()}
+
+
+def related_scores_for(snapshot, key, queries=None):
+    """
+    Kelas -> skor konten terkait untuk satu dokumen, dengan aturan yang sama
+    seperti build_related_index tetapi tanpa memindai korpus
+    """
+    queries = queries or _RELATED_QUERIES
+    scores = {}
+    mentions_disease = False
+    for kelas, (weights, phrases, distinctive) in queries.items():
+        if kelas != _KELAS_SEHAT and snapshot.score_document(key, dict.fromkeys(distinctive, 1.0)):
+            mentions_disease = True
+        matched = [phrase for phrase in phrases if snapshot.contains(key, phrase)]
+        if matched:
+            scores[kelas] = snapshot.score_document(key, weights) + RELATED_PHRASE_BOOST * sum(
+                1 for phrase in matched if len(tokenize(phrase)) > 1
+            )
+    return _assign_related(scores, mentions_disease)
+
+
+def refresh_related_index():
+    """
+    Bangun ulang index konten terkait dari snapshot terbaru lalu ganti referensinya
+    """
+    global related_index
+    start = time.perf_counter()
+    table = build_related_index(content_index.snapshot())
+    with _related_lock:
+        related_index = table
+    metrics.observe("content.related_build", time.perf_counter() - start)
+
+
+def update_related_index(key):
+    """
+    Perbarui entri konten terkait untuk satu dokumen yang baru dipublish,
+    diubah, atau dihapus. Skor dokumen lain tidak dihitung ulang.
+    """
+    global related_index
+    start = time.perf_counter()
+    snapshot = content_index.snapshot()
+    scores = related_scores_for(snapshot, key) if snapshot.get(key) is not None else {}
+    with _related_lock:
+        table = dict(related_index)
+        for kelas, entries in related_index.items():
+            if kelas in scores or any(entry[0] == key for entry in entries):
+                kept = [entry for entry in entries if entry[0] != key]
+                if kelas in scores:
+                    kept.append((key, round(scores[kelas], 3)))
+                table[kelas] = _rank(kept)
+        related_index = table
+    metrics.observe("content.related_update", time.perf_counter() - start)
+
+
+def get_related_content(kelas, limit=RELATED_CONTENT_LIMIT):
+    """
+    Ringkasan konten terkait untuk satu kelas penyakit, diambil dari index
+    yang sudah dihitung sebelumnya (tanpa pencarian saat request)
+    """
+    snapshot = content_index.snapshot()
+    results = []
+    for key, score in related_index.get(kelas, ())[:limit]:
+        content = snapshot.get(key)
+        if content is None:
+            continue
+        summary = {field: content.get(field) for field in _RELATED_FIELDS}
+        summary["score"] = score
+        results.append(summary)
+    return results
+
+
+def validate_content_item(item):
+    """
+    Periksa tipe field item konten. ValueError bila tidak valid.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Item konten harus berupa objek JSON")
+    content_id = item.get("id")
+    if content_id is not None and (
+        isinstance(content_id, bool) or not isinstance(content_id, int) or content_id < 1
+    ):
+        raise ValueError("Field 'id' harus berupa bilangan bulat positif")
+    for field in _CONTENT_TEXT_FIELDS:
+        value = item.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"Field '{field}' harus berupa teks")
+
+
+def _apply_change(version, key, doc):
+    """
+    Terapkan satu perubahan ke index worker ini. Dipanggil dengan _apply_lock dipegang.
+    """
+    global _applied_version
+    if doc is None:
+        changed = content_index.delete(key)
+    else:
+        content_index.upsert(key, doc)
+        changed = True
+    if changed:
+        update_related_index(key)
+    # Perubahan worker lain yang lebih lama belum diterapkan: versi tetap,
+    # sinkronisasi berikutnya menerapkan semuanya berurutan
+    if version is not None and version == _applied_version + 1:
+        _applied_version = version
+    return changed
+
+
+def sync_published_content():
+    """
+    Terapkan konten yang dipublikasikan atau dihapus worker lain sejak
+    sinkronisasi terakhir. Mengembalikan jumlah perubahan yang diterapkan.
+    """
+    global _applied_version
+    if not content_store.enabled:
+        return 0
+    with _apply_lock:
+        changes = content_store.changes_since(_applied_version)
+        for version, content_type, content_id, doc in changes:
+            _apply_change(None, (content_type, content_id), doc)
+            _applied_version = version
+    if changes:
+        metrics.inc("content.synced", len(changes))
+    return len(changes)
+
+
+def publish_content(item, content_type):
+    """
+    Tambah atau update satu konten. Bila item tidak punya 'id', id baru
+    diberikan. Biaya sebanding ukuran dokumen, bukan ukuran korpus.
+    """
+    if content_type not in VALID_TYPES:
+        raise ValueError(f"Type tidak valid. Pilihan: {', '.join(VALID_TYPES)}")
+    validate_content_item(item)
+    item = {**item, "type": content_type}
+    with _apply_lock:
+        if content_store.enabled:
+            item, version = content_store.save(content_type, item)
+        else:
+            if item.get("id") is None:
+                item["id"] = _max_ids[content_type] + 1
+            _max_ids[content_type] = max(_max_ids[content_type], item["id"])
+            version = None
+        _apply_change(version, (content_type, item["id"]), item)
+    return item
+
+
+def delete_content(content_id, content_type):
+    """
+    Hapus satu konten berdasarkan ID dan type
+    """
+    # Konten mungkin baru dipublikasikan worker lain
+    sync_published_content()
+    key = (content_type, content_id)
+    with _apply_lock:
+        if content_index.snapshot().get(key) is None:
+            return False
+        version = content_store.delete(content_type, content_id) if content_store.enabled else None
+        return _apply_change(version, key, None)
+
+
+class ContentSync:
+    """
+    Task background yang menyusul publikasi dari worker lain secara berkala
+    """
+
+    def __init__(self, interval=CONTENT_SYNC_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if content_store.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(sync_published_content)
+            except sqlite3.Error as e:
+                logger.error("Sinkronisasi konten gagal: %s", e)
+
 
 def get_unified_content_data():
     """
-    Menggabungkan data berita dan tips menjadi satu unified content dengan field 'type'
+    Menggabungkan data berita dan tips menjadi satu unified content dengan field 'type',
+    diurutkan berdasarkan publishedAt (terbaru dulu)
     """
-    # Ambil data berita dan tambahkan field 'type'
-    news_data = get_news_data()
-    unified_news = []
-    for news in news_data:
-        unified_news.append({
-            **news,
-            "type": "berita"
-        })
-    
-    # Ambil data tips dan tambahkan field 'type'
-    tips_data = get_tips_data()
-    unified_tips = []
-    for tip in tips_data:
-        unified_tips.append({
-            **tip,
-            "type": "tip"
-        })
-    
-    # Gabungkan semua content dan urutkan berdasarkan publishedAt (terbaru dulu)
-    all_content = unified_news + unified_tips
-    
-    # Sort berdasarkan publishedAt descending (terbaru di atas)
-    try:
-        all_content.sort(key=lambda x: x.get("publishedAt", ""), reverse=True)
-    except:
-        # Jika ada error sorting, tetap return data tanpa sorting
-        pass
-    
-    return all_content
+    return content_index.snapshot().documents()
 
 def filter_content_by_type(content_type=None):
     """
@@ -65,58 +390,77 @@ def search_content(keyword):
     """
     Search content berdasarkan keyword di title, description, atau content
     """
-    all_content = get_unified_content_data()
-    keyword_lower = keyword.lower()
-    
-    filtered_content = [
-        content for content in all_content
-        if keyword_lower in content.get("title", "").lower() or
-           keyword_lower in content.get("description", "").lower() or
-           keyword_lower in content.get("content", "").lower()
-    ]
-    
-    return filtered_content
+    return content_index.snapshot().search(keyword)
 
 def get_content_by_id(content_id, content_type):
     """
     Ambil content berdasarkan ID dan type
     """
-    all_content = get_unified_content_data()
-    
-    # Filter by type first
-    type_filtered = [content for content in all_content if content["type"] == content_type]
-    
-    # Then find by ID
-    target_content = next((content for content in type_filtered if content["id"] == content_id), None)
-    return target_content
+    return content_index.snapshot().get((content_type, content_id))
+
+def summarize_facets(facet_counts):
+    """
+    Ubah jumlah per kombinasi (type, category) menjadi jumlah per type,
+    per kategori, dan per type x kategori
+    """
+    by_type = {content_type: 0 for content_type in VALID_TYPES}
+    by_category = {}
+    by_type_category = {content_type: {} for content_type in VALID_TYPES}
+    for (content_type, category), count in facet_counts.items():
+        by_type[content_type] = by_type.get(content_type, 0) + count
+        if category:
+            by_category[category] = by_category.get(category, 0) + count
+            by_type_category.setdefault(content_type, {})[category] = count
+    return {
+        "total": sum(facet_counts.values()),
+        "by_type": by_type,
+        "by_category": dict(sorted(by_category.items())),
+        "by_type_category": {
+            content_type: dict(sorted(categories.items()))
+            for content_type, categories in by_type_category.items()
+        },
+    }
+
+
+def get_content_facets(query=None, fuzzy=True):
+    """
+    Jumlah konten per type, kategori, dan type x kategori. Tanpa query,
+    jumlah diambil dari agregat yang diperbarui setiap konten berubah.
+    Dengan query, jumlah dihitung dari key hasil pencarian index (sama
+    dengan search_with_fallback) tanpa membaca dokumen.
+    Mengembalikan (facets, jenis_match).
+    """
+    snapshot = content_index.snapshot()
+    if not query:
+        return summarize_facets(snapshot.facet_counts), None
+    keys, match = rank_search_keys(snapshot, query, fuzzy)
+    return summarize_facets(snapshot.count_facets(keys)), match
+
 
 def get_content_statistics():
     """
     Ambil statistik content untuk debugging/monitoring
     """
-    all_content = get_unified_content_data()
-    
-    # Collect unique categories
-    categories = set()
-    for content in all_content:
-        if content.get("category"):
-            categories.add(content["category"])
-    
-    stats = {
-        "total_content": len(all_content),
-        "berita_count": len([c for c in all_content if c["type"] == "berita"]),
-        "tip_count": len([c for c in all_content if c["type"] == "tip"]),
-        "categories": sorted(list(categories))
+    facets, _ = get_content_facets()
+    return {
+        "total_content": facets["total"],
+        "berita_count": facets["by_type"]["berita"],
+        "tip_count": facets["by_type"]["tip"],
+        "categories": list(facets["by_category"]),
     }
-    
-    return stats
 
 def get_content_with_filters(content_type=None, category=None, search=None):
     """
     Filter content dengan kombinasi multiple filters
     """
-    all_content = get_unified_content_data()
-    
+    snapshot = content_index.snapshot()
+
+    # Filter by search keyword lewat index (kandidat dari posting trigram)
+    if search:
+        all_content = snapshot.search(search)
+    else:
+        all_content = snapshot.documents()
+
     # Filter by type
     if content_type:
         valid_types = ["berita", "tip"]
@@ -128,14 +472,58 @@ def get_content_with_filters(content_type=None, category=None, search=None):
     if category:
         all_content = [content for content in all_content if content.get("category", "").lower() == category.lower()]
     
-    # Filter by search keyword
-    if search:
-        search_lower = search.lower()
-        all_content = [
-            content for content in all_content
-            if search_lower in content.get("title", "").lower() or
-               search_lower in content.get("description", "").lower() or
-               search_lower in content.get("content", "").lower()
-        ]
-    
     return all_content
+
+
+def _apply_filters(contents, content_type=None, category=None):
+    if content_type:
+        contents = [content for content in contents if content["type"] == content_type.lower()]
+    if category:
+        contents = [content for content in contents if content.get("category", "").lower() == category.lower()]
+    return contents
+
+
+def rank_search_keys(snapshot, query, fuzzy=True):
+    """
+    Key hasil pencarian terurut relevansi. Semua kandidat (substring persis
+    dan, bila fuzzy aktif, hasil toleran salah ketik) diberi skor BM25
+    dengan perluasan sinonim; dokumen yang mengandung query persis selalu
+    didahulukan (boost), lalu skor, lalu publishedAt terbaru.
+    Mengembalikan (keys, jenis_match): "exact" bila ada hasil persis.
+    """
+    exact = snapshot.search_keys(query)
+    scores = dict(ranked_search(snapshot, query, content_synonyms, fuzzy))
+    candidates = set(exact)
+    if fuzzy:
+        candidates.update(scores)
+    keys = sorted(
+        candidates,
+        key=lambda key: (key in exact, scores.get(key, 0.0), snapshot.get(key).get("publishedAt", "")),
+        reverse=True,
+    )
+    return keys, "exact" if exact else "fuzzy"
+
+
+def search_content_ranked(query, content_type=None, category=None, limit=None, fuzzy=True):
+    """
+    Pencarian dengan sinonim penyakit, diurutkan berdasarkan relevansi.
+    Mengembalikan (hasil, jenis_match).
+    """
+    snapshot = content_index.snapshot()
+    keys, match = rank_search_keys(snapshot, query, fuzzy)
+    results = _apply_filters([snapshot.get(key) for key in keys], content_type, category)
+    return (results[:limit] if limit else results), match
+
+
+def search_with_fallback(query, content_type=None, category=None, fuzzy=True):
+    """
+    Pencarian untuk search bar: hasil persis dan (bila fuzzy aktif) hasil
+    toleran salah ketik diurutkan bersama berdasarkan relevansi, dengan
+    hasil persis di atas. Mengembalikan (hasil, jenis_match).
+    """
+    if content_type and content_type.lower() not in VALID_TYPES:
+        raise ValueError(f"Type tidak valid. Pilihan: {', '.join(VALID_TYPES)}")
+    return search_content_ranked(query, content_type, category, fuzzy=fuzzy)
+
+
+load_content_index()
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Lokasi database konten yang dipublikasikan lewat admin/ingestion. Kosongkan
+# untuk menyimpan publikasi hanya di memori worker (hilang saat restart).
+CONTENT_DB_PATH = os.getenv("CONTENT_DB_PATH", "data/content.db")
+# Interval worker menyusul perubahan konten yang ditulis worker lain (detik)
+CONTENT_SYNC_INTERVAL = float(os.getenv("CONTENT_SYNC_INTERVAL", 5))
+CONTENT_DB_BUSY_TIMEOUT = float(os.getenv("CONTENT_DB_BUSY_TIMEOUT", 5))
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS content (
+        type TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        doc TEXT,
+        PRIMARY KEY (type, id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_content_version ON content (version)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+)
+
+
+class ContentStore:
+    """
+    Konten yang dipublikasikan atau dihapus, disimpan di SQLite (mode WAL)
+    yang dipakai bersama semua worker. Setiap perubahan mendapat nomor versi
+    yang terus naik sehingga worker lain bisa menyusul perubahan sejak versi
+    terakhir yang sudah diterapkannya. Penghapusan disimpan sebagai baris
+    dengan doc NULL. ID konten baru diambil dari counter per type di
+    database, jadi tidak pernah bentrok antar worker.
+    """
+
+    def __init__(self, path=CONTENT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def open(self):
+        if not self.enabled or self._conn is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=CONTENT_DB_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _bump(conn, name, value=None):
+        # Naikkan counter (atau set ke value bila lebih besar) lalu kembalikan nilainya
+        (current,) = conn.execute("SELECT COALESCE(MAX(value), 0) FROM counters WHERE name = ?", (name,)).fetchone()
+        new = current + 1 if value is None else max(current, value)
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, new),
+        )
+        return new
+
+    def seed_ids(self, max_ids):
+        """
+        Pastikan counter ID per type tidak lebih kecil dari ID konten bawaan
+        """
+        with self._transaction() as conn:
+            for content_type, max_id in max_ids.items():
+                self._bump(conn, f"id:{content_type}", max_id)
+
+    def save(self, content_type, item):
+        """
+        Simpan konten. Bila item tidak punya 'id', ID baru diberikan.
+        Mengembalikan (item, versi).
+        """
+        with self._transaction() as conn:
+            if item.get("id") is None:
+                item = {**item, "id": self._bump(conn, f"id:{content_type}")}
+            else:
+                self._bump(conn, f"id:{content_type}", item["id"])
+            version = self._bump(conn, "version")
+            conn.execute(
+                "INSERT OR REPLACE INTO content (type, id, version, doc) VALUES (?, ?, ?, ?)",
+                (content_type, item["id"], version, json.dumps(item, ensure_ascii=False)),
+            )
+        return item, version
+
+    def delete(self, content_type, content_id):
+        """
+        Catat penghapusan konten (termasuk konten bawaan). Mengembalikan versi.
+        """
+        with self._transaction() as conn:
+            version = self._bump(conn, "version")
+            conn.execute(
+                "INSERT OR REPLACE INTO content (type, id, version, doc) VALUES (?, ?, ?, NULL)",
+                (content_type, content_id, version),
+            )
+        return version
+
+    def changes_since(self, version):
+        """
+        Perubahan dengan versi > version, terurut: list (versi, type, id, doc
+        atau None bila dihapus)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, type, id, doc FROM content WHERE version > ? ORDER BY version", (version,)
+            ).fetchall()
+        return [
+            (row_version, content_type, content_id, json.loads(doc) if doc is not None else None)
+            for row_version, content_type, content_id, doc in rows
+        ]
@@ -0,0 +1,213 @@
+import json
+import re
+
+
+# --- KAMUS INFORMASI PENYAKIT (Data Anda yang sudah sangat baik) ---
+INFORMASI_PENYAKIT = {
+    "Bacterial_spot": {
+        "nama_penyakit": "Bercak Bakteri (Bacterial Spot)",
+        "penyebab": "Bakteri genus Xanthomonas (X. vesicatoria, X. perforans, dll.).",
+        "gejala": "Bercak kecil, basah, berwarna gelap pada daun, batang, dan buah. Bercak pada daun seringkali memiliki lingkaran kuning di sekelilingnya. Penyakit ini tidak bisa disembuhkan.",
+        "solusi": "Gunakan benih dan bibit yang bebas penyakit. Lakukan rotasi tanaman 3–4 tahun. Pengendalian berfokus pada pencegahan. Semprotkan bakterisida berbasis tembaga atau kombinasi tembaga–mankozeb segera setelah tanam atau saat gejala pertama muncul. Aplikasikan kembali sesuai interval pada label produk.",
+    },
+    "Early_blight": {
+        "nama_penyakit": "Hawar Dini (Early Blight)",
+        "penyebab": "Jamur Alternaria solani (juga dikenal sebagai A. tomatophila atau A. linariae).",
+        "gejala": "Munculnya bercak cokelat kering berbentuk konsentris seperti 'papan target' pada daun, batang, dan buah. Biasanya dimulai dari daun-daun bagian bawah.",
+        "solusi": "Gunakan mulsa plastik untuk mencegah percikan spora dari tanah ke daun. Semprotkan fungisida kontak seperti klorotalonil, mankozeb, atau tembaga saat gejala pertama kali muncul, terutama saat cuaca lembap.",
+    },
+    "Healthy": {
+        "nama_penyakit": "Sehat (Healthy)",
+        "penyebab": "Tidak ada penyakit.",
+        "gejala": "-",
+        "solusi": "Pertahankan! Lanjutkan praktik perawatan yang baik seperti penyiraman teratur, pemupukan seimbang, dan pemantauan rutin untuk deteksi dini masalah.",
+    },
+    "Late_blight": {
+        "nama_penyakit": "Hawar Daun, Busuk Daun (Late Blight)",
+        "penyebab": "Oomycete (organisme mirip jamur) Phytophthora infestans.",
+        "gejala": "Bercak basah berwarna hijau gelap hingga keunguan pada daun yang menyebar dengan cepat. Seringkali terdapat lapisan jamur putih di bagian bawah daun. Pada buah, muncul bercak besar berwarna cokelat dan berkeropeng. Penyakit ini sangat destruktif pada suhu sejuk (15–24°C) dan kelembapan tinggi.",
+        "solusi": "Lakukan penyemprotan fungisida preventif sebelum gejala muncul, terutama saat musim hujan. Gunakan fungisida kontak seperti klorotalonil atau mankozeb, atau fungisida sistemik seperti kombinasi azoksistrobin+difenokonazol. ",
+    },
+    "Leaf_Mold": {
+        "nama_penyakit": "Kapang Daun (Leaf Mold)",
+        "penyebab": "Jamur Passalora fulva (sinonim Cladosporium fulvum).",
+        "gejala": "Umumnya terjadi di rumah kaca atau area dengan kelembapan tinggi. Gejala awal adalah bintik kuning pucat di permukaan atas daun, yang diikuti oleh lapisan jamur berwarna zaitun di bagian bawahnya. Daun yang terinfeksi parah akan menguning dan rontok.",
+        "solusi": "Tingkatkan sirkulasi udara dengan menjaga jarak tanam dan memangkas tunas air. Hindari membasahi daun dengan menggunakan irigasi tetes. Jika serangan parah, gunakan fungisida seperti klorotalonil atau azoksistrobin+difenokonazol.",
+    },
+    "Mosaic_virus": {
+        "nama_penyakit": "Virus Mosaic Tomat (Tomato Mosaic Virus)",
+        "penyebab": "Virus ToMV yang sangat mudah menular melalui kontak mekanis (tangan, alat potong) dan benih yang terinfeksi.",
+        "gejala": "Pola belang hijau muda dan hijau tua (mosaik) pada daun. Daun bisa tampak keriput, melepuh, atau berbentuk seperti benang. Tanaman menjadi kerdil dan buah bisa mengalami bercak internal.",
+        "solusi": "Tidak ada pengobatan yang efektif. Pencegahan terbaik adalah menggunakan benih bebas virus, mengendalikan kutu daun, dan menghindari kontak dengan tanaman terinfeksi. Pemangkasan dan penghancuran tanaman terinfeksi juga dianjurkan.",
+    },
+    "Septoria_leaf_spot": {
+        "nama_penyakit": "Bercak Daun Septoria (Septoria Leaf Spot)",
+        "penyebab": "Jamur Septoria lycopersici.",
+        "gejala": "Munculnya banyak bintik kecil (1-2 mm) berwarna cokelat dengan bagian tengah keabu-abuan dan pinggiran lebih gelap. Penyakit ini biasanya dimulai dari daun paling bawah dan merambat ke atas, menyebabkan daun rontok parah.",
+        "solusi": " Semprot secara berkala dengan fungisida kontak seperti tembaga, klorotalonil, atau mankozeb, terutama saat cuaca lembap.",
+    },
+    "Spider_mites": {
+        "nama_penyakit": "Hama Tungau (Spider Mites)",
+        "penyebab": "Tungau kecil (Tetranychus urticae) yang menghisap cairan dari daun.",
+        "gejala": "Daun menjadi kuning, berdebu, dan mungkin terdapat jaring laba-laba halus di bawah daun. Serangan berat dapat menyebabkan daun mengering dan rontok.",
+        "solusi": "Gunakan insektisida berbasis minyak neem atau insektisida sistemik. Jaga kelembapan udara yang cukup untuk mengurangi populasi tungau. Pemangkasan daun yang terinfeksi juga dapat membantu mengendalikan penyebaran.",
+    },
+    "Target_Spot": {
+        "nama_penyakit": "Bercak Target (Target Spot)",
+        "penyebab": "Jamur Corynespora cassiicola.",
+        "gejala": "Bercak cokelat dengan tepi kuning yang berkembang menjadi bercak besar dengan pola konsentris. Biasanya dimulai dari daun bawah dan menyebar ke atas.",
+        "solusi": "Gunakan fungisida kontak seperti klorotalonil atau mankozeb. Rotasi tanaman dan menjaga jarak tanam yang baik untuk meningkatkan sirkulasi udara juga penting.",
+    },
+    "YellowLeaf__Curl_Virus": {
+        "nama_penyakit": "Keriting Daun Kuning (Yellow Leaf Curl Virus)",
+        "penyebab": "Disebabkan oleh Tomato Yellow Leaf Curl Virus (TYLCV), ditularkan oleh serangga kutu kebul (whitefly).",
+        "gejala": "Daun baru menjadi kerdil, menguning, dan melengkung ke atas (keriting). Pertumbuhan tanaman terhambat parah dan produksi buah menurun drastis.",
+        "solusi": "Tidak ada obat. Fokus pada pengendalian vektornya, yaitu kutu kebul, menggunakan insektisida atau perangkap lengket. Gunakan varietas yang tahan virus.",
+    },
+}
+
+NAMA_KELAS = list(INFORMASI_PENYAKIT.keys())
+
+# Sinonim tambahan per kelas (nama lokal, patogen, singkatan) untuk pencarian konten
+SINONIM_TAMBAHAN = {
+    "Bacterial_spot": ["bercak bakteri", "xanthomonas"],
+    "Early_blight": ["hawar dini", "alternaria", "bercak kering"],
+    "Healthy": ["sehat", "tanaman sehat"],
+    "Late_blight": ["hawar daun", "busuk daun", "phytophthora"],
+    "Leaf_Mold": ["kapang daun", "jamur daun", "cladosporium", "passalora"],
+    "Mosaic_virus": ["mosaik", "virus mosaik", "tomv", "tmv"],
+    "Septoria_leaf_spot": ["septoria", "bercak daun"],
+    "Spider_mites": ["tungau", "tungau merah", "spider mite", "tetranychus"],
+    "Target_Spot": ["bercak target", "corynespora"],
+    "YellowLeaf__Curl_Virus": ["keriting daun", "daun keriting", "tylcv", "kutu kebul"],
+}
+
+# Respons untuk prediksi dengan confidence di bawah ambang batas
+INFORMASI_TIDAK_DIKENALI = {
+    "nama_penyakit": "Gambar Tidak Dapat Diidentifikasi",
+    "gejala": ["Model tidak cukup yakin untuk membuat diagnosis."],
+    "penyebab": "Ini bisa terjadi jika gambar buram, pencahayaan kurang, atau objek bukan daun tomat.",
+    "solusi": [
+        "Silakan coba ambil foto ulang. Pastikan fokus pada daun yang bergejala dengan pencahayaan yang baik."
+    ],
+}
+
+
+def to_list(text):
+    """
+    Pecah teks paragraf menjadi list kalimat
+    """
+    if isinstance(text, list):
+        return text
+    return [t.strip() for t in text.replace("\n", ". ").split(". ") if t.strip()]
+
+
+def build_synonym_groups():
+    """
+    Kelompok frasa sinonim per kelas: nama Indonesia dan Inggris dari
+    'nama_penyakit', nama kelas internal, dan SINONIM_TAMBAHAN
+    """
+    groups = {}
+    for kelas, informasi in INFORMASI_PENYAKIT.items():
+        variants = {re.sub(r"[_\s]+", " ", kelas).strip().lower()}
+        # "Hawar Daun, Busuk Daun (Late Blight)" -> "hawar daun", "busuk daun", "late blight"
+        for part in re.split(r"[(),]", informasi["nama_penyakit"]):
+            if part.strip():
+                variants.add(part.strip().lower())
+        variants.update(SINONIM_TAMBAHAN.get(kelas, []))
+        groups[kelas] = sorted(variants)
+    return groups
+
+
+SINONIM_PENYAKIT = build_synonym_groups()
+
+
+def _dumps(value):
+    # Format yang sama dengan JSONResponse milik FastAPI/Starlette
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _fragment(fields):
+    # Serialisasi dict tanpa kurung kurawal, siap disambung ke objek lain
+    return _dumps(fields)[1:-1].encode("utf-8")
+
+
+def build_response_table():
+    """
+    Bangun tabel respons per kelas sekali saat startup. Setiap entri berisi
+    list gejala/solusi yang sudah dipecah dan fragmen JSON yang sudah
+    diserialisasi, sehingga respons /predict tinggal menyambung field dinamis.
+    """
+    table = {}
+    for kelas, informasi in INFORMASI_PENYAKIT.items():
+        gejala = to_list(informasi["gejala"])
+        solusi = to_list(informasi["solusi"])
+        table[kelas] = {
+            "gejala": gejala,
+            "solusi": solusi,
+            "head": _fragment(
+                {"disease_id": kelas, "nama_penyakit": informasi["nama_penyakit"]}
+            ),
+            "tail": _fragment(
+                {
+                    "gejala": gejala,
+                    "penyebab": informasi["penyebab"],
+                    "solusi": solusi,
+                }
+            ),
+        }
+
+    table[None] = {
+        "gejala": INFORMASI_TIDAK_DIKENALI["gejala"],
+        "solusi": INFORMASI_TIDAK_DIKENALI["solusi"],
+        "head": _fragment(
+            {
+                "disease_id": None,
+                "nama_penyakit": INFORMASI_TIDAK_DIKENALI["nama_penyakit"],
+            }
+        ),
+        "tail": _fragment(
+            {
+                "gejala": INFORMASI_TIDAK_DIKENALI["gejala"],
+                "penyebab": INFORMASI_TIDAK_DIKENALI["penyebab"],
+                "solusi": INFORMASI_TIDAK_DIKENALI["solusi"],
+            }
+        ),
+    }
+    return table
+
+
+RESPONSE_PENYAKIT = build_response_table()
+
+
+def render_prediction(kelas, predict_id, timestamp, model_version, confidence, extra=None):
+    """
+    Susun body JSON respons /predict dari fragmen yang sudah di-cache.
+    kelas=None menghasilkan respons 'unrecognized'. Field tambahan (opsional)
+    pada 'extra' ikut diserialisasi ke dalam objek 'data'.
+    """
+    entry = RESPONSE_PENYAKIT[kelas]
+    status = "success" if kelas is not None else "unrecognized"
+    parts = [
+        b'{"status":"',
+        status.encode(),
+        b'","predict_id":"',
+        predict_id.encode(),
+        b'","timestamp":"',
+        timestamp.encode(),
+        b'","model_version":',
+        _dumps(model_version).encode("utf-8"),
+        b',"data":{',
+        entry["head"],
+        b',"confidence":',
+        _dumps(confidence).encode(),
+        b',"confidence_str":"',
+        f"{confidence:.2%}".encode(),
+        b'",',
+        entry["tail"],
+    ]
+    if extra:
+        parts.append(b",")
+        parts.append(_fragment(extra))
+    parts.append(b"}}")
+    return b"".join(parts)
@@ -0,0 +1,383 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics_service as metrics
+
+logger = logging.getLogger(__name__)
+
+# Lokasi index embedding. Kosongkan untuk menonaktifkan penyimpanan embedding.
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR", "data/embeddings")
+# Jumlah cluster IVF, jumlah cluster yang diperiksa per query, dan jumlah
+# vektor minimal sebelum cluster dilatih (sebelum itu pencarian brute force)
+EMBEDDING_NLIST = int(os.getenv("EMBEDDING_NLIST", 1024))
+EMBEDDING_NPROBE = int(os.getenv("EMBEDDING_NPROBE", 16))
+EMBEDDING_TRAIN_SIZE = int(os.getenv("EMBEDDING_TRAIN_SIZE", 50000))
+
+_INITIAL_CAPACITY = 4096
+_SCAN_CHUNK = 65536
+_KMEANS_ITERATIONS = 10
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """
+    Index nearest-neighbour (cosine) untuk embedding gambar yang sudah
+    didiagnosis. Vektor disimpan ternormalisasi di matriks float16 yang
+    di-memory-map, sehingga index bisa lebih besar dari RAM dan bertahan
+    setelah restart. Setelah cukup data, vektor dikelompokkan dengan
+    k-means (IVF) dan query hanya memeriksa beberapa cluster terdekat.
+
+    File pada direktori index:
+    - vectors.f16  : matriks (capacity, dim) float16
+    - labels.i16   : indeks kelas per baris (-1 untuk 'unrecognized')
+    - assign.i32   : cluster IVF per baris (-1 sebelum dilatih)
+    - ids.txt      : predict_id per baris; jumlah baris = jumlah vektor
+    - centroids.npy, meta.json
+    - index.lock, train.lock : kunci fcntl antar proses
+
+    Semua worker gunicorn berbagi direktori yang sama. Penambahan vektor
+    dikunci dengan fcntl.lockf pada index.lock dan selalu menyinkronkan
+    dulu baris yang ditulis proses lain, sehingga baris dan ids.txt tidak
+    pernah saling menimpa. Pembacaan menyusul baris baru dari ids.txt
+    (dan centroid baru) tanpa mengambil kunci file.
+    """
+
+    def __init__(
+        self,
+        directory=EMBEDDING_INDEX_DIR,
+        nlist=EMBEDDING_NLIST,
+        nprobe=EMBEDDING_NPROBE,
+        train_size=EMBEDDING_TRAIN_SIZE,
+    ):
+        self.directory = directory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._labels = None
+        self._assign = None
+        self._centroids = None
+        self._ids = []
+        self._rows = {}
+        self._ids_offset = 0
+        self._centroids_mtime = None
+        self._lock_fd = None
+        self._training = False
+        if self.enabled:
+            with self._lock:
+                self._sync()
+            if self.count:
+                logger.info("Index embedding dimuat: %s vektor, dim=%s", self.count, self.dim)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Kunci tulis antar proses (dan antar thread di proses ini)
+        """
+        with self._lock:
+            if self._lock_fd is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._lock_fd = os.open(self._path("index.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """
+        Susul perubahan yang ditulis proses lain: kapasitas baru, baris baru
+        di ids.txt, dan centroid hasil training. Dipanggil dengan _lock dipegang.
+        """
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if self.dim is None or meta["capacity"] > self.capacity:
+            self.dim = meta["dim"]
+            self.capacity = meta["capacity"]
+            self._vectors = self._labels = self._assign = None
+            self._open_arrays()
+
+        # ids.txt ditulis terakhir saat insert, jadi setiap baris lengkap di
+        # dalamnya menandai vektor yang pasti sudah tertulis
+        with open(self._path("ids.txt"), "rb") as f:
+            f.seek(self._ids_offset)
+            data = f.read()
+        consumed = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n") or self.count >= self.capacity:
+                break
+            consumed += len(line)
+            predict_id = line.decode("utf-8").strip()
+            self._rows[predict_id] = self.count
+            self._ids.append(predict_id)
+            self.count += 1
+        self._ids_offset += consumed
+
+        centroids_path = self._path("centroids.npy")
+        try:
+            mtime = os.stat(centroids_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._centroids_mtime:
+            self._centroids = np.load(centroids_path)
+            self._centroids_mtime = mtime
+
+    def refresh(self):
+        if self.enabled:
+            with self._lock:
+                self._sync()
+
+    def _open_arrays(self):
+        specs = (
+            ("_vectors", "vectors.f16", np.float16, (self.capacity, self.dim)),
+            ("_labels", "labels.i16", np.int16, (self.capacity,)),
+            ("_assign", "assign.i32", np.int32, (self.capacity,)),
+        )
+        for attr, name, dtype, shape in specs:
+            path = self._path(name)
+            mode = "r+" if os.path.exists(path) else "w+"
+            setattr(self, attr, np.memmap(path, dtype=dtype, mode=mode, shape=shape))
+
+    def _write_meta(self):
+        # Ditulis atomik agar proses lain tidak membaca meta.json setengah jadi
+        temp_path = self._path(f"meta.json.{os.getpid()}")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity}, f)
+        os.replace(temp_path, self._path("meta.json"))
+
+    def _create(self, dim):
+        os.makedirs(self.directory, exist_ok=True)
+        self.dim = dim
+        self.capacity = _INITIAL_CAPACITY
+        self._open_arrays()
+        self._assign[:] = -1
+        open(self._path("ids.txt"), "w").close()
+        self._ids_offset = 0
+        self._write_meta()
+
+    def _grow(self):
+        # Perbesar file secara in-place lalu buka ulang memmap dengan kapasitas baru
+        new_capacity = self.capacity * 2
+        for array in (self._vectors, self._labels, self._assign):
+            array.flush()
+        self._vectors = self._labels = self._assign = None
+        for name, itemsize in (
+            ("vectors.f16", 2 * self.dim),
+            ("labels.i16", 2),
+            ("assign.i32", 4),
+        ):
+            os.truncate(self._path(name), new_capacity * itemsize)
+        old_capacity = self.capacity
+        self.capacity = new_capacity
+        self._open_arrays()
+        self._assign[old_capacity:] = -1
+        self._write_meta()
+
+    def add(self, predict_id, vector, label):
+        """
+        Tambahkan satu embedding. Biaya O(dim) (plus O(nlist * dim) bila IVF
+        sudah dilatih), tanpa membangun ulang index.
+        """
+        vector = _normalize(np.asarray(vector, dtype=np.float32).ravel())
+        with self._file_lock():
+            self._sync()
+            if predict_id in self._rows:
+                return False
+            if self.dim is None:
+                self._create(len(vector))
+            if len(vector) != self.dim:
+                raise ValueError(
+                    f"Dimensi embedding {len(vector)} tidak cocok dengan index ({self.dim})"
+                )
+            if self.count == self.capacity:
+                self._grow()
+
+            row = self.count
+            self._vectors[row] = vector
+            self._labels[row] = label
+            if self.trained:
+                self._assign[row] = int(np.argmax(self._centroids @ vector))
+            line = (predict_id + "\n").encode("utf-8")
+            with open(self._path("ids.txt"), "ab") as f:
+                f.write(line)
+            self._ids.append(predict_id)
+            self._rows[predict_id] = row
+            self._ids_offset += len(line)
+            self.count += 1
+            metrics.set_gauge("embedding_index.size", self.count)
+
+            if not self.trained and self.count >= self.train_size and not self._training:
+                # Training bisa memakan waktu lama; jangan tahan kunci index selama itu
+                self._training = True
+                threading.Thread(target=self._train_in_background, name="embedding-train", daemon=True).start()
+        return True
+
+    def vector_of(self, predict_id):
+        """
+        Vektor tersimpan untuk satu prediksi, atau None. Bila tidak ada di
+        proses ini, baris yang ditambahkan worker lain disusul dulu.
+        """
+        with self._lock:
+            row = self._rows.get(predict_id)
+            if row is None and self.enabled:
+                self._sync()
+                row = self._rows.get(predict_id)
+            if row is None:
+                return None
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error("Training index embedding gagal: %s", e)
+        finally:
+            self._training = False
+
+    def train(self):
+        """
+        Latih centroid IVF dengan spherical k-means pada salinan sampel
+        vektor, lalu tetapkan cluster untuk semua vektor yang sudah tersimpan.
+        Perhitungan berjalan tanpa kunci; hanya penukaran hasil yang dikunci.
+        Hanya satu proses yang melatih pada satu waktu (train.lock).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        train_fd = os.open(self._path("train.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.lockf(train_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                logger.info("Index embedding sedang dilatih proses lain")
+                return
+            self.refresh()
+            if self.trained:
+                return
+            self._train()
+        finally:
+            os.close(train_fd)
+
+    def _train(self):
+        start = time.perf_counter()
+        with self._lock:
+            count = self.count
+            vectors = self._vectors
+        nlist = min(self.nlist, count)
+        rng = np.random.default_rng(0)
+        sample_size = min(count, nlist * 64)
+        sample_rows = np.sort(rng.choice(count, sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)]
+        for _ in range(_KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assign = np.empty(count, dtype=np.int32)
+        for begin in range(0, count, _SCAN_CHUNK):
+            end = min(begin + _SCAN_CHUNK, count)
+            block = np.asarray(vectors[begin:end], dtype=np.float32)
+            assign[begin:end] = np.argmax(block @ centroids.T, axis=1)
+
+        with self._file_lock():
+            # Vektor yang masuk selama training ditetapkan di sini
+            self._sync()
+            self._assign[:count] = assign
+            for begin in range(count, self.count, _SCAN_CHUNK):
+                end = min(begin + _SCAN_CHUNK, self.count)
+                block = np.asarray(self._vectors[begin:end], dtype=np.float32)
+                self._assign[begin:end] = np.argmax(block @ centroids.T, axis=1)
+            self._assign.flush()
+            temp_path = self._path(f"centroids.{os.getpid()}.npy")
+            np.save(temp_path, centroids)
+            os.replace(temp_path, self._path("centroids.npy"))
+            self._centroids = centroids
+            self._centroids_mtime = os.stat(self._path("centroids.npy")).st_mtime_ns
+        metrics.observe("embedding_index.train", time.perf_counter() - start)
+        logger.info("Index embedding dilatih: %s cluster untuk %s vektor", nlist, count)
+
+    def search(self, vector, k=5, exclude=None):
+        """
+        Cari k embedding paling mirip (cosine similarity). Mengembalikan list
+        tuple (predict_id, label, score) terurut dari yang paling mirip.
+        """
+        self.refresh()
+        if self.dim is None or self.count == 0:
+            return []
+        start = time.perf_counter()
+        query = _normalize(np.asarray(vector, dtype=np.float32).ravel())
+
+        with self._lock:
+            count = self.count
+            ids = self._ids
+            vectors, labels, assign = self._vectors, self._labels, self._assign
+            centroids = self._centroids
+
+        if centroids is not None:
+            nprobe = min(self.nprobe, len(centroids))
+            probes = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.flatnonzero(np.isin(assign[:count], probes))
+        else:
+            rows = None
+
+        wanted = k + (1 if exclude is not None else 0)
+        total = count if rows is None else len(rows)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for begin in range(0, total, _SCAN_CHUNK):
+            if rows is None:
+                block_rows = np.arange(begin, min(begin + _SCAN_CHUNK, total))
+                block = vectors[begin : begin + len(block_rows)]
+            else:
+                block_rows = rows[begin : begin + _SCAN_CHUNK]
+                block = vectors[block_rows]
+            scores = np.asarray(block, dtype=np.float32) @ query
+            if len(scores) > wanted:
+                top = np.argpartition(-scores, wanted - 1)[:wanted]
+                block_rows, scores = block_rows[top], scores[top]
+            best_rows = np.concatenate([best_rows, block_rows])
+            best_scores = np.concatenate([best_scores, scores])
+
+        order = np.argsort(-best_scores)
+        results = []
+        for i in order:
+            predict_id = ids[best_rows[i]]
+            if predict_id == exclude:
+                continue
+            results.append((predict_id, int(labels[best_rows[i]]), float(best_scores[i])))
+            if len(results) == k:
+                break
+        metrics.observe("embedding_index.search", time.perf_counter() - start)
+        return results
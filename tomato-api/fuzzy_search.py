@@ -0,0 +1,113 @@
+import time
+
+import metrics_service as metrics
+from search_index import deletes, max_edits_for, tokenize
+
+# Bobot term hasil ekspansi sinonim relatif terhadap term dari query
+SYNONYM_WEIGHT = 0.5
+
+
+def levenshtein(a, b, max_distance):
+    """
+    Jarak Levenshtein dengan batas: berhenti lebih awal dan mengembalikan
+    max_distance + 1 bila jarak pasti melebihi batas
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def correct_term(snapshot, token):
+    """
+    Cari term kosakata dalam jarak edit yang diizinkan dari token memakai
+    index penghapusan (SymSpell). Mengembalikan dict term -> jarak.
+    """
+    max_distance = max_edits_for(token)
+    candidates = set()
+    for variant in deletes(token, max_distance):
+        candidates |= snapshot.vocabulary_candidates(variant)
+    matches = {}
+    for term in candidates:
+        distance = levenshtein(token, term, max_distance)
+        if distance <= max_distance:
+            matches[term] = distance
+    return matches
+
+
+class SynonymMap:
+    """
+    Peta frasa sinonim. Setiap frasa (urutan token) menunjuk ke kelompoknya,
+    dan query yang mengandung frasa tersebut diperluas dengan frasa lain
+    di kelompok yang sama.
+    """
+
+    def __init__(self, groups):
+        self.groups = {name: [tuple(tokenize(phrase)) for phrase in phrases] for name, phrases in groups.items()}
+        self._phrases = {}
+        for name, phrases in self.groups.items():
+            for phrase in phrases:
+                if phrase:
+                    self._phrases.setdefault(phrase, set()).add(name)
+        self._max_length = max((len(phrase) for phrase in self._phrases), default=0)
+
+    def matching_groups(self, tokens):
+        """
+        Nama kelompok yang frasanya muncul berurutan di dalam token query
+        """
+        found = set()
+        for start in range(len(tokens)):
+            for length in range(1, self._max_length + 1):
+                phrase = tuple(tokens[start : start + length])
+                if len(phrase) < length:
+                    break
+                found |= self._phrases.get(phrase, set())
+        return found
+
+    def expansion_terms(self, tokens):
+        terms = set()
+        for name in self.matching_groups(tokens):
+            for phrase in self.groups[name]:
+                terms.update(phrase)
+        return terms
+
+
+def ranked_search(snapshot, query, synonyms=None, fuzzy=True):
+    """
+    Pencarian toleran salah ketik dengan ranking BM25. Setiap token query
+    dicocokkan ke kosakata dalam jarak edit terbatas (bobot turun sesuai
+    jarak; hanya jarak 0 bila fuzzy=False), lalu diperluas dengan sinonim.
+    Mengembalikan list (key, skor) terurut dari skor tertinggi.
+    """
+    start = time.perf_counter()
+    weighted = {}
+    corrected = []
+    for token in tokenize(query):
+        matches = correct_term(snapshot, token)
+        if not fuzzy:
+            matches = {term: distance for term, distance in matches.items() if distance == 0}
+        corrected.append(min(matches, key=matches.get) if matches else token)
+        for term, distance in matches.items():
+            weighted[term] = max(weighted.get(term, 0.0), 1.0 / (1 + distance))
+
+    if synonyms is not None:
+        for term in synonyms.expansion_terms(corrected):
+            weighted.setdefault(term, SYNONYM_WEIGHT)
+
+    scores = snapshot.score(weighted)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    metrics.observe("content.fuzzy_search", time.perf_counter() - start)
+    return ranked
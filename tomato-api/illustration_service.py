@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import time
+from typing import NamedTuple
+
+import metrics_service as metrics
+from disease_service import INFORMASI_PENYAKIT
+from thumbnail_service import THUMB_FORMATS, render_variants, snap_width
+
+logger = logging.getLogger(__name__)
+
+# Gambar referensi per kelas: <ASSET_DIR>/<kelas>.(jpg|jpeg|png|webp)
+ASSET_DIR = os.getenv("ASSET_DIR", "assets/ilustrasi")
+# Direktori hasil resize yang disajikan dengan sendfile
+ILLUSTRATION_DIR = os.getenv("ILLUSTRATION_DIR", "data/ilustrasi")
+ILLUSTRATION_WIDTHS = tuple(
+    sorted(int(width) for width in os.getenv("ILLUSTRATION_WIDTHS", "240,480,960").split(","))
+)
+# Lebar default bila klien tidak memberi petunjuk lebar
+ILLUSTRATION_DEFAULT_WIDTH = int(os.getenv("ILLUSTRATION_DEFAULT_WIDTH", 480))
+# Prefix URL publik untuk image_url di respons prediksi (mis. https://api.appku.com).
+# Bila kosong, dipakai base URL request yang sedang dilayani.
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+# URL cadangan untuk kelas tanpa gambar referensi; aplikasi mengharapkan
+# image_url selalu terisi
+ILLUSTRATION_FALLBACK_URL = os.getenv(
+    "ILLUSTRATION_FALLBACK_URL", "https://appku.com/ilustrasi/{kelas}.jpg"
+)
+
+_ASSET_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class Illustration(NamedTuple):
+    """Satu variant ilustrasi yang sudah dihitung saat startup"""
+
+    kelas: str
+    width: int
+    format: str
+    media_type: str
+    etag: str
+    path: str
+
+
+def choose_format(accept):
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
+class IllustrationStore:
+    """
+    Ilustrasi penyakit yang di-resize ke beberapa lebar dan format sekali
+    saat startup. ETag disimpan di memori; file hasil resize ditulis ke
+    ILLUSTRATION_DIR agar bisa dikirim dengan FileResponse.
+    """
+
+    def __init__(self, asset_dir=ASSET_DIR, output_dir=ILLUSTRATION_DIR, widths=ILLUSTRATION_WIDTHS):
+        self.asset_dir = asset_dir
+        self.output_dir = output_dir
+        self.widths = widths
+        self._variants = {}
+
+    def _source_path(self, kelas):
+        for extension in _ASSET_EXTENSIONS:
+            path = os.path.join(self.asset_dir, kelas + extension)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def load(self):
+        """
+        Hitung semua variant untuk setiap kelas yang memiliki gambar referensi.
+        Bila direktori aset belum berisi gambar sama sekali, semua kelas
+        memakai ILLUSTRATION_FALLBACK_URL (URL ilustrasi lama).
+        """
+        start = time.perf_counter()
+        variants = {}
+        sources = {kelas: self._source_path(kelas) for kelas in INFORMASI_PENYAKIT}
+        if not any(sources.values()):
+            # Gambar referensi belum disediakan: image_url tetap memakai URL lama
+            self._variants = {}
+            metrics.set_gauge("illustration.variants", 0)
+            logger.info(
+                "Belum ada gambar referensi di %s, image_url memakai %s",
+                self.asset_dir, ILLUSTRATION_FALLBACK_URL,
+            )
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for kelas, source in sources.items():
+            if source is None:
+                logger.warning("Ilustrasi untuk %s tidak ditemukan di %s", kelas, self.asset_dir)
+                continue
+            try:
+                with open(source, "rb") as f:
+                    rendered = render_variants(f.read(), self.widths)
+            except (OSError, ValueError) as e:
+                logger.warning("Ilustrasi %s gagal diproses: %s", source, e)
+                continue
+            for (width, name), data in rendered.items():
+                path = os.path.join(self.output_dir, f"{kelas}-{width}.{name}")
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+                variants[(kelas, width, name)] = Illustration(
+                    kelas,
+                    width,
+                    name,
+                    THUMB_FORMATS[name][1],
+                    '"' + hashlib.sha256(data).hexdigest()[:32] + '"',
+                    path,
+                )
+        self._variants = variants
+        metrics.set_gauge("illustration.variants", len(variants))
+        metrics.observe("illustration.load", time.perf_counter() - start)
+        logger.info("%s variant ilustrasi siap dari %s", len(variants), self.asset_dir)
+
+    def select(self, kelas, width=None, accept=None, format=None):
+        """
+        Pilih variant untuk kelas berdasarkan lebar yang diminta (dibulatkan
+        ke atas) dan format (eksplisit atau dari header Accept)
+        """
+        width = snap_width(width or ILLUSTRATION_DEFAULT_WIDTH, self.widths)
+        return self._variants.get((kelas, width, format or choose_format(accept)))
+
+    def url_for(self, kelas, width=None, accept=None, base_url=None):
+        """
+        URL absolut variant yang cocok untuk klien. Parameter v (potongan ETag)
+        membuat URL berubah saat gambar berubah. Kelas tanpa ilustrasi, atau
+        bila base URL tidak diketahui, memakai ILLUSTRATION_FALLBACK_URL.
+        """
+        illustration = self.select(kelas, width, accept)
+        base_url = PUBLIC_BASE_URL or (base_url or "").rstrip("/")
+        if illustration is None or not base_url:
+            return ILLUSTRATION_FALLBACK_URL.format(kelas=kelas)
+        return (
+            f"{base_url}/ilustrasi/{kelas}"
+            f"?w={illustration.width}&format={illustration.format}&v={illustration.etag[1:9]}"
+        )
@@ -0,0 +1,311 @@
+import io
+import os
+import time
+from typing import NamedTuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image, UnidentifiedImageError
+
+import metrics_service as metrics
+from leaf_roi import excess_green_mask
+
+try:
+    import zstandard
+except ImportError:  # kompresi zstd untuk upload tensor mentah bersifat opsional
+    zstandard = None
+
+# Ukuran input yang diharapkan model klasifikasi
+UKURAN_INPUT_MODEL = (224, 224)
+
+# Batas jumlah piksel (lebar x tinggi) yang boleh di-decode per request.
+# File 2MB bisa saja mendeklarasikan dimensi sangat besar (decompression bomb).
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))
+
+# Ukuran antara untuk test-time augmentation: view 224x224 dipotong dari sini
+UKURAN_TTA = (256, 256)
+
+# Mode tiling: gambar dipecah menjadi grid tile 224x224 yang saling tumpang
+# tindih. Tile dengan porsi daun di bawah TILE_MIN_LEAF tidak diklasifikasi.
+TILE_GRID = int(os.getenv("TILE_GRID", 3))
+TILE_MAX_GRID = int(os.getenv("TILE_MAX_GRID", 4))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", 0.25))
+TILE_MIN_LEAF = float(os.getenv("TILE_MIN_LEAF", 0.15))
+
+# Upload tensor mentah: bytes uint8 berurutan HWC (224x224x3, RGB), opsional
+# dikompres zstd. Klien yang sudah me-resize sendiri melewati decode gambar.
+RAW_TENSOR_TYPE = "application/x-uint8-tensor"
+RAW_TENSOR_ZSTD_TYPE = RAW_TENSOR_TYPE + "+zstd"
+RAW_TENSOR_SHAPE = (UKURAN_INPUT_MODEL[1], UKURAN_INPUT_MODEL[0], 3)
+RAW_TENSOR_SIZE = RAW_TENSOR_SHAPE[0] * RAW_TENSOR_SHAPE[1] * RAW_TENSOR_SHAPE[2]
+
+# Samakan batas bawaan Pillow dengan budget kita, supaya pengecekan di
+# Image.open() (DecompressionBombError) konsisten dengan konfigurasi API.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class ImageProbe(NamedTuple):
+    """Informasi header gambar yang dibaca tanpa decode piksel"""
+
+    format: str
+    width: int
+    height: int
+    mode: str
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+
+class ImageRejectedError(ValueError):
+    """Gambar ditolak sebelum decode (bukan gambar atau header rusak)"""
+
+
+class ImageTooLargeError(ImageRejectedError):
+    """Dimensi gambar melebihi budget piksel MAX_IMAGE_PIXELS"""
+
+
+def probe_image(image_bytes: bytes):
+    """
+    Baca header gambar saja (format, dimensi, mode) tanpa decode piksel.
+    Mengembalikan tuple (probe, image) dengan image yang masih lazy.
+    """
+    start = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        probe = ImageProbe(image.format, image.width, image.height, image.mode)
+    except Image.DecompressionBombError as e:
+        metrics.observe("image.reject", time.perf_counter() - start)
+        metrics.inc("image.rejected.pixel_budget")
+        raise ImageTooLargeError(
+            f"Dimensi gambar melebihi batas {MAX_IMAGE_PIXELS} piksel."
+        ) from e
+    except (UnidentifiedImageError, OSError) as e:
+        metrics.observe("image.reject", time.perf_counter() - start)
+        metrics.inc("image.rejected.invalid")
+        raise ImageRejectedError("File bukan gambar yang valid.") from e
+
+    if probe.pixels > MAX_IMAGE_PIXELS:
+        metrics.observe("image.reject", time.perf_counter() - start)
+        metrics.inc("image.rejected.pixel_budget")
+        raise ImageTooLargeError(
+            f"Dimensi gambar {probe.width}x{probe.height} melebihi batas "
+            f"{MAX_IMAGE_PIXELS} piksel."
+        )
+
+    metrics.observe("image.probe", time.perf_counter() - start)
+    return probe, image
+
+
+def decode_image(image: Image.Image, probe: ImageProbe, target=UKURAN_INPUT_MODEL):
+    """
+    Decode gambar ke RGB dengan strategi yang membatasi puncak memori:
+    - JPEG: draft mode (skala DCT 1/2, 1/4, 1/8) langsung saat decode
+    - PNG: reduce() dengan faktor bulat sebelum konversi warna
+    Hasil tidak pernah lebih kecil dari ukuran target. Gambar RGB yang sudah
+    berukuran input model di-decode apa adanya tanpa konversi warna. Data
+    piksel yang rusak atau terpotong menghasilkan ImageRejectedError.
+    """
+    try:
+        if probe.mode == "RGB" and (probe.width, probe.height) == UKURAN_INPUT_MODEL:
+            image.load()
+            metrics.inc("image.decode.fast_path")
+            return image
+        if probe.format == "JPEG":
+            image.draft("RGB", target)
+            metrics.inc("image.decode.jpeg_draft")
+        elif probe.format == "PNG":
+            factor = min(probe.width // target[0], probe.height // target[1])
+            if factor >= 2:
+                # reduce() tidak mendukung mode palet, konversi dulu untuk mode itu
+                if image.mode not in ("RGB", "RGBA", "L", "LA"):
+                    image = image.convert("RGB")
+                image = image.reduce(factor)
+                metrics.inc("image.decode.png_reduce")
+            else:
+                metrics.inc("image.decode.full")
+        else:
+            metrics.inc("image.decode.full")
+
+        return image.convert("RGB")
+    except (OSError, SyntaxError) as e:
+        # Header valid tetapi data piksel terpotong atau rusak
+        metrics.inc("image.rejected.invalid")
+        raise ImageRejectedError("File gambar rusak atau tidak lengkap.") from e
+
+
+# --- Preprocessing Gambar ---
+def load_image(image_bytes: bytes, target=UKURAN_INPUT_MODEL) -> Image.Image:
+    """
+    Probe header lalu decode gambar menjadi RGB
+    """
+    probe, image = probe_image(image_bytes)
+    with metrics.stage("decode"):
+        return decode_image(image, probe, target)
+
+
+def load_raw_tensor(data: bytes, compressed: bool = False) -> Image.Image:
+    """
+    Ubah upload tensor mentah (uint8 HWC, opsional zstd) menjadi gambar RGB
+    tanpa decode JPEG/PNG
+    """
+    with metrics.stage("decode"):
+        if compressed:
+            if zstandard is None:
+                raise ImageRejectedError("Kompresi zstd tidak didukung server ini.")
+            try:
+                # Baca paling banyak satu byte melebihi ukuran tensor, apa pun
+                # ukuran yang dideklarasikan di header frame
+                reader = zstandard.ZstdDecompressor().stream_reader(data)
+                chunks, size = [], 0
+                while size <= RAW_TENSOR_SIZE:
+                    chunk = reader.read(RAW_TENSOR_SIZE + 1 - size)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+                data = b"".join(chunks)
+            except zstandard.ZstdError as e:
+                raise ImageRejectedError("Data zstd tidak valid.") from e
+        if len(data) != RAW_TENSOR_SIZE:
+            metrics.inc("image.rejected.invalid")
+            raise ImageRejectedError(
+                f"Tensor harus berisi tepat {RAW_TENSOR_SIZE} byte "
+                f"(uint8 {RAW_TENSOR_SHAPE[0]}x{RAW_TENSOR_SHAPE[1]}x{RAW_TENSOR_SHAPE[2]})."
+            )
+        metrics.inc("image.decode.raw_tensor")
+        array = np.frombuffer(data, dtype=np.uint8).reshape(RAW_TENSOR_SHAPE)
+        return Image.fromarray(array, "RGB")
+
+
+def load_upload(data: bytes, content_type: str = None, target=UKURAN_INPUT_MODEL) -> Image.Image:
+    """
+    Decode upload sesuai content type: tensor mentah atau file gambar
+    """
+    if content_type == RAW_TENSOR_TYPE:
+        return load_raw_tensor(data)
+    if content_type == RAW_TENSOR_ZSTD_TYPE:
+        return load_raw_tensor(data, compressed=True)
+    return load_image(data, target)
+
+
+def input_spec():
+    """
+    Spesifikasi input yang diharapkan server, untuk resize di sisi klien
+    """
+    width, height = UKURAN_INPUT_MODEL
+    return {
+        "width": width,
+        "height": height,
+        "channels": 3,
+        "color_mode": "RGB",
+        "preferred_encoding": "image/jpeg",
+        "jpeg_quality": 90,
+        "raw_tensor": {
+            "content_types": [RAW_TENSOR_TYPE]
+            + ([RAW_TENSOR_ZSTD_TYPE] if zstandard is not None else []),
+            "dtype": "uint8",
+            "layout": "HWC",
+            "shape": list(RAW_TENSOR_SHAPE),
+            "size_bytes": RAW_TENSOR_SIZE,
+        },
+    }
+
+
+def to_model_pixels(image: Image.Image) -> np.ndarray:
+    """
+    Resize gambar RGB ke ukuran input model, kembalikan array uint8 (H, W, 3)
+    """
+    if image.size != UKURAN_INPUT_MODEL:
+        image = image.resize(UKURAN_INPUT_MODEL)
+    return np.asarray(image)
+
+
+def to_model_input(image: Image.Image) -> np.ndarray:
+    """
+    Resize gambar RGB ke ukuran input model dan jadikan batch berisi satu gambar
+    """
+    with metrics.stage("resize"):
+        image_array = to_model_pixels(image) / 255.0
+    return np.expand_dims(image_array, axis=0)
+
+
+def preprocess_image(image_bytes: bytes) -> np.ndarray:
+    return to_model_input(load_image(image_bytes))
+
+
+def build_tta_batch(image: Image.Image) -> np.ndarray:
+    """
+    Buat batch view untuk test-time augmentation: crop tengah dan 4 sudut
+    dari gambar 256x256, ditambah flip horizontal dan vertikal crop tengah.
+    Semua crop diambil dengan satu operasi indexing pada sliding window view.
+    """
+    with metrics.stage("tta_views"):
+        base = np.array(image.resize(UKURAN_TTA)) / 255.0
+        width, height = UKURAN_INPUT_MODEL
+        dy = base.shape[0] - height
+        dx = base.shape[1] - width
+
+        # windows[y, x] adalah view crop berukuran (3, height, width) mulai dari (y, x)
+        windows = sliding_window_view(base, (height, width), axis=(0, 1))
+        ys = np.array([dy // 2, 0, 0, dy, dy])
+        xs = np.array([dx // 2, 0, dx, 0, dx])
+        crops = windows[ys, xs].transpose(0, 2, 3, 1)
+
+        center = crops[:1]
+        return np.concatenate([crops, center[:, :, ::-1], center[:, ::-1]])
+
+
+def build_tile_batch(image: Image.Image, grid=TILE_GRID, overlap=TILE_OVERLAP, min_leaf=TILE_MIN_LEAF):
+    """
+    Pecah gambar menjadi tile 224x224 yang tumpang tindih. Gambar di-resize
+    sekali sehingga setiap tile tepat berukuran input model, lalu tile dibaca
+    sebagai slice (view) array dan dinormalisasi langsung ke batch. Porsi daun per
+    tile dihitung dari summed-area table mask excess-green, dan hanya tile
+    berdaun yang dimasukkan ke batch (semua tile bila tidak ada yang berdaun).
+    Mengembalikan (batch, boxes relatif 0-1, porsi daun).
+    """
+    with metrics.stage("tiles"):
+        tile_width, tile_height = UKURAN_INPUT_MODEL
+        if image.width >= image.height:
+            cols, rows = grid, max(1, round(grid * image.height / image.width))
+        else:
+            rows, cols = grid, max(1, round(grid * image.width / image.height))
+        stride_x = max(1, round(tile_width * (1 - overlap)))
+        stride_y = max(1, round(tile_height * (1 - overlap)))
+        width = tile_width + (cols - 1) * stride_x
+        height = tile_height + (rows - 1) * stride_y
+        array = np.asarray(image.resize((width, height)))
+
+        ys = np.repeat(np.arange(rows) * stride_y, cols)
+        xs = np.tile(np.arange(cols) * stride_x, rows)
+
+        # Jumlah piksel daun per tile dari summed-area table
+        mask = excess_green_mask(array)
+        area = np.pad(mask.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        leaf = (
+            area[ys + tile_height, xs + tile_width]
+            - area[ys, xs + tile_width]
+            - area[ys + tile_height, xs]
+            + area[ys, xs]
+        ) / (tile_width * tile_height)
+        selected = np.flatnonzero(leaf >= min_leaf)
+        if len(selected) == 0:
+            selected = np.arange(len(ys))
+        ys, xs, leaf = ys[selected], xs[selected], leaf[selected]
+
+        # Setiap tile adalah slice (view) dari array; piksel langsung dinormalisasi
+        # ke batch sehingga data tile hanya disalin sekali
+        batch = np.empty((len(ys), tile_height, tile_width, array.shape[2]))
+        for tile, y, x in zip(batch, ys.tolist(), xs.tolist()):
+            np.divide(array[y : y + tile_height, x : x + tile_width], 255.0, out=tile)
+        boxes = [
+            (
+                round(x / width, 4),
+                round(y / height, 4),
+                round((x + tile_width) / width, 4),
+                round((y + tile_height) / height, 4),
+            )
+            for y, x in zip(ys.tolist(), xs.tolist())
+        ]
+        return batch, boxes, leaf
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+import metrics_service as metrics
+from disease_service import NAMA_KELAS
+from image_service import (
+    TILE_GRID,
+    UKURAN_INPUT_MODEL,
+    build_tile_batch,
+    build_tta_batch,
+    load_upload,
+    to_model_input,
+)
+from leaf_roi import UKURAN_DECODE_ROI, crop_leaf
+
+logger = logging.getLogger(__name__)
+
+# Model utama. CALIBRATION_PATH (opsional) hanya berlaku untuk model ini;
+# model lain (kandidat, model shed) selalu memakai <model>.calibration.json.
+MODEL_PATH = os.getenv("MODEL_PATH", "model_tomat_final_untuk_deploy.keras")
+CALIBRATION_PATH = os.getenv("CALIBRATION_PATH")
+
+# Ambang batas confidence default bila tidak ada tabel per kelas
+MIN_CONFIDENCE = float(os.getenv("MIN_CONFIDENCE", 0.60))
+
+# Test-time augmentation hanya dijalankan bila confidence awal di bawah nilai ini
+TTA_THRESHOLD = float(os.getenv("TTA_THRESHOLD", MIN_CONFIDENCE))
+
+# Batas atas parameter top_k pada endpoint /predict
+MAX_TOP_K = len(NAMA_KELAS)
+
+_EPS = 1e-7
+
+
+class Calibration(NamedTuple):
+    """Kalibrasi confidence yang dimuat bersama model"""
+
+    temperature: float
+    thresholds: np.ndarray  # ambang batas per kelas, urut sesuai NAMA_KELAS
+
+
+def default_calibration():
+    return Calibration(1.0, np.full(len(NAMA_KELAS), MIN_CONFIDENCE))
+
+
+def calibration_path_for(model_path):
+    """
+    Lokasi file kalibrasi: CALIBRATION_PATH untuk model utama (MODEL_PATH),
+    selain itu <model>.calibration.json
+    """
+    if CALIBRATION_PATH and os.path.abspath(model_path) == os.path.abspath(MODEL_PATH):
+        return CALIBRATION_PATH
+    return os.path.splitext(model_path)[0] + ".calibration.json"
+
+
+def load_calibration(model_path):
+    """
+    Muat temperature scaling dan tabel ambang batas per kelas. Format file:
+    {"temperature": 1.3, "default_threshold": 0.6, "thresholds": {"Healthy": 0.5}}
+    Jika file tidak ada, dipakai temperature 1.0 dan MIN_CONFIDENCE untuk semua kelas.
+    """
+    path = calibration_path_for(model_path)
+    if not os.path.exists(path):
+        logger.info("File kalibrasi %s tidak ditemukan, memakai default.", path)
+        return default_calibration()
+
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    temperature = float(config.get("temperature", 1.0))
+    if temperature <= 0:
+        raise ValueError(f"Temperature kalibrasi harus > 0, didapat {temperature}")
+
+    default_threshold = float(config.get("default_threshold", MIN_CONFIDENCE))
+    thresholds = np.full(len(NAMA_KELAS), default_threshold)
+    for kelas, value in config.get("thresholds", {}).items():
+        if kelas not in NAMA_KELAS:
+            raise ValueError(f"Kelas '{kelas}' pada file kalibrasi tidak dikenal")
+        thresholds[NAMA_KELAS.index(kelas)] = float(value)
+
+    logger.info("Kalibrasi dimuat dari %s (temperature=%s).", path, temperature)
+    return Calibration(temperature, thresholds)
+
+
+def calibrate(scores, calibration):
+    """
+    Terapkan temperature scaling pada output softmax model. Bekerja untuk
+    satu vektor skor maupun batch (kelas pada sumbu terakhir).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if calibration.temperature == 1.0:
+        return scores
+    logits = np.log(np.clip(scores, _EPS, 1.0)) / calibration.temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def predict_probabilities(model, batch, calibration):
+    """
+    Jalankan model pada satu batch dan kembalikan probabilitas terkalibrasi
+    dengan bentuk (batch, kelas)
+    """
+    with metrics.stage("inference"):
+        scores = model.predict(batch, verbose=0)
+    return calibrate(scores, calibration)
+
+
+def predict_with_embedding(embedder, batch, calibration):
+    """
+    Seperti predict_probabilities, tetapi memakai model embedding sehingga
+    vektor fitur layer sebelum klasifikasi ikut dikembalikan dari satu panggilan
+    """
+    with metrics.stage("inference"):
+        embeddings, scores = embedder.predict(batch, verbose=0)
+    return calibrate(scores, calibration), embeddings
+
+
+class PredictionResult(NamedTuple):
+    """Hasil inferensi untuk satu gambar, sebelum disusun menjadi respons"""
+
+    probabilities: np.ndarray
+    predicted_index: int
+    confidence: float
+    recognized: bool
+    tta_views: int
+    model_input: np.ndarray
+    embedding: np.ndarray = None
+    roi_box: tuple = None  # (left, top, right, bottom) relatif 0-1 bila gambar di-crop ke daun
+
+
+def run_prediction(image_bytes, entry, tta=False, keep_embedding=False, content_type=None, roi=False):
+    """
+    Decode, preprocess, dan jalankan model (entri registry) untuk satu gambar.
+    Dengan roi=True gambar di-decode lebih besar lalu di-crop ke daun dominan.
+    Fungsi ini blocking (CPU-bound) dan dipanggil dari thread pool.
+    """
+    image = load_upload(image_bytes, content_type, UKURAN_DECODE_ROI if roi else UKURAN_INPUT_MODEL)
+    roi_box = None
+    if roi:
+        image, roi_box = crop_leaf(image)
+    model_input = to_model_input(image)
+    calibration = entry.calibration
+
+    # Melakukan prediksi (sekaligus embedding bila diminta)
+    embedding = None
+    if keep_embedding:
+        probabilities, embeddings = predict_with_embedding(
+            entry.embedder, model_input, calibration
+        )
+        probabilities, embedding = probabilities[0], embeddings[0]
+    else:
+        probabilities = predict_probabilities(entry.model, model_input, calibration)[0]
+    predicted_index = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_index])
+
+    # Test-time augmentation: semua view dijalankan dalam satu batch,
+    # hanya untuk gambar yang ambigu pada prediksi pertama
+    tta_views = 0
+    if tta and confidence < TTA_THRESHOLD:
+        tta_batch = build_tta_batch(image)
+        tta_probabilities = predict_probabilities(entry.model, tta_batch, calibration)
+        tta_views = len(tta_batch)
+        probabilities = (probabilities + tta_probabilities.sum(axis=0)) / (tta_views + 1)
+        predicted_index = int(np.argmax(probabilities))
+        confidence = float(probabilities[predicted_index])
+        metrics.inc("predict.tta")
+
+    # Ambang batas confidence per kelas dari tabel kalibrasi
+    recognized = is_confident(predicted_index, confidence, calibration)
+    return PredictionResult(
+        probabilities, predicted_index, confidence, recognized, tta_views, model_input, embedding, roi_box
+    )
+
+
+def run_batch_prediction(uploads, entry):
+    """
+    Decode beberapa upload (image_bytes, content_type) lalu jalankan model
+    sekali untuk semua gambar yang valid. Mengembalikan list sepanjang
+    uploads berisi PredictionResult, atau exception untuk gambar yang ditolak.
+    Fungsi ini blocking (CPU-bound) dan dipanggil dari thread pool.
+    """
+    results = [None] * len(uploads)
+    inputs, positions = [], []
+    for position, (image_bytes, content_type) in enumerate(uploads):
+        try:
+            inputs.append(to_model_input(load_upload(image_bytes, content_type, UKURAN_INPUT_MODEL)))
+            positions.append(position)
+        except Exception as e:
+            # Gambar rusak (mis. JPEG terpotong) hanya menggagalkan job-nya sendiri
+            results[position] = e
+    if not inputs:
+        return results
+
+    calibration = entry.calibration
+    batch = np.concatenate(inputs)
+    probabilities = predict_probabilities(entry.model, batch, calibration)
+    metrics.inc("predict.batched", len(inputs))
+    for position, model_input, row in zip(positions, inputs, probabilities):
+        predicted_index = int(np.argmax(row))
+        confidence = float(row[predicted_index])
+        results[position] = PredictionResult(
+            row,
+            predicted_index,
+            confidence,
+            is_confident(predicted_index, confidence, calibration),
+            0,
+            model_input,
+        )
+    return results
+
+
+class TiledPredictionResult(NamedTuple):
+    """Hasil inferensi mode tiling: diagnosis gabungan dan prediksi per tile"""
+
+    probabilities: np.ndarray
+    predicted_index: int
+    confidence: float
+    recognized: bool
+    regions: list
+
+
+def run_tiled_prediction(image_bytes, entry, grid=TILE_GRID, content_type=None):
+    """
+    Klasifikasikan setiap tile berdaun dalam satu panggilan model. Diagnosis
+    gabungan adalah rata-rata probabilitas tile yang diberi bobot porsi daun.
+    Fungsi ini blocking (CPU-bound) dan dipanggil dari thread pool.
+    """
+    width, height = UKURAN_INPUT_MODEL
+    image = load_upload(image_bytes, content_type, (width * grid, height * grid))
+    batch, boxes, leaf = build_tile_batch(image, grid)
+    calibration = entry.calibration
+    tile_probabilities = predict_probabilities(entry.model, batch, calibration)
+    metrics.inc("predict.tiles", len(batch))
+
+    indices = np.argmax(tile_probabilities, axis=1)
+    confidences = tile_probabilities[np.arange(len(indices)), indices]
+    regions = []
+    for box, index, confidence, fraction in zip(boxes, indices.tolist(), confidences.tolist(), leaf.tolist()):
+        recognized = is_confident(index, confidence, calibration)
+        regions.append(
+            {
+                "box": list(box),
+                "disease_id": NAMA_KELAS[index] if recognized else None,
+                "confidence": confidence,
+                "leaf_fraction": round(fraction, 4),
+            }
+        )
+
+    weights = np.maximum(leaf, 1e-6)
+    probabilities = weights @ tile_probabilities / weights.sum()
+    predicted_index = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_index])
+    recognized = is_confident(predicted_index, confidence, calibration)
+    return TiledPredictionResult(probabilities, predicted_index, confidence, recognized, regions)
+
+
+def summarize_regions(regions):
+    """
+    Ringkas prediksi per tile menjadi daftar penyakit yang ditemukan:
+    jumlah tile dan confidence tertinggi per penyakit
+    """
+    summary = {}
+    for region in regions:
+        disease_id = region["disease_id"]
+        if disease_id is None:
+            continue
+        entry = summary.setdefault(disease_id, {"disease_id": disease_id, "regions": 0, "max_confidence": 0.0})
+        entry["regions"] += 1
+        entry["max_confidence"] = max(entry["max_confidence"], region["confidence"])
+    return sorted(summary.values(), key=lambda item: (-item["regions"], -item["max_confidence"]))
+
+
+def top_k(probabilities, k):
+    """
+    Ambil k kelas dengan probabilitas tertinggi, terurut menurun
+    """
+    k = min(k, probabilities.shape[-1])
+    indices = np.argpartition(-probabilities, k - 1)[:k]
+    indices = indices[np.argsort(-probabilities[indices])]
+    return [
+        {"disease_id": NAMA_KELAS[i], "confidence": float(probabilities[i])}
+        for i in indices
+    ]
+
+
+def is_confident(predicted_index, confidence, calibration):
+    """
+    Bandingkan confidence dengan ambang batas milik kelas yang diprediksi
+    """
+    return confidence >= calibration.thresholds[predicted_index]
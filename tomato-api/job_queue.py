@@ -0,0 +1,431 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import httpx
+
+import metrics_service as metrics
+from outbound_http import pinned_client, pinned_request, resolve_public_url
+
+logger = logging.getLogger(__name__)
+
+# Lokasi database job prediksi. Job yang belum selesai diambil ulang setelah lease-nya habis.
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "data/jobs.db")
+# Jumlah worker dan jumlah job yang diambil sekaligus untuk satu batch model
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 8))
+# Batas job yang menunggu; job baru ditolak bila antrian penuh
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", 1000))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+# Lease job running: diperpanjang heartbeat setiap sepertiga durasinya. Job
+# dengan lease kedaluwarsa (pemiliknya mati) diambil alih worker lain.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+JOB_DB_BUSY_TIMEOUT = float(os.getenv("JOB_DB_BUSY_TIMEOUT", 5))
+# Job selesai/gagal dihapus setelah umur ini (detik)
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 24 * 3600))
+# Callback: timeout, jumlah percobaan, dan daftar host yang diizinkan (kosong =
+# semua host publik; callback selalu https dan tidak boleh ke alamat non-publik)
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", 10))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", 3))
+JOB_CALLBACK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+_PURGE_INTERVAL = 3600
+_USER_AGENT = "tomato-api-jobs/1.0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    content_type TEXT,
+    image BLOB,
+    options TEXT,
+    callback_url TEXT,
+    callback_status TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+# Kolom lease ditambahkan ke database lama saat dibuka
+_LEASE_COLUMNS = {"lease_owner": "TEXT", "lease_expires": "REAL"}
+
+
+class JobQueueFullError(Exception):
+    """Jumlah job yang menunggu sudah mencapai JOB_QUEUE_LIMIT"""
+
+
+class Job(NamedTuple):
+    """Satu job prediksi yang diambil worker"""
+
+    job_id: str
+    owner: str
+    content_type: str
+    image: bytes
+    options: dict
+    callback_url: str
+
+
+async def validate_callback_url(url):
+    """
+    Pastikan callback berupa URL https absolut ke host yang diizinkan dan
+    seluruh alamat hasil resolusinya adalah alamat publik, agar server tidak
+    bisa dipakai mengirim request ke layanan internal. Mengembalikan alamat
+    IP yang sudah divalidasi untuk dipakai saat pengiriman.
+    """
+    return await resolve_public_url(
+        url, schemes=("https",), allowed_hosts=JOB_CALLBACK_ALLOWED_HOSTS, label="callback"
+    )
+
+
+class JobStore:
+    """
+    Penyimpanan job di SQLite (mode WAL), dipakai bersama oleh semua worker
+    proses. Gambar disimpan bersama job sampai job selesai diproses.
+
+    Job yang sedang dikerjakan dipegang dengan lease (pemilik + waktu
+    kedaluwarsa) yang diperpanjang oleh heartbeat pemiliknya. Job running
+    dengan lease kedaluwarsa berarti pemiliknya mati, sehingga boleh diambil
+    worker lain; job milik worker yang masih hidup tidak pernah diambil ulang.
+    Semua perubahan memakai BEGIN IMMEDIATE agar klaim antar proses tidak
+    pernah memberikan job yang sama ke dua worker.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, owner=None, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None: transaksi diatur eksplisit lewat _transaction()
+        self._conn = sqlite3.connect(
+            self.path, timeout=JOB_DB_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as conn:
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in _LEASE_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def create(self, job_id, owner, image, content_type, options, callback_url, limit=JOB_QUEUE_LIMIT):
+        now = time.time()
+        with self._transaction() as conn:
+            (pending,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+            if pending >= limit:
+                raise JobQueueFullError("Antrian job prediksi penuh")
+            conn.execute(
+                "INSERT INTO jobs (job_id, owner, status, created_at, updated_at, content_type, image, options, callback_url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, JOB_QUEUED, now, now, content_type, image, json.dumps(options), callback_url),
+            )
+        metrics.set_gauge("jobs.pending", pending + 1)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, owner, status, created_at, updated_at, callback_url, callback_status, result, error "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def claim(self, limit):
+        """
+        Ambil hingga `limit` job terlama yang menunggu (atau yang lease-nya
+        kedaluwarsa) dan pasang lease atas nama worker ini
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT job_id, owner, content_type, image, options, callback_url, status FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY created_at LIMIT ?",
+                (JOB_QUEUED, JOB_RUNNING, now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE jobs SET status = ?, updated_at = ?, lease_owner = ?, lease_expires = ? WHERE job_id = ?",
+                    [(JOB_RUNNING, now, self.owner, now + self.lease_seconds, row["job_id"]) for row in rows],
+                )
+        reclaimed = sum(1 for row in rows if row["status"] == JOB_RUNNING)
+        if reclaimed:
+            metrics.inc("jobs.lease_expired", reclaimed)
+            logger.info("%s job dengan lease kedaluwarsa diambil alih", reclaimed)
+        return [
+            Job(row["job_id"], row["owner"], row["content_type"], row["image"], json.loads(row["options"] or "{}"), row["callback_url"])
+            for row in rows
+        ]
+
+    def heartbeat(self):
+        """
+        Perpanjang lease semua job yang sedang dikerjakan worker ini
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE status = ? AND lease_owner = ?",
+                (time.time() + self.lease_seconds, JOB_RUNNING, self.owner),
+            )
+
+    def finish(self, job_id, status, result=None, error=None):
+        """
+        Simpan hasil job dan hapus gambarnya. Mengembalikan False bila lease
+        sudah berpindah ke worker lain (hasil ini diabaikan).
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, result = ?, error = ?, image = NULL, lease_owner = NULL "
+                "WHERE job_id = ? AND status = ? AND lease_owner = ?",
+                (status, time.time(), result, error, job_id, JOB_RUNNING, self.owner),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, job_ids):
+        """
+        Kembalikan job milik worker ini ke antrian (mis. executor inferensi penuh)
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE jobs SET status = ?, updated_at = ?, lease_owner = NULL WHERE job_id = ? AND status = ? AND lease_owner = ?",
+                [(JOB_QUEUED, time.time(), job_id, JOB_RUNNING, self.owner) for job_id in job_ids],
+            )
+
+    def set_callback_status(self, job_id, status):
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET callback_status = ? WHERE job_id = ?", (status, job_id))
+
+    def purge(self, older_than):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JOB_DONE, JOB_FAILED, older_than),
+            )
+        return cursor.rowcount
+
+
+class JobRunner:
+    """
+    Worker pool in-process untuk job prediksi. Setiap worker mengambil
+    hingga JOB_BATCH_SIZE job sekaligus dan memprosesnya dengan satu
+    panggilan `process_batch(jobs)`, yang mengembalikan list
+    (status, result, error) sepanjang jobs. Worker berhenti sementara
+    selama `paused()` bernilai True (mis. saat server overload).
+    """
+
+    def __init__(
+        self,
+        process_batch,
+        store=None,
+        workers=JOB_WORKERS,
+        batch_size=JOB_BATCH_SIZE,
+        paused=None,
+    ):
+        self.process_batch = process_batch
+        self.store = store if store is not None else JobStore()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.paused = paused or (lambda: False)
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._callbacks = set()
+        self._client = None
+        self._last_purge = 0.0
+        # Jumlah job yang sedang diproses worker ini (ditunggu saat draining)
+        self.active = 0
+
+    @property
+    def enabled(self):
+        return bool(self.store.path)
+
+    async def start(self):
+        if not self.enabled or self._tasks:
+            return
+        await asyncio.to_thread(self.store.open)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        self._wakeup.set()
+        logger.info("Job prediksi aktif di %s dengan %s worker", self.store.path, self.workers)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        for task in list(self._callbacks):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.store.close()
+
+    async def submit(self, job_id, owner, image, content_type, options, callback_url=None):
+        await asyncio.to_thread(self.store.create, job_id, owner, image, content_type, options, callback_url)
+        metrics.inc("jobs.submitted")
+        self._wakeup.set()
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _run(self):
+        while True:
+            try:
+                if self.paused():
+                    await asyncio.sleep(JOB_POLL_INTERVAL)
+                    continue
+                jobs = await asyncio.to_thread(self.store.claim, self.batch_size)
+                if not jobs:
+                    await self._maybe_purge()
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process(jobs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Mis. SQLITE_BUSY: worker tetap hidup, job kembali diambil setelah lease habis
+                logger.error("Worker job prediksi error: %s", e)
+                metrics.inc("jobs.worker_error")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.store.heartbeat)
+            except sqlite3.Error as e:
+                logger.error("Heartbeat lease job gagal: %s", e)
+
+    async def _process(self, jobs):
+        self.active += len(jobs)
+        metrics.set_gauge("jobs.active", self.active)
+        try:
+            await self._process_batch(jobs)
+        finally:
+            self.active -= len(jobs)
+            metrics.set_gauge("jobs.active", self.active)
+
+    async def _process_batch(self, jobs):
+        start = time.perf_counter()
+        try:
+            outcomes = await self.process_batch(jobs)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.store.release, [job.job_id for job in jobs])
+            raise
+        except Exception as e:
+            logger.error("Batch job prediksi gagal: %s", e)
+            outcomes = [(JOB_FAILED, None, str(e))] * len(jobs)
+        if outcomes is None:
+            # Pemroses tidak bisa menerima batch sekarang: kembalikan ke antrian
+            await asyncio.to_thread(self.store.release, [job.job_id for job in jobs])
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            return
+
+        for job, (status, result, error) in zip(jobs, outcomes):
+            if not await asyncio.to_thread(self.store.finish, job.job_id, status, result, error):
+                # Lease sudah diambil alih worker lain: hasil dan callback milik worker itu
+                metrics.inc("jobs.lease_lost")
+                continue
+            metrics.inc(f"jobs.{status}")
+            if job.callback_url:
+                task = asyncio.create_task(self._send_callback(job, status, result, error))
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+        metrics.observe("jobs.batch", time.perf_counter() - start)
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = pinned_client(JOB_CALLBACK_TIMEOUT, _USER_AGENT)
+        return self._client
+
+    async def _send_callback(self, job, status, result, error):
+        payload = {
+            "job_id": job.job_id,
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": error,
+        }
+        # Validasi ulang saat pengiriman (hasil DNS bisa berubah sejak job dibuat),
+        # lalu kirim ke alamat yang sudah divalidasi tanpa resolve ulang
+        try:
+            address = await validate_callback_url(job.callback_url)
+        except ValueError as e:
+            logger.warning("Callback job %s ditolak: %s", job.job_id, e)
+            metrics.inc("jobs.callback.rejected")
+            await asyncio.to_thread(self.store.set_callback_status, job.job_id, "rejected")
+            return
+        for attempt in range(JOB_CALLBACK_RETRIES):
+            try:
+                client = self._get_client()
+                response = await client.send(pinned_request(client, "POST", job.callback_url, address, json=payload))
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning("Callback job %s gagal (percobaan %s): %s", job.job_id, attempt + 1, e)
+                if attempt + 1 < JOB_CALLBACK_RETRIES:
+                    await asyncio.sleep(2 ** attempt)
+                continue
+            metrics.inc("jobs.callback.delivered")
+            await asyncio.to_thread(self.store.set_callback_status, job.job_id, "delivered")
+            return
+        metrics.inc("jobs.callback.failed")
+        await asyncio.to_thread(self.store.set_callback_status, job.job_id, "failed")
+
+    async def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < _PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        purged = await asyncio.to_thread(self.store.purge, now - JOB_RETENTION_SECONDS)
+        if purged:
+            metrics.inc("jobs.purged", purged)
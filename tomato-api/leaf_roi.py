@@ -0,0 +1,127 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+import metrics_service as metrics
+
+# Sisi terpanjang gambar kerja untuk segmentasi (gambar asli tidak disentuh)
+ROI_WORK_SIZE = int(os.getenv("ROI_WORK_SIZE", 128))
+# Piksel dianggap daun bila indeks excess-green kromatik (2g - r - b) di atas ambang ini
+ROI_EXG_THRESHOLD = float(os.getenv("ROI_EXG_THRESHOLD", 0.1))
+# Crop hanya bila daun dominan cukup besar namun belum memenuhi frame
+ROI_MIN_AREA = float(os.getenv("ROI_MIN_AREA", 0.02))
+ROI_MAX_BOX = float(os.getenv("ROI_MAX_BOX", 0.8))
+# Margin di sekitar bounding box, relatif terhadap sisi box
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", 0.1))
+# Budget waktu stage ROI; bila terlampaui gambar diklasifikasi tanpa crop
+ROI_BUDGET_MS = float(os.getenv("ROI_BUDGET_MS", 20))
+ROI_MAX_ITERATIONS = int(os.getenv("ROI_MAX_ITERATIONS", 64))
+
+# Resolusi decode saat ROI aktif, supaya crop tetap punya cukup piksel
+UKURAN_DECODE_ROI = (ROI_WORK_SIZE * 7, ROI_WORK_SIZE * 7)
+
+
+def excess_green_mask(array, threshold=ROI_EXG_THRESHOLD):
+    """
+    Mask piksel vegetasi dari array RGB uint8 memakai indeks excess-green
+    pada koordinat kromatik (tidak sensitif terhadap kecerahan)
+    """
+    rgb = array.astype(np.float32)
+    total = rgb.sum(axis=2)
+    total[total == 0] = 1.0
+    r, g, b = (rgb[..., i] / total for i in range(3))
+    return (2 * g - r - b) > threshold
+
+
+def label_components(mask, deadline=None, max_iterations=ROI_MAX_ITERATIONS):
+    """
+    Label komponen terhubung (4-neighbour) dengan propagasi label maksimum
+    yang divektorisasi, dipercepat pointer jumping. Label setiap piksel
+    adalah indeks datar salah satu piksel di komponen yang sama; -1 untuk
+    latar. Mengembalikan labels, atau None bila deadline terlewati.
+    """
+    labels = np.where(mask, np.arange(mask.size).reshape(mask.shape), -1)
+    for _ in range(max_iterations):
+        padded = np.pad(labels, 1, constant_values=-1)
+        updated = np.maximum.reduce(
+            [labels, padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]]
+        )
+        updated = np.where(mask, updated, -1)
+        # Label adalah indeks piksel di komponen yang sama, sehingga label
+        # milik piksel tersebut boleh langsung diambil (lompatan pointer)
+        updated = np.where(mask, updated.ravel()[np.maximum(updated, 0)], -1)
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+    metrics.inc("roi.not_converged")
+    return labels
+
+
+def find_leaf_box(image, budget_ms=ROI_BUDGET_MS):
+    """
+    Cari bounding box (left, top, right, bottom) daun dominan pada koordinat
+    gambar asli, atau None bila crop tidak diperlukan atau tidak ditemukan
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    ratio = ROI_WORK_SIZE / max(image.size)
+    small = image.resize(
+        (max(1, round(image.width * ratio)), max(1, round(image.height * ratio))),
+        Image.BILINEAR,
+        reducing_gap=2.0,
+    )
+    mask = excess_green_mask(np.asarray(small))
+    if not mask.any():
+        metrics.inc("roi.no_leaf")
+        return None
+
+    labels = label_components(mask, deadline)
+    if labels is None:
+        metrics.inc("roi.over_budget")
+        return None
+    counts = np.bincount(labels[mask])
+    dominant = int(np.argmax(counts))
+    if counts[dominant] < ROI_MIN_AREA * mask.size:
+        metrics.inc("roi.no_leaf")
+        return None
+
+    rows = np.flatnonzero((labels == dominant).any(axis=1))
+    cols = np.flatnonzero((labels == dominant).any(axis=0))
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    if (bottom - top) * (right - left) > ROI_MAX_BOX * mask.size:
+        metrics.inc("roi.full_frame")
+        return None
+
+    # Perlebar ke persegi plus margin agar daun tidak terdistorsi saat resize ke 224x224
+    scale_x = image.width / small.width
+    scale_y = image.height / small.height
+    center_x = (left + right) / 2 * scale_x
+    center_y = (top + bottom) / 2 * scale_y
+    side = max((right - left) * scale_x, (bottom - top) * scale_y) * (1 + 2 * ROI_MARGIN)
+    side = min(side, image.width, image.height)
+    left = int(min(max(center_x - side / 2, 0), image.width - side))
+    top = int(min(max(center_y - side / 2, 0), image.height - side))
+    return (left, top, left + int(side), top + int(side))
+
+
+def crop_leaf(image, budget_ms=ROI_BUDGET_MS):
+    """
+    Crop gambar ke daun dominan. Mengembalikan (gambar, box) dengan box
+    relatif terhadap ukuran gambar (0-1), atau None bila gambar tidak diubah.
+    """
+    with metrics.stage("roi"):
+        box = find_leaf_box(image, budget_ms)
+    if box is None:
+        return image, None
+    metrics.inc("roi.cropped")
+    left, top, right, bottom = box
+    relative = (
+        round(left / image.width, 4),
+        round(top / image.height, 4),
+        round(right / image.width, 4),
+        round(bottom / image.height, 4),
+    )
+    return image.crop(box), relative
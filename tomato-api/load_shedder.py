@@ -0,0 +1,163 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics_service as metrics
+
+# Thread khusus inferensi, terpisah dari thread pool default yang dipakai
+# endpoint konten, sehingga lonjakan prediksi tidak menghabiskan thread lain
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", min(4, os.cpu_count() or 1)))
+# Jumlah maksimal pekerjaan inferensi yang menunggu di antrian executor
+INFERENCE_QUEUE_LIMIT = int(os.getenv("INFERENCE_QUEUE_LIMIT", 32))
+# CoDel: target waktu tunggu di antrian dan panjang interval pengamatan
+SHED_TARGET_MS = float(os.getenv("SHED_TARGET_MS", 50))
+SHED_INTERVAL_MS = float(os.getenv("SHED_INTERVAL_MS", 500))
+# Model terkecil yang dipakai saat overload (opsional, harus sudah dimuat)
+SHED_MODEL_VERSION = os.getenv("SHED_MODEL_VERSION", "")
+# Jumlah hasil prediksi terakhir (per hash gambar) yang boleh disajikan ulang
+SHED_RESULT_CACHE_SIZE = int(os.getenv("SHED_RESULT_CACHE_SIZE", 256))
+
+# Tingkat degradasi, dari normal hingga menolak semua prediksi baru
+LEVEL_NORMAL = 0
+LEVEL_DEGRADED = 1  # tanpa TTA/ROI/embedding/shadow, model terkecil
+LEVEL_CACHED_ONLY = 2  # hanya hasil prediksi yang sudah ada di cache
+LEVEL_REJECT = 3  # semua prediksi baru ditolak 503
+LEVEL_NAMES = ("normal", "degraded", "cached_only", "reject")
+
+
+class QueueFullError(Exception):
+    """Antrian inferensi penuh"""
+
+
+class LoadShedder:
+    """
+    Detektor overload bergaya CoDel. Yang diukur adalah waktu tunggu
+    (sojourn time) pekerjaan di antrian executor inferensi, bukan panjang
+    antrian. Bila waktu tunggu minimum selama satu interval penuh tetap di
+    atas target, antrian dianggap macet (bukan sekadar burst) dan level naik
+    satu tingkat; bila minimum turun di bawah target, atau tidak ada
+    pekerjaan sama sekali selama satu interval, level turun satu tingkat.
+    """
+
+    def __init__(self, target_ms=SHED_TARGET_MS, interval_ms=SHED_INTERVAL_MS):
+        self.target = target_ms / 1000
+        self.interval = interval_ms / 1000
+        self._level = LEVEL_NORMAL
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_min = None
+        metrics.set_gauge("shed.level", LEVEL_NORMAL)
+
+    def _close_windows(self, now):
+        # Dipanggil dengan _lock dipegang
+        while now - self._window_start >= self.interval:
+            if self._window_min is not None and self._window_min > self.target:
+                self._set_level(min(self._level + 1, LEVEL_REJECT))
+            elif self._level > LEVEL_NORMAL:
+                self._set_level(self._level - 1)
+            self._window_min = None
+            self._window_start += self.interval
+            if now - self._window_start >= self.interval and self._level == LEVEL_NORMAL:
+                # Sudah lama tidak ada sample dan level normal: lompat ke sekarang
+                self._window_start = now
+
+    def _set_level(self, level):
+        if level != self._level:
+            metrics.inc(f"shed.transition.{LEVEL_NAMES[level]}")
+            metrics.set_gauge("shed.level", level)
+        self._level = level
+
+    def observe(self, sojourn):
+        """
+        Catat waktu tunggu satu pekerjaan (detik) saat mulai dikerjakan
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._close_windows(now)
+            if self._window_min is None or sojourn < self._window_min:
+                self._window_min = sojourn
+        metrics.observe("shed.queue_delay", sojourn)
+
+    @property
+    def level(self):
+        with self._lock:
+            self._close_windows(time.monotonic())
+            return self._level
+
+    def status(self):
+        level = self.level
+        return {
+            "level": level,
+            "name": LEVEL_NAMES[level],
+            "target_ms": self.target * 1000,
+            "interval_ms": self.interval * 1000,
+        }
+
+
+class InferenceExecutor:
+    """
+    Thread pool khusus inferensi dengan antrian terbatas. Setiap pekerjaan
+    melaporkan waktu tunggunya ke LoadShedder saat mulai dijalankan.
+    Context (durasi stage per request) ikut dibawa ke thread pekerja.
+    """
+
+    def __init__(self, shedder, threads=INFERENCE_THREADS, queue_limit=INFERENCE_QUEUE_LIMIT):
+        self.shedder = shedder
+        self.threads = threads
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="inference")
+
+    async def run(self, func, *args):
+        if self.pending >= self.threads + self.queue_limit:
+            metrics.inc("shed.queue_full")
+            raise QueueFullError("Antrian inferensi penuh")
+        submitted = time.monotonic()
+        context = contextvars.copy_context()
+
+        def job():
+            self.shedder.observe(time.monotonic() - submitted)
+            return context.run(func, *args)
+
+        self.pending += 1
+        metrics.set_gauge("shed.pending", self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+            metrics.set_gauge("shed.pending", self.pending)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ResultCache:
+    """
+    LRU kecil hasil prediksi terakhir per (hash gambar, content type), tanpa
+    input model dan embedding, untuk disajikan ulang saat overload
+    """
+
+    def __init__(self, size=SHED_RESULT_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if not self.size:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
@@ -0,0 +1,172 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+import metrics_service as metrics
+
+# Level dan format log: 'json' (satu objek JSON per baris) atau 'text'
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Kapasitas antrian log; bila penuh, record dibuang (tidak pernah memblokir)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Access log untuk route konten bervolume tinggi hanya dicatat sebagian
+LOG_SAMPLED_PREFIXES = tuple(
+    prefix.strip()
+    for prefix in os.getenv("LOG_SAMPLED_PREFIXES", "/api/content,/media,/ilustrasi").split(",")
+    if prefix.strip()
+)
+LOG_CONTENT_SAMPLE_RATE = float(os.getenv("LOG_CONTENT_SAMPLE_RATE", 0.1))
+
+# Atribut bawaan LogRecord; atribut lain (dari extra=...) ikut ditulis ke JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+access_logger = logging.getLogger("access")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format record sebagai satu baris JSON, termasuk field dari extra"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler yang tidak memformat pesan di thread pemanggil dan membuang
+    record bila antrian penuh. Pemformatan dilakukan oleh QueueListener.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log.dropped")
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, queue_size=LOG_QUEUE_SIZE):
+    """
+    Arahkan semua log ke antrian in-memory; satu thread QueueListener
+    memformat dan menulis ke stdout
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(queue.Queue(maxsize=queue_size)))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Tulis sisa antrian log lalu hentikan thread listener
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _sample_rate(path):
+    if path.startswith(LOG_SAMPLED_PREFIXES):
+        return LOG_CONTENT_SAMPLE_RATE
+    return 1.0
+
+
+class AccessLogMiddleware:
+    """
+    Middleware ASGI yang mencatat satu baris access log per request: request
+    id, route, status, ukuran payload masuk/keluar, durasi total, dan durasi
+    per stage. Request id diambil dari header X-Request-ID bila ada dan
+    dikembalikan di header respons. Route konten di-sampling; respons error
+    selalu dicatat.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        request_id = None
+        bytes_in = 0
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+            elif name == b"content-length":
+                bytes_in = int(value) if value.isdigit() else 0
+        request_id = request_id or uuid.uuid4().hex
+        stages = metrics.begin_request()
+        response = {"status": 500, "bytes_out": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            elif message["type"] == "http.response.body":
+                response["bytes_out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            status = response["status"]
+            rate = _sample_rate(scope["path"])
+            if status >= 400 or rate >= 1.0 or random.random() < rate:
+                route = scope.get("route")
+                access_logger.log(
+                    logging.ERROR if status >= 500 else logging.INFO,
+                    "%s %s %s",
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    extra={
+                        "request_id": request_id,
+                        "method": scope["method"],
+                        "route": getattr(route, "path", scope["path"]),
+                        "status": status,
+                        "bytes_in": bytes_in,
+                        "bytes_out": response["bytes_out"],
+                        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                        "stages": {name: round(ms, 3) for name, ms in stages.items()},
+                        "sample_rate": rate,
+                    },
+                )
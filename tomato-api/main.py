@@ -1,12 +1,15 @@
 from contextlib import asynccontextmanager
-import io
+import asyncio
 import os
 import json
+import hashlib
+import math
+import time
+from typing import NamedTuple
 import numpy as np
 import tensorflow as tf
-from PIL import Image
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header
-from fastapi.responses import JSONResponse
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, HTTPException, Depends, Header, Request
+from fastapi.responses import FileResponse, Response
 import logging
 from dotenv import load_dotenv
 import uuid
@@ -14,7 +17,76 @@ from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import Query
-from content_service import get_content_with_filters, get_content_by_id, get_content_statistics
+from fastapi import Body
+from content_service import (
+    RELATED_CONTENT_LIMIT,
+    VALID_TYPES,
+    ContentSync,
+    delete_content,
+    get_content_by_id,
+    get_content_facets,
+    get_content_statistics,
+    get_content_with_filters,
+    get_related_content,
+    publish_content,
+    search_with_fallback,
+)
+from image_service import (
+    RAW_TENSOR_TYPE,
+    RAW_TENSOR_ZSTD_TYPE,
+    TILE_GRID,
+    TILE_MAX_GRID,
+    ImageRejectedError,
+    ImageTooLargeError,
+    input_spec,
+)
+import metrics_service as metrics
+from logging_service import AccessLogMiddleware, setup_logging, stop_logging
+from disease_service import NAMA_KELAS, render_prediction
+from inference_service import (
+    MAX_TOP_K,
+    MODEL_PATH,
+    is_confident,
+    predict_probabilities,
+    run_batch_prediction,
+    run_prediction,
+    run_tiled_prediction,
+    summarize_regions,
+    top_k as ambil_top_k,
+)
+from model_registry import ROUTING_MODES, ModelRegistry
+from prediction_log import PredictionLog
+from embedding_index import EmbeddingIndex
+from rate_limiter import ConcurrencyLimiter, TokenBucketLimiter, create_slot_table
+from singleflight import SingleFlight
+from news_ingest import NewsIngester
+from thumbnail_service import THUMB_FORMATS, SourceImageError, ThumbnailService, snap_width
+from illustration_service import IllustrationStore
+from load_shedder import (
+    LEVEL_CACHED_ONLY,
+    LEVEL_DEGRADED,
+    LEVEL_REJECT,
+    SHED_MODEL_VERSION,
+    InferenceExecutor,
+    LoadShedder,
+    QueueFullError,
+    ResultCache,
+)
+from job_queue import (
+    JOB_DONE,
+    JOB_FAILED,
+    JobQueueFullError,
+    JobRunner,
+    validate_callback_url,
+)
+from memory_service import MemoryWatchdog, update_gauges as update_memory_gauges
+from profiler_service import (
+    PROFILE_MAX_SECONDS,
+    PROFILE_MIN_INTERVAL_MS,
+    PROFILE_MODES,
+    Profiler,
+    ProfilerBusyError,
+)
 
 
 # Load environment variables dari file .env
@@ -25,26 +97,103 @@ port = os.getenv("PORT", 8000)
 
 
 # --- Konfigurasi Dasar ---
-logging.basicConfig(level=logging.INFO)
+# Log JSON per baris lewat antrian + thread writer (LOG_LEVEL, LOG_FORMAT)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
 # --- Fungsi Startup: Load Model ---
+def load_keras_model(path):
+    return tf.keras.models.load_model(path, compile=False)
+
+
+def build_embedding_model(model):
+    """
+    Model dengan dua output: fitur layer sebelum klasifikasi dan skor kelas
+    """
+    return tf.keras.Model(
+        inputs=model.inputs, outputs=[model.layers[-2].output, model.outputs[0]]
+    )
+
+
+# Registry model: menyimpan beberapa versi dan routing trafik antar versi
+registry = ModelRegistry(loader=load_keras_model, embedder_factory=build_embedding_model)
+
+# Log prediksi sisi server (antrian in-memory + writer batch ke SQLite)
+prediction_log = PredictionLog()
+
+# Index embedding untuk pencarian kasus serupa
+embedding_index = EmbeddingIndex()
+
+# Penggabungan request identik yang sedang berjalan (prediksi dan pencarian konten)
+predict_flight = SingleFlight("predict")
+content_flight = SingleFlight("content_search")
+
+# Ingestion berita berkala dari sumber RSS/HTML (NEWS_SOURCES)
+news_ingester = NewsIngester()
+# Menyusul konten yang dipublikasikan lewat worker lain
+content_sync = ContentSync()
+
+# Thumbnail gambar konten (cache disk); gambar sumber yang sama diambil sekali
+thumbnails = ThumbnailService()
+thumb_flight = SingleFlight("thumbnail")
+
+# Ilustrasi penyakit dari ASSET_DIR, di-resize sekali saat startup
+illustrations = IllustrationStore()
+
+# Inferensi berjalan di executor khusus; waktu tunggu antriannya dipantau
+# load shedder (CoDel) untuk menurunkan kualitas layanan secara bertahap saat overload
+load_shedder = LoadShedder()
+inference_pool = InferenceExecutor(load_shedder)
+recent_results = ResultCache()
+
+# Profiler sampling on-demand untuk diagnosis (tidak aktif di luar sesi)
+profiler = Profiler()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global model
-    model_path = os.getenv("MODEL_PATH", "model_tomat_final_untuk_deploy.keras")
+    model_path = MODEL_PATH
+    model_version = os.getenv("MODEL_VERSION", "2.0.0")
     try:
-        logger.info(f"Mencoba memuat model dari: {model_path}")
-        model = tf.keras.models.load_model(model_path, compile=False)
-        logger.info("✅ Model berhasil dimuat.")
-        yield
+        registry.load(model_version, model_path)
+        registry.activate(model_version)
     except Exception as e:
-        logger.error(f"❌ Gagal memuat model: {e}")
+        logger.error("Gagal memuat model: %s", e)
         raise RuntimeError(
             f"Tidak dapat memuat model dari {model_path}. Pastikan file ada dan valid."
         )
 
+    # Model kandidat opsional untuk A/B test atau shadow comparison
+    candidate_path = os.getenv("MODEL_CANDIDATE_PATH")
+    if candidate_path:
+        candidate_version = os.getenv("MODEL_CANDIDATE_VERSION", "candidate")
+        try:
+            registry.load(candidate_version, candidate_path)
+            registry.set_candidate(
+                candidate_version,
+                float(os.getenv("MODEL_CANDIDATE_TRAFFIC", 0)),
+                os.getenv("MODEL_CANDIDATE_MODE", "ab"),
+            )
+        except Exception as e:
+            logger.error("Gagal memuat model kandidat: %s", e)
+
+    illustrations.load()
+    prediction_log.start()
+    news_ingester.start()
+    content_sync.start()
+    await prediction_jobs.start()
+    memory_watchdog.start()
+    yield
+    await memory_watchdog.stop()
+    await prediction_jobs.stop()
+    inference_pool.shutdown()
+    await news_ingester.stop()
+    await content_sync.stop()
+    await thumbnails.aclose()
+    prediction_log.stop()
+    stop_logging()
+
 
 # --- Inisialisasi Aplikasi FastAPI ---
 app = FastAPI(
@@ -54,78 +203,12 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Access log terstruktur: request id, route, status, ukuran payload, durasi stage
+app.add_middleware(AccessLogMiddleware)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(port))
-
-# --- KAMUS INFORMASI PENYAKIT (Data Anda yang sudah sangat baik) ---
-INFORMASI_PENYAKIT = {
-    "Bacterial_spot": {
-        "nama_penyakit": "Bercak Bakteri (Bacterial Spot)",
-        "penyebab": "Bakteri genus Xanthomonas (X. vesicatoria, X. perforans, dll.).",
-        "gejala": "Bercak kecil, basah, berwarna gelap pada daun, batang, dan buah. Bercak pada daun seringkali memiliki lingkaran kuning di sekelilingnya. Penyakit ini tidak bisa disembuhkan.",
-        "solusi": "Gunakan benih dan bibit yang bebas penyakit. Lakukan rotasi tanaman 3–4 tahun. Pengendalian berfokus pada pencegahan. Semprotkan bakterisida berbasis tembaga atau kombinasi tembaga–mankozeb segera setelah tanam atau saat gejala pertama muncul. Aplikasikan kembali sesuai interval pada label produk.",
-    },
-    "Early_blight": {
-        "nama_penyakit": "Hawar Dini (Early Blight)",
-        "penyebab": "Jamur Alternaria solani (juga dikenal sebagai A. tomatophila atau A. linariae).",
-        "gejala": "Munculnya bercak cokelat kering berbentuk konsentris seperti 'papan target' pada daun, batang, dan buah. Biasanya dimulai dari daun-daun bagian bawah.",
-        "solusi": "Gunakan mulsa plastik untuk mencegah percikan spora dari tanah ke daun. Semprotkan fungisida kontak seperti klorotalonil, mankozeb, atau tembaga saat gejala pertama kali muncul, terutama saat cuaca lembap.",
-    },
-    "Healthy": {
-        "nama_penyakit": "Sehat (Healthy)",
-        "penyebab": "Tidak ada penyakit.",
-        "gejala": "-",
-        "solusi": "Pertahankan! Lanjutkan praktik perawatan yang baik seperti penyiraman teratur, pemupukan seimbang, dan pemantauan rutin untuk deteksi dini masalah.",
-    },
-    "Late_blight": {
-        "nama_penyakit": "Hawar Daun, Busuk Daun (Late Blight)",
-        "penyebab": "Oomycete (organisme mirip jamur) Phytophthora infestans.",
-        "gejala": "Bercak basah berwarna hijau gelap hingga keunguan pada daun yang menyebar dengan cepat. Seringkali terdapat lapisan jamur putih di bagian bawah daun. Pada buah, muncul bercak besar berwarna cokelat dan berkeropeng. Penyakit ini sangat destruktif pada suhu sejuk (15–24°C) dan kelembapan tinggi.",
-        "solusi": "Lakukan penyemprotan fungisida preventif sebelum gejala muncul, terutama saat musim hujan. Gunakan fungisida kontak seperti klorotalonil atau mankozeb, atau fungisida sistemik seperti kombinasi azoksistrobin+difenokonazol. ",
-    },
-    "Leaf_Mold": {
-        "nama_penyakit": "Kapang Daun (Leaf Mold)",
-        "penyebab": "Jamur Passalora fulva (sinonim Cladosporium fulvum).",
-        "gejala": "Umumnya terjadi di rumah kaca atau area dengan kelembapan tinggi. Gejala awal adalah bintik kuning pucat di permukaan atas daun, yang diikuti oleh lapisan jamur berwarna zaitun di bagian bawahnya. Daun yang terinfeksi parah akan menguning dan rontok.",
-        "solusi": "Tingkatkan sirkulasi udara dengan menjaga jarak tanam dan memangkas tunas air. Hindari membasahi daun dengan menggunakan irigasi tetes. Jika serangan parah, gunakan fungisida seperti klorotalonil atau azoksistrobin+difenokonazol.",
-    },
-    "Mosaic_virus": {
-        "nama_penyakit": "Virus Mosaic Tomat (Tomato Mosaic Virus)",
-        "penyebab": "Virus ToMV yang sangat mudah menular melalui kontak mekanis (tangan, alat potong) dan benih yang terinfeksi.",
-        "gejala": "Pola belang hijau muda dan hijau tua (mosaik) pada daun. Daun bisa tampak keriput, melepuh, atau berbentuk seperti benang. Tanaman menjadi kerdil dan buah bisa mengalami bercak internal.",
-        "solusi": "Tidak ada pengobatan yang efektif. Pencegahan terbaik adalah menggunakan benih bebas virus, mengendalikan kutu daun, dan menghindari kontak dengan tanaman terinfeksi. Pemangkasan dan penghancuran tanaman terinfeksi juga dianjurkan.",
-    },
-    "Septoria_leaf_spot": {
-        "nama_penyakit": "Bercak Daun Septoria (Septoria Leaf Spot)",
-        "penyebab": "Jamur Septoria lycopersici.",
-        "gejala": "Munculnya banyak bintik kecil (1-2 mm) berwarna cokelat dengan bagian tengah keabu-abuan dan pinggiran lebih gelap. Penyakit ini biasanya dimulai dari daun paling bawah dan merambat ke atas, menyebabkan daun rontok parah.",
-        "solusi": " Semprot secara berkala dengan fungisida kontak seperti tembaga, klorotalonil, atau mankozeb, terutama saat cuaca lembap.",
-    },
-    "Spider_mites": {
-        "nama_penyakit": "Hama Tungau (Spider Mites)",
-        "penyebab": "Tungau kecil (Tetranychus urticae) yang menghisap cairan dari daun.",
-        "gejala": "Daun menjadi kuning, berdebu, dan mungkin terdapat jaring laba-laba halus di bawah daun. Serangan berat dapat menyebabkan daun mengering dan rontok.",
-        "solusi": "Gunakan insektisida berbasis minyak neem atau insektisida sistemik. Jaga kelembapan udara yang cukup untuk mengurangi populasi tungau. Pemangkasan daun yang terinfeksi juga dapat membantu mengendalikan penyebaran.",
-    },
-    "Target_Spot": {
-        "nama_penyakit": "Bercak Target (Target Spot)",
-        "penyebab": "Jamur Corynespora cassiicola.",
-        "gejala": "Bercak cokelat dengan tepi kuning yang berkembang menjadi bercak besar dengan pola konsentris. Biasanya dimulai dari daun bawah dan menyebar ke atas.",
-        "solusi": "Gunakan fungisida kontak seperti klorotalonil atau mankozeb. Rotasi tanaman dan menjaga jarak tanam yang baik untuk meningkatkan sirkulasi udara juga penting.",
-    },
-    "YellowLeaf__Curl_Virus": {
-        "nama_penyakit": "Keriting Daun Kuning (Yellow Leaf Curl Virus)",
-        "penyebab": "Disebabkan oleh Tomato Yellow Leaf Curl Virus (TYLCV), ditularkan oleh serangga kutu kebul (whitefly).",
-        "gejala": "Daun baru menjadi kerdil, menguning, dan melengkung ke atas (keriting). Pertumbuhan tanaman terhambat parah dan produksi buah menurun drastis.",
-        "solusi": "Tidak ada obat. Fokus pada pengendalian vektornya, yaitu kutu kebul, menggunakan insektisida atau perangkap lengket. Gunakan varietas yang tahan virus.",
-    },
-}
-
-# --- Variabel Global & Konfigurasi Model ---
-model = None
-NAMA_KELAS = list(INFORMASI_PENYAKIT.keys())
-UKURAN_INPUT_MODEL = (224, 224)
+    uvicorn.run(app, host="0.0.0.0", port=int(port), access_log=False)
 
 # Inisialisasi Firebase Admin dengan file service account
 firebase_json = os.getenv("FIREBASE_CREDENTIALS")
@@ -133,15 +216,15 @@ if firebase_json:
     try:
         cred = credentials.Certificate(json.loads(firebase_json))
         firebase_admin.initialize_app(cred)
-        logger.info("✅ Firebase Admin initialized successfully")
+        logger.info("Firebase Admin initialized successfully")
     except json.JSONDecodeError as e:
-        logger.error(f"❌ Error parsing Firebase credentials: {e}")
-        logger.warning("⚠️ Firebase features will be disabled")
+        logger.error("Error parsing Firebase credentials: %s", e)
+        logger.warning("Firebase features will be disabled")
     except Exception as e:
-        logger.error(f"❌ Error initializing Firebase: {e}")
-        logger.warning("⚠️ Firebase features will be disabled")
+        logger.error("Error initializing Firebase: %s", e)
+        logger.warning("Firebase features will be disabled")
 else:
-    logger.warning("⚠️ No Firebase credentials found. Firebase features will be disabled")
+    logger.warning("No Firebase credentials found. Firebase features will be disabled")
 
 
 # Fungsi untuk memverifikasi token
@@ -158,12 +241,59 @@ def verify_firebase_token(authorization: str = Header(...)):
         )
 
 
-# --- Preprocessing Gambar ---
-def preprocess_image(image_bytes: bytes) -> np.ndarray:
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    image = image.resize(UKURAN_INPUT_MODEL)
-    image_array = np.array(image) / 255.0
-    return np.expand_dims(image_array, axis=0)
+# Admin ditentukan lewat env ADMIN_UIDS (dipisah koma) atau custom claim 'admin'
+ADMIN_UIDS = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+
+
+# Rate limit /predict: token bucket per uid dan budget prediksi bersamaan per
+# worker (plus budget global antar worker bila MAX_CONCURRENT_PREDICTIONS_GLOBAL diisi)
+user_rate_limiter = TokenBucketLimiter()
+predict_slots = ConcurrencyLimiter(shared=create_slot_table())
+
+# Watchdog RSS: worker yang melewati MEMORY_RSS_LIMIT_MB dikuras (prediksi dan
+# job yang sedang berjalan ditunggu) lalu dimulai ulang oleh gunicorn
+memory_watchdog = MemoryWatchdog(
+    in_flight=lambda: predict_slots.in_flight + prediction_jobs.active
+)
+
+
+def limit_predict(user: dict = Depends(verify_firebase_token)):
+    """
+    Tolak request dengan 429 sebelum decode/inferensi bila pengguna melebihi
+    kuota atau worker sudah penuh. Slot prediksi dilepas setelah request selesai.
+    """
+    if memory_watchdog.draining:
+        metrics.inc("rate_limit.rejected.draining")
+        raise HTTPException(
+            status_code=503,
+            detail="Server sedang dimulai ulang. Silakan coba lagi sebentar lagi.",
+            headers={"Retry-After": "5"},
+        )
+    allowed, retry_after = user_rate_limiter.take(user.get("uid", ""))
+    if not allowed:
+        metrics.inc("rate_limit.rejected.user")
+        raise HTTPException(
+            status_code=429,
+            detail="Terlalu banyak permintaan prediksi. Silakan coba lagi nanti.",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    if not predict_slots.try_acquire():
+        metrics.inc("rate_limit.rejected.concurrency")
+        raise HTTPException(
+            status_code=429,
+            detail="Server sedang sibuk memproses prediksi lain. Silakan coba lagi.",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        yield user
+    finally:
+        predict_slots.release()
+
+
+def verify_admin(user: dict = Depends(verify_firebase_token)):
+    if user.get("admin") is True or user.get("uid") in ADMIN_UIDS:
+        return user
+    raise HTTPException(status_code=403, detail="Akses khusus admin.")
 
 
 # --- ENDPOINT UTAMA UNTUK PREDIKSI ---
@@ -175,10 +305,17 @@ MAX_FILE_SIZE = 2 * 1024 * 1024
 def read_root():
     return {"status": "API Deteksi Penyakit Tomat aktif."}
 
-@app.post("/predict")
-async def predict_disease(
-    file: UploadFile = File(...), user: dict = Depends(verify_firebase_token)
-):
+
+# --- Endpoint Metrik ---
+@app.get("/metrics")
+def read_metrics():
+    update_memory_gauges()
+    return {"status": "success", "data": metrics.snapshot()}
+
+def validate_upload(file: UploadFile):
+    """
+    Cek ukuran dan tipe file upload prediksi, kembalikan content type-nya
+    """
     # Cek ukuran file gambar
     if file.size > MAX_FILE_SIZE:
         raise HTTPException(
@@ -186,84 +323,539 @@ async def predict_disease(
             detail="Ukuran file gambar terlalu besar. Maksimal ukuran file adalah 2MB.",
         )
 
-    if not file.content_type.startswith("image/"):
+    content_type = file.content_type or ""
+    if not content_type.startswith("image/") and content_type not in (RAW_TENSOR_TYPE, RAW_TENSOR_ZSTD_TYPE):
         raise HTTPException(
             status_code=400,
             detail="Tipe file tidak valid. Harap unggah file gambar (JPG, PNG).",
         )
+    return content_type
+
+
+# --- Spesifikasi input untuk resize di sisi klien ---
+@app.get("/predict/spec")
+def read_predict_spec():
+    return {"status": "success", "data": {**input_spec(), "max_file_size": MAX_FILE_SIZE}}
+
+
+class CachedResult(NamedTuple):
+    """Hasil prediksi terakhir untuk satu gambar, disajikan ulang saat overload"""
+
+    model_version: str
+    result: object
+
+
+def shed_model(entry):
+    """
+    Model yang dipakai saat overload: SHED_MODEL_VERSION bila sudah dimuat
+    """
+    if SHED_MODEL_VERSION:
+        return registry.get(SHED_MODEL_VERSION) or entry
+    return entry
+
+
+def raise_overloaded():
+    metrics.inc("shed.rejected")
+    raise HTTPException(
+        status_code=503,
+        detail="Server sedang kelebihan beban. Silakan coba lagi sebentar lagi.",
+        headers={"Retry-After": "2"},
+    )
+
 
+@app.post("/predict")
+async def predict_disease(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    top_k: int = Query(0, ge=0, le=MAX_TOP_K, description="Jumlah kelas teratas yang disertakan di respons"),
+    tta: bool = Query(False, description="Jalankan test-time augmentation bila confidence awal rendah"),
+    embedding: bool = Query(False, description="Simpan embedding gambar untuk pencarian kasus serupa"),
+    roi: bool = Query(False, description="Crop gambar ke daun dominan sebelum klasifikasi"),
+    related: int = Query(3, ge=0, le=RELATED_CONTENT_LIMIT, description="Jumlah tips/berita terkait yang disertakan di respons"),
+    image_width: int = Query(None, ge=1, le=4096, description="Lebar tampilan ilustrasi di aplikasi (piksel)"),
+    accept: str = Header(None),
+    request: Request = None,
+    user: dict = Depends(limit_predict),
+):
+    content_type = validate_upload(file)
+
+    started = time.perf_counter()
     try:
-        # Membaca dan memproses gambar
+        # Membaca gambar
         image_bytes = await file.read()
-        processed_image = preprocess_image(image_bytes)
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
 
-        # Melakukan prediksi
-        prediction_scores = model.predict(processed_image)[0]
-        confidence = float(np.max(prediction_scores))
-        predicted_index = np.argmax(prediction_scores)
+        # Pilih model untuk request ini (model aktif atau kandidat A/B)
+        entry, shadow = registry.route(user.get("uid"))
+
+        # Saat overload, pekerjaan opsional dilepas sebelum prediksi ditolak
+        level = load_shedder.level
+        result = None
+        if level >= LEVEL_DEGRADED:
+            tta = roi = embedding = False
+            shadow = None
+            entry = shed_model(entry)
+        if level >= LEVEL_CACHED_ONLY:
+            result = recent_results.get((image_hash, content_type))
+            if result is None or level >= LEVEL_REJECT:
+                raise_overloaded()
+            metrics.inc("shed.cache_hit")
+            entry = registry.get(result.model_version) or entry
+            result = result.result
+        keep_embedding = embedding and entry.embedder is not None and embedding_index.enabled
+
+        if result is None:
+            # Preprocessing dan inferensi berjalan di executor inferensi. Upload identik
+            # yang datang bersamaan (mis. retry dari aplikasi) menunggu hasil yang sama.
+            result = await predict_flight.do(
+                ("predict", image_hash, content_type, entry.version, tta, keep_embedding, roi),
+                inference_pool.run,
+                run_prediction,
+                image_bytes,
+                entry,
+                tta,
+                keep_embedding,
+                content_type,
+                roi,
+            )
+            recent_results.put(
+                (image_hash, content_type),
+                CachedResult(entry.version, result._replace(model_input=None, embedding=None)),
+            )
+        predicted_index = result.predicted_index
+        confidence = result.confidence
         predicted_class_internal = NAMA_KELAS[predicted_index]
-        informasi_detail = INFORMASI_PENYAKIT.get(predicted_class_internal)
 
         predict_id = str(uuid.uuid4())
         timestamp = datetime.utcnow().isoformat() + "Z"
-        model_version = "2.0.0"
-
-        MIN_CONFIDENCE = 0.60
-        if confidence < MIN_CONFIDENCE:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "status": "unrecognized",
-                    "predict_id": predict_id,
-                    "timestamp": timestamp,
-                    "model_version": model_version,
-                    "data": {
-                        "disease_id": None,
-                        "nama_penyakit": "Gambar Tidak Dapat Diidentifikasi",
-                        "confidence": confidence,
-                        "confidence_str": f"{confidence:.2%}",
-                        "gejala": ["Model tidak cukup yakin untuk membuat diagnosis."],
-                        "penyebab": "Ini bisa terjadi jika gambar buram, pencahayaan kurang, atau objek bukan daun tomat.",
-                        "solusi": [
-                            "Silakan coba ambil foto ulang. Pastikan fokus pada daun yang bergejala dengan pencahayaan yang baik."
-                        ],
-                    },
-                },
+        model_version = entry.version
+
+        log_entry = {
+            "predict_id": predict_id,
+            "timestamp": timestamp,
+            "role": "primary",
+            "model_version": model_version,
+            "disease_id": predicted_class_internal if result.recognized else None,
+            "confidence": confidence,
+            "top_k": ambil_top_k(result.probabilities, 3),
+            "image_hash": image_hash,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+        }
+        prediction_log.record(log_entry)
+
+        # Shadow mode: kandidat dijalankan setelah respons terkirim
+        if shadow is not None:
+            background_tasks.add_task(
+                run_shadow, shadow, result.model_input, predicted_class_internal, log_entry
             )
 
-        def to_list(text):
-            if isinstance(text, list):
-                return text
-            return [
-                t.strip() for t in text.replace("\n", ". ").split(". ") if t.strip()
-            ]
+        # Embedding disimpan setelah respons terkirim
+        if keep_embedding:
+            background_tasks.add_task(
+                embedding_index.add,
+                predict_id,
+                result.embedding,
+                predicted_index if result.recognized else -1,
+            )
 
-        return JSONResponse(
-            status_code=200,
-            content={
-                "status": "success",
+        if not result.recognized:
+            predicted_class_internal = None
+
+        extra = {}
+        if predicted_class_internal is not None:
+            extra["image_url"] = illustrations.url_for(
+                predicted_class_internal, image_width, accept, str(request.base_url)
+            )
+        if top_k:
+            extra["top_k"] = ambil_top_k(result.probabilities, top_k)
+        if result.tta_views:
+            extra["tta_views"] = result.tta_views
+        if roi:
+            extra["roi_box"] = result.roi_box
+        if keep_embedding:
+            extra["embedding_stored"] = True
+        if related and predicted_class_internal is not None:
+            extra["related_content"] = get_related_content(predicted_class_internal, related)
+
+        # Body respons disusun dari fragmen per kelas yang dibangun saat startup
+        return Response(
+            content=render_prediction(
+                predicted_class_internal,
+                predict_id,
+                timestamp,
+                model_version,
+                confidence,
+                extra,
+            ),
+            media_type="application/json",
+        )
+    except ImageTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Resolusi gambar terlalu besar. {e}",
+        )
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError:
+        raise_overloaded()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Terjadi kesalahan saat prediksi: %s", e)
+        raise HTTPException(
+            status_code=500, detail=f"Terjadi kesalahan pada server: {e}"
+        )
+
+
+# --- Mode tiling: beberapa daun dalam satu foto ---
+@app.post("/predict/tiles")
+async def predict_disease_tiles(
+    file: UploadFile = File(...),
+    grid: int = Query(TILE_GRID, ge=1, le=TILE_MAX_GRID, description="Jumlah tile pada sisi terpanjang gambar"),
+    related: int = Query(3, ge=0, le=RELATED_CONTENT_LIMIT, description="Jumlah tips/berita terkait yang disertakan di respons"),
+    image_width: int = Query(None, ge=1, le=4096, description="Lebar tampilan ilustrasi di aplikasi (piksel)"),
+    accept: str = Header(None),
+    request: Request = None,
+    user: dict = Depends(limit_predict),
+):
+    content_type = validate_upload(file)
+    # Tiling menjalankan banyak inferensi per request: dilepas lebih dulu saat overload
+    if load_shedder.level >= LEVEL_DEGRADED:
+        raise_overloaded()
+    started = time.perf_counter()
+    try:
+        image_bytes = await file.read()
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        entry, _ = registry.route(user.get("uid"))
+
+        # Semua tile berdaun diklasifikasi dalam satu batch di executor inferensi
+        result = await predict_flight.do(
+            ("tiles", image_hash, content_type, entry.version, grid),
+            inference_pool.run,
+            run_tiled_prediction,
+            image_bytes,
+            entry,
+            grid,
+            content_type,
+        )
+        predicted_class_internal = NAMA_KELAS[result.predicted_index] if result.recognized else None
+
+        predict_id = str(uuid.uuid4())
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        prediction_log.record(
+            {
                 "predict_id": predict_id,
                 "timestamp": timestamp,
-                "model_version": model_version,
-                "data": {
-                    "disease_id": predicted_class_internal,
-                    "nama_penyakit": informasi_detail["nama_penyakit"],
-                    "confidence": confidence,
-                    "confidence_str": f"{confidence:.2%}",
-                    "gejala": to_list(informasi_detail["gejala"]),
-                    "penyebab": informasi_detail["penyebab"],
-                    "solusi": to_list(informasi_detail["solusi"]),
-                    "image_url": f"https://appku.com/ilustrasi/{predicted_class_internal}.jpg",
-                },
-            },
+                "role": "tiles",
+                "model_version": entry.version,
+                "disease_id": predicted_class_internal,
+                "confidence": result.confidence,
+                "top_k": ambil_top_k(result.probabilities, 3),
+                "image_hash": image_hash,
+                "latency_ms": (time.perf_counter() - started) * 1000,
+            }
+        )
+
+        extra = {}
+        if predicted_class_internal is not None:
+            extra["image_url"] = illustrations.url_for(
+                predicted_class_internal, image_width, accept, str(request.base_url)
+            )
+        extra["summary"] = summarize_regions(result.regions)
+        extra["regions"] = result.regions
+        if related and predicted_class_internal is not None:
+            extra["related_content"] = get_related_content(predicted_class_internal, related)
+
+        return Response(
+            content=render_prediction(
+                predicted_class_internal,
+                predict_id,
+                timestamp,
+                entry.version,
+                result.confidence,
+                extra,
+            ),
+            media_type="application/json",
         )
+    except ImageTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Resolusi gambar terlalu besar. {e}",
+        )
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError:
+        raise_overloaded()
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Terjadi kesalahan saat prediksi: {e}")
+        logger.error("Terjadi kesalahan saat prediksi tiling: %s", e)
         raise HTTPException(
             status_code=500, detail=f"Terjadi kesalahan pada server: {e}"
         )
 
 
+def compare_shadow(shadow, model_input, predicted_class, log_entry):
+    """
+    Jalankan model kandidat pada input yang sama, catat kesesuaiannya,
+    dan simpan hasilnya ke log prediksi dengan role 'shadow'
+    """
+    try:
+        started = time.perf_counter()
+        probabilities = predict_probabilities(shadow.model, model_input, shadow.calibration)[0]
+        shadow_index = int(np.argmax(probabilities))
+        shadow_class = NAMA_KELAS[shadow_index]
+        outcome = "agree" if shadow_class == predicted_class else "disagree"
+        metrics.inc(f"model.shadow.{shadow.version}.{outcome}")
+
+        confidence = float(probabilities[shadow_index])
+        recognized = is_confident(shadow_index, confidence, shadow.calibration)
+        prediction_log.record(
+            {
+                **log_entry,
+                "role": "shadow",
+                "model_version": shadow.version,
+                "disease_id": shadow_class if recognized else None,
+                "confidence": confidence,
+                "top_k": ambil_top_k(probabilities, 3),
+                "latency_ms": (time.perf_counter() - started) * 1000,
+            }
+        )
+    except Exception as e:
+        logger.error("Shadow prediction gagal: %s", e)
+
+
+async def run_shadow(shadow, model_input, predicted_class, log_entry):
+    """
+    Jalankan compare_shadow di executor inferensi agar ikut antrian dan
+    pengukuran load shedder. Dilewati bila server sudah mulai overload.
+    """
+    if load_shedder.level >= LEVEL_DEGRADED:
+        metrics.inc("model.shadow.skipped")
+        return
+    try:
+        await inference_pool.run(compare_shadow, shadow, model_input, predicted_class, log_entry)
+    except QueueFullError:
+        metrics.inc("model.shadow.skipped")
+
+
+# --- Job prediksi asinkron: upload dibalas segera, hasil diambil dengan polling/callback ---
+async def process_job_batch(jobs):
+    """
+    Jalankan satu batch job dengan satu panggilan model aktif. Mengembalikan
+    list (status, body hasil, error) per job, atau None bila executor
+    inferensi penuh sehingga job dikembalikan ke antrian.
+    """
+    entry = registry.active
+    try:
+        results = await inference_pool.run(
+            run_batch_prediction, [(job.image, job.content_type) for job in jobs], entry
+        )
+    except QueueFullError:
+        return None
+
+    outcomes = []
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            outcomes.append((JOB_FAILED, None, str(result)))
+            continue
+        predicted_class_internal = NAMA_KELAS[result.predicted_index] if result.recognized else None
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        prediction_log.record(
+            {
+                "predict_id": job.job_id,
+                "timestamp": timestamp,
+                "role": "job",
+                "model_version": entry.version,
+                "disease_id": predicted_class_internal,
+                "confidence": result.confidence,
+                "top_k": ambil_top_k(result.probabilities, 3),
+                "image_hash": hashlib.sha256(job.image).hexdigest(),
+            }
+        )
+        extra = {}
+        if predicted_class_internal is not None:
+            extra["image_url"] = illustrations.url_for(
+                predicted_class_internal, base_url=job.options.get("base_url")
+            )
+        if job.options.get("top_k"):
+            extra["top_k"] = ambil_top_k(result.probabilities, job.options["top_k"])
+        related = job.options.get("related", 0)
+        if related and predicted_class_internal is not None:
+            extra["related_content"] = get_related_content(predicted_class_internal, related)
+        body = render_prediction(
+            predicted_class_internal, job.job_id, timestamp, entry.version, result.confidence, extra
+        )
+        outcomes.append((JOB_DONE, body.decode("utf-8"), None))
+    return outcomes
+
+
+# Job ditahan selama server dalam mode degradasi agar prediksi interaktif
+# didahulukan, dan tidak diambil lagi selama worker dikuras watchdog memori
+prediction_jobs = JobRunner(
+    process_job_batch,
+    paused=lambda: load_shedder.level >= LEVEL_DEGRADED or memory_watchdog.draining,
+)
+
+
+@app.post("/predict/jobs", status_code=202)
+async def create_prediction_job(
+    file: UploadFile = File(...),
+    top_k: int = Query(0, ge=0, le=MAX_TOP_K, description="Jumlah kelas teratas yang disertakan di hasil"),
+    related: int = Query(3, ge=0, le=RELATED_CONTENT_LIMIT, description="Jumlah tips/berita terkait yang disertakan di hasil"),
+    callback_url: str = Query(None, description="URL yang menerima POST hasil job setelah selesai"),
+    request: Request = None,
+    user: dict = Depends(limit_predict),
+):
+    if not prediction_jobs.enabled:
+        raise HTTPException(status_code=400, detail="Job prediksi dinonaktifkan (JOB_DB_PATH)")
+    content_type = validate_upload(file)
+    if callback_url:
+        try:
+            await validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    job_id = str(uuid.uuid4())
+    image_bytes = await file.read()
+    try:
+        await prediction_jobs.submit(
+            job_id,
+            user.get("uid", ""),
+            image_bytes,
+            content_type,
+            {"top_k": top_k, "related": related, "base_url": str(request.base_url)},
+            callback_url,
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return {
+        "status": "success",
+        "data": {"job_id": job_id, "status": "queued", "poll_url": f"/predict/jobs/{job_id}"},
+    }
+
+
+@app.get("/predict/jobs/{job_id}")
+async def get_prediction_job(job_id: str, user: dict = Depends(verify_firebase_token)):
+    if not prediction_jobs.enabled:
+        raise HTTPException(status_code=400, detail="Job prediksi dinonaktifkan (JOB_DB_PATH)")
+    job = await prediction_jobs.get(job_id)
+    # Job milik pengguna lain diperlakukan seperti tidak ada
+    if job is None or job["owner"] != user.get("uid", ""):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} tidak ditemukan")
+    return {
+        "status": "success",
+        "data": {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "created_at": datetime.utcfromtimestamp(job["created_at"]).isoformat() + "Z",
+            "updated_at": datetime.utcfromtimestamp(job["updated_at"]).isoformat() + "Z",
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "callback_status": job["callback_status"],
+        },
+    }
+
+
+# Endpoint untuk mencari kasus terdiagnosis yang paling mirip dengan satu prediksi
+@app.get("/predict/{predict_id}/similar")
+async def get_similar_cases(
+    predict_id: str,
+    k: int = Query(5, ge=1, le=50, description="Jumlah kasus serupa"),
+    user: dict = Depends(verify_firebase_token),
+):
+    # Bisa membaca ids.txt milik worker lain; jangan blokir event loop
+    vector = await asyncio.to_thread(embedding_index.vector_of, predict_id)
+    if vector is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Embedding untuk prediksi {predict_id} tidak ditemukan",
+        )
+
+    neighbours = await asyncio.to_thread(
+        embedding_index.search, vector, k, predict_id
+    )
+    return {
+        "status": "success",
+        "predict_id": predict_id,
+        "data": [
+            {
+                "predict_id": neighbour_id,
+                "disease_id": NAMA_KELAS[label] if label >= 0 else None,
+                "similarity": round(score, 4),
+            }
+            for neighbour_id, label, score in neighbours
+        ],
+        "total": len(neighbours),
+    }
+
+
+# --- ADMIN: REGISTRY MODEL ---
+@app.get("/admin/models")
+def get_models(admin: dict = Depends(verify_admin)):
+    return {"status": "success", "data": registry.status()}
+
+
+@app.post("/admin/models/load")
+async def load_model_version(
+    version: str = Query(..., description="Label versi model, mis. '2.1.0'"),
+    path: str = Query(..., description="Lokasi file model (.keras)"),
+    activate: bool = Query(False, description="Langsung aktifkan setelah warm-up"),
+    admin: dict = Depends(verify_admin),
+):
+    """Muat dan warm-up model baru di thread terpisah tanpa menghentikan request lain"""
+    try:
+        await asyncio.to_thread(registry.load, version, path)
+    except Exception as e:
+        logger.error("Gagal memuat model %s: %s", version, e)
+        raise HTTPException(status_code=400, detail=f"Gagal memuat model: {e}")
+    if activate:
+        registry.activate(version)
+    return {"status": "success", "data": registry.status()}
+
+
+@app.post("/admin/models/{version}/activate")
+def activate_model_version(version: str, admin: dict = Depends(verify_admin)):
+    try:
+        registry.activate(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return {"status": "success", "data": registry.status()}
+
+
+@app.post("/admin/models/{version}/candidate")
+def set_candidate_model(
+    version: str,
+    traffic: float = Query(..., ge=0, le=100, description="Persentase trafik ke kandidat"),
+    mode: str = Query("ab", description=f"Mode routing: {', '.join(ROUTING_MODES)}"),
+    admin: dict = Depends(verify_admin),
+):
+    try:
+        registry.set_candidate(version, traffic, mode)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "data": registry.status()}
+
+
+@app.delete("/admin/models/candidate")
+def clear_candidate_model(admin: dict = Depends(verify_admin)):
+    registry.clear_candidate()
+    return {"status": "success", "data": registry.status()}
+
+
+@app.delete("/admin/models/{version}")
+def unload_model_version(version: str, admin: dict = Depends(verify_admin)):
+    try:
+        registry.unload(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "data": registry.status()}
+
+
 # --- UNIFIED CONTENT ENDPOINTS ---
 # Endpoint untuk listing/browsing konten dengan filter dasar
 @app.get("/api/content")
@@ -298,7 +890,7 @@ async def get_content_list(
         }
     
     except Exception as e:
-        logger.error(f"Error getting content list: {e}")
+        logger.error("Error getting content list: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Terjadi kesalahan server: {str(e)}"
@@ -310,7 +902,8 @@ async def get_content_list(
 async def search_content(
     q: str = Query(..., min_length=2, max_length=100, description="Kata kunci pencarian"),
     type: str = Query(None, description="Filter berdasarkan tipe konten: 'berita' atau 'tip'"),
-    category: str = Query(None, description="Filter berdasarkan kategori")
+    category: str = Query(None, description="Filter berdasarkan kategori"),
+    fuzzy: bool = Query(True, description="Sertakan hasil pencarian toleran salah ketik")
 ):
     """Endpoint dedicated untuk search konten berdasarkan keyword (untuk search bar)"""
     try:
@@ -321,11 +914,15 @@ async def search_content(
                 detail="Parameter 'type' harus berupa 'berita' atau 'tip'"
             )
         
-        # Lakukan search dengan keyword
-        search_results = get_content_with_filters(
-            content_type=type,
-            category=category,
-            search=q
+        # Lakukan search dengan keyword; query identik yang bersamaan digabung
+        search_results, match = await content_flight.do(
+            ("search", q, type, category, fuzzy),
+            asyncio.to_thread,
+            search_with_fallback,
+            q,
+            type,
+            category,
+            fuzzy,
         )
         
         if not search_results:
@@ -334,7 +931,8 @@ async def search_content(
                 "message": f"Tidak ada konten yang ditemukan dengan kata kunci '{q}'",
                 "data": [],
                 "total": 0,
-                "search_query": q
+                "search_query": q,
+                "match": match
             }
         
         return {
@@ -342,6 +940,7 @@ async def search_content(
             "data": search_results,
             "total": len(search_results),
             "search_query": q,
+            "match": match,
             "filters_applied": {
                 "type": type,
                 "category": category
@@ -349,13 +948,53 @@ async def search_content(
         }
     
     except Exception as e:
-        logger.error(f"Error searching content: {e}")
+        logger.error("Error searching content: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Terjadi kesalahan server: {str(e)}"
         )
 
 
+# Endpoint jumlah konten per type/kategori (untuk badge tab dan filter)
+@app.get("/api/content/facets")
+async def get_content_facet_counts(
+    q: str = Query(None, min_length=2, max_length=100, description="Batasi hitungan pada hasil pencarian"),
+    fuzzy: bool = Query(True, description="Sertakan hasil pencarian toleran salah ketik")
+):
+    facets, match = get_content_facets(q, fuzzy)
+    response = {"status": "success", "data": facets}
+    if q:
+        response["search_query"] = q
+        response["match"] = match
+    return response
+
+
+# Endpoint statistik konten untuk debugging/monitoring
+@app.get("/api/content/stats")
+async def get_content_stats():
+    return {"status": "success", "data": get_content_statistics()}
+
+
+# Endpoint untuk tips/berita terkait satu penyakit (didaftarkan sebelum route detail)
+@app.get("/api/content/related/{disease_id}")
+def get_related_content_list(
+    disease_id: str,
+    limit: int = Query(RELATED_CONTENT_LIMIT, ge=1, le=RELATED_CONTENT_LIMIT, description="Jumlah konten terkait"),
+):
+    if disease_id not in NAMA_KELAS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Penyakit dengan ID '{disease_id}' tidak ditemukan"
+        )
+    related_content = get_related_content(disease_id, limit)
+    return {
+        "status": "success",
+        "disease_id": disease_id,
+        "data": related_content,
+        "total": len(related_content),
+    }
+
+
 # Endpoint untuk mendapatkan detail konten berdasarkan ID dan tipe
 @app.get("/api/content/{content_type}/{content_id}")
 async def get_unified_content_detail(content_type: str, content_id: int):
@@ -385,8 +1024,161 @@ async def get_unified_content_detail(content_type: str, content_id: int):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting content detail: {e}")
+        logger.error("Error getting content detail: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Terjadi kesalahan server: {str(e)}"
         )
+
+
+# --- MEDIA: THUMBNAIL GAMBAR KONTEN ---
+THUMB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@app.get("/media/thumb")
+async def get_thumbnail(
+    type: str = Query(..., description="Tipe konten: 'berita' atau 'tip'"),
+    id: int = Query(..., description="ID konten"),
+    w: int = Query(320, ge=1, le=4096, description="Lebar yang diinginkan, dibulatkan ke lebar thumbnail tetap"),
+    format: str = Query(None, description="'webp' atau 'jpeg'; default mengikuti header Accept"),
+    accept: str = Header(None),
+    if_none_match: str = Header(None),
+):
+    """Thumbnail imageUrl sebuah konten dalam lebar dan format tetap"""
+    if type not in VALID_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail="Parameter 'type' harus berupa 'berita' atau 'tip'"
+        )
+    if format is None:
+        format = "webp" if accept and "image/webp" in accept else "jpeg"
+    elif format not in THUMB_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format tidak valid. Pilihan: {', '.join(THUMB_FORMATS)}"
+        )
+
+    content = get_content_by_id(id, type)
+    if not content or not content.get("imageUrl"):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Gambar untuk konten {type} dengan ID {id} tidak ditemukan"
+        )
+
+    url = content["imageUrl"]
+    width = snap_width(w)
+    headers = {"Cache-Control": THUMB_CACHE_CONTROL, "Vary": "Accept"}
+    path = thumbnails.cache.get(url, width, format)
+    if path is None:
+        metrics.inc("thumb.cache_miss")
+        try:
+            variants = await thumb_flight.do(("thumb", url), thumbnails.generate, url)
+        except SourceImageError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        path = thumbnails.cache.get(url, width, format)
+        if path is None:
+            # Cache nonaktif: kirim langsung dari memori
+            return Response(variants[(width, format)], media_type=THUMB_FORMATS[format][1], headers=headers)
+    else:
+        metrics.inc("thumb.cache_hit")
+
+    # Nama file adalah digest isi, sehingga cocok dipakai sebagai ETag
+    etag = '"' + os.path.basename(path).split(".")[0] + '"'
+    headers["ETag"] = etag
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=THUMB_FORMATS[format][1], headers=headers)
+
+
+# --- MEDIA: ILUSTRASI PENYAKIT ---
+@app.get("/ilustrasi/{disease_id}")
+def get_illustration(
+    disease_id: str,
+    w: int = Query(None, ge=1, le=4096, description="Lebar yang diinginkan, dibulatkan ke lebar tetap"),
+    format: str = Query(None, description="'webp' atau 'jpeg'; default mengikuti header Accept"),
+    accept: str = Header(None),
+    if_none_match: str = Header(None),
+):
+    if format is not None and format not in THUMB_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format tidak valid. Pilihan: {', '.join(THUMB_FORMATS)}"
+        )
+    illustration = illustrations.select(disease_id, w, accept, format)
+    if illustration is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Ilustrasi untuk '{disease_id}' tidak ditemukan"
+        )
+    headers = {"Cache-Control": THUMB_CACHE_CONTROL, "ETag": illustration.etag, "Vary": "Accept"}
+    if if_none_match == illustration.etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(illustration.path, media_type=illustration.media_type, headers=headers)
+
+
+# --- ADMIN: PUBLIKASI KONTEN ---
+# Endpoint untuk menambah/mengubah satu konten tanpa membangun ulang index
+@app.put("/admin/content/{content_type}")
+def publish_content_item(
+    content_type: str,
+    item: dict = Body(..., description="Item konten dengan skema berita/tip"),
+    admin: dict = Depends(verify_admin),
+):
+    if content_type not in VALID_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail="Parameter 'content_type' harus berupa 'berita' atau 'tip'"
+        )
+    if not item.get("title"):
+        raise HTTPException(status_code=400, detail="Field 'title' wajib diisi")
+    try:
+        published = publish_content(item, content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"status": "success", "data": published}
+
+
+@app.delete("/admin/content/{content_type}/{content_id}")
+def delete_content_item(content_type: str, content_id: int, admin: dict = Depends(verify_admin)):
+    if not delete_content(content_id, content_type):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Konten {content_type} dengan ID {content_id} tidak ditemukan"
+        )
+    return {"status": "success"}
+
+
+# --- ADMIN: INGESTION BERITA ---
+@app.post("/admin/news/refresh")
+async def refresh_news(admin: dict = Depends(verify_admin)):
+    if not news_ingester.enabled:
+        raise HTTPException(
+            status_code=400,
+            detail="Sumber berita belum dikonfigurasi (NEWS_SOURCES)"
+        )
+    return {"status": "success", "data": await news_ingester.refresh()}
+
+
+# --- ADMIN: PROFILING ---
+@app.post("/admin/profile")
+async def run_profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS, description="Lama sesi profiling (detik)"),
+    interval_ms: float = Query(5, ge=PROFILE_MIN_INTERVAL_MS, le=1000, description="Interval sampling (ms)"),
+    mode: str = Query("cpu", description="'cpu' (SIGPROF, waktu CPU) atau 'wall' (waktu dinding)"),
+    memory: bool = Query(False, description="Sertakan diff snapshot tracemalloc"),
+    tf_trace: bool = Query(False, description="Rekam trace TensorFlow profiler"),
+    output: str = Query("json", description="'json' atau 'collapsed' (teks untuk flamegraph)"),
+    admin: dict = Depends(verify_admin),
+):
+    """Sampling stack worker ini selama beberapa detik sementara request lain tetap dilayani"""
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"Mode harus salah satu dari {list(PROFILE_MODES)}")
+    if output not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="Output harus 'json' atau 'collapsed'")
+    try:
+        result = await profiler.run(seconds, interval_ms / 1000, mode, memory, tf_trace)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if output == "collapsed":
+        return Response(result["collapsed"] + "\n", media_type="text/plain; charset=utf-8")
+    return {"status": "success", "data": result}
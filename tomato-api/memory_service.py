@@ -0,0 +1,213 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import resource
+import signal
+import sys
+import time
+import tracemalloc
+
+import metrics_service as metrics
+
+logger = logging.getLogger(__name__)
+
+# Catat puncak alokasi per stage dengan tracemalloc (menambah overhead alokasi)
+MEMORY_TRACK_STAGES = os.getenv("MEMORY_TRACK_STAGES", "false").lower() in ("1", "true", "yes")
+# Batas RSS worker dalam MB; 0 = watchdog hanya mengisi metrik
+MEMORY_RSS_LIMIT_MB = float(os.getenv("MEMORY_RSS_LIMIT_MB", 0))
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", 15))
+# Waktu maksimal menunggu prediksi yang sedang berjalan sebelum worker dihentikan
+MEMORY_DRAIN_TIMEOUT = float(os.getenv("MEMORY_DRAIN_TIMEOUT", 30))
+# Apakah ada supervisor yang menjalankan ulang worker setelah SIGTERM:
+# 'auto' (deteksi worker gunicorn), 'true' (mis. container dengan restart
+# policy), atau 'false'. Tanpa supervisor, batas RSS diabaikan.
+MEMORY_SUPERVISED = os.getenv("MEMORY_SUPERVISED", "auto").lower()
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [
+        (name, ctypes.c_size_t)
+        for name in (
+            "arena", "ordblks", "smblks", "hblks", "hblkhd",
+            "usmblks", "fsmblks", "uordblks", "fordblks", "keepcost",
+        )
+    ]
+
+
+def _load_libc():
+    path = ctypes.util.find_library("c")
+    if path is None:
+        return None
+    try:
+        libc = ctypes.CDLL(path)
+    except OSError:
+        return None
+    # mallinfo2 hanya ada di glibc >= 2.33; allocator lain tidak didukung
+    if not hasattr(libc, "mallinfo2"):
+        return None
+    libc.mallinfo2.restype = _MallInfo2
+    return libc
+
+
+_libc = _load_libc()
+
+
+def read_rss():
+    """
+    Resident set size proses saat ini (bytes), dari /proc/self/statm bila
+    tersedia, selain itu puncak RSS dari getrusage
+    """
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def read_arena():
+    """
+    Statistik heap glibc (bytes), atau None bila mallinfo2 tidak tersedia
+    """
+    if _libc is None:
+        return None
+    info = _libc.mallinfo2()
+    return {
+        "arena": info.arena,
+        "mmap": info.hblkhd,
+        "in_use": info.uordblks,
+        "free": info.fordblks,
+    }
+
+
+def malloc_trim():
+    """
+    Kembalikan memori bebas di heap glibc ke sistem operasi
+    """
+    if _libc is not None and hasattr(_libc, "malloc_trim"):
+        _libc.malloc_trim(0)
+
+
+def update_gauges():
+    """
+    Perbarui gauge memori di /metrics dan kembalikan RSS saat ini
+    """
+    rss = read_rss()
+    metrics.set_gauge("memory.rss_bytes", rss)
+    arena = read_arena()
+    if arena is not None:
+        for name, value in arena.items():
+            metrics.set_gauge(f"memory.arena.{name}_bytes", value)
+    if tracemalloc.is_tracing():
+        current, _ = tracemalloc.get_traced_memory()
+        metrics.set_gauge("memory.traced_bytes", current)
+    return rss
+
+
+def _parent_is_gunicorn():
+    try:
+        with open(f"/proc/{os.getppid()}/cmdline", "rb") as f:
+            return b"gunicorn" in f.read()
+    except OSError:
+        return False
+
+
+def has_supervisor(setting=MEMORY_SUPERVISED):
+    """
+    True bila worker ini akan dijalankan ulang setelah berhenti sendiri.
+    Uvicorn proses tunggal tidak punya supervisor: SIGTERM mematikan server.
+    """
+    if setting in ("1", "true", "yes"):
+        return True
+    if setting in ("0", "false", "no"):
+        return False
+    return "gunicorn" in sys.modules or _parent_is_gunicorn()
+
+
+def start_stage_tracking():
+    if MEMORY_TRACK_STAGES and not tracemalloc.is_tracing():
+        tracemalloc.start(1)
+        logger.info("Pelacakan alokasi per stage aktif (tracemalloc)")
+
+
+class MemoryWatchdog:
+    """
+    Task background yang memantau RSS worker. Bila RSS melewati batas dan
+    tetap di atas batas setelah malloc_trim, worker berhenti menerima
+    prediksi baru (draining), menunggu prediksi yang sedang berjalan selesai,
+    lalu mengirim SIGTERM ke dirinya sendiri agar supervisor (arbiter
+    gunicorn) menggantinya dengan worker baru secara graceful. Tanpa
+    supervisor (lihat has_supervisor) watchdog hanya mengisi metrik.
+    """
+
+    def __init__(
+        self,
+        in_flight,
+        limit_mb=MEMORY_RSS_LIMIT_MB,
+        interval=MEMORY_CHECK_INTERVAL,
+        drain_timeout=MEMORY_DRAIN_TIMEOUT,
+        supervised=None,
+    ):
+        self.in_flight = in_flight
+        self.limit_bytes = limit_mb * 1024 * 1024
+        self.interval = interval
+        self.drain_timeout = drain_timeout
+        self.supervised = supervised
+        self.draining = False
+        self._task = None
+
+    def start(self):
+        start_stage_tracking()
+        update_gauges()
+        if self.supervised is None:
+            self.supervised = has_supervisor()
+        if self.limit_bytes and not self.supervised:
+            logger.warning(
+                "MEMORY_RSS_LIMIT_MB diabaikan: tidak ada supervisor yang menjalankan ulang worker "
+                "(jalankan lewat gunicorn atau set MEMORY_SUPERVISED=true)"
+            )
+            self.limit_bytes = 0
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def over_limit(self):
+        if not self.limit_bytes:
+            return False
+        if update_gauges() <= self.limit_bytes:
+            return False
+        malloc_trim()
+        metrics.inc("memory.trim")
+        return update_gauges() > self.limit_bytes
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.over_limit():
+                await self.recycle()
+                return
+
+    async def recycle(self):
+        self.draining = True
+        metrics.inc("memory.recycle")
+        metrics.set_gauge("memory.draining", 1)
+        logger.warning(
+            "RSS %.0f MB melewati batas %.0f MB, worker berhenti menerima prediksi dan akan dimulai ulang",
+            read_rss() / 1024 / 1024,
+            self.limit_bytes / 1024 / 1024,
+        )
+        deadline = time.monotonic() + self.drain_timeout
+        while self.in_flight() > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        os.kill(os.getpid(), signal.SIGTERM)
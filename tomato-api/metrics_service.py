@@ -0,0 +1,113 @@
+import contextvars
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Penyimpanan metrik in-process (per worker). Sengaja dibuat sederhana:
+# counter, gauge, dan ringkasan durasi (count/total/max) per nama metrik.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+
+# Durasi stage milik request yang sedang berjalan (dict nama -> ms), diisi
+# oleh stage() dan dibaca oleh access log. asyncio.to_thread menyalin
+# context, sehingga stage di thread pool tetap tercatat ke request asalnya.
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+def inc(name, value=1):
+    """
+    Tambah nilai counter dengan nama tertentu
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    """
+    Set nilai gauge (nilai terakhir yang menang)
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def set_max(name, value):
+    """
+    Set gauge bila nilai baru lebih besar (mis. puncak alokasi)
+    """
+    with _lock:
+        if value > _gauges.get(name, value - 1):
+            _gauges[name] = value
+
+
+def observe(name, seconds):
+    """
+    Catat satu observasi durasi (dalam detik) untuk metrik tertentu
+    """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+
+@contextmanager
+def stage(name):
+    """
+    Context manager untuk mengukur durasi satu tahap pemrosesan. Bila
+    tracemalloc aktif, puncak alokasi Python/NumPy selama stage ikut dicatat
+    (perkiraan bila beberapa stage berjalan bersamaan).
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(f"stage.{name}", elapsed)
+        if tracing and tracemalloc.is_tracing():
+            set_max(f"memory.stage.{name}.peak_bytes", tracemalloc.get_traced_memory()[1] - baseline)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed * 1000
+
+
+def begin_request():
+    """
+    Mulai pencatatan durasi stage untuk request saat ini. Mengembalikan
+    dict stage yang akan terisi selama request berjalan.
+    """
+    stages = {}
+    _request_stages.set(stages)
+    return stages
+
+
+def snapshot():
+    """
+    Ambil salinan semua metrik untuk endpoint /metrics
+    """
+    with _lock:
+        timings = {
+            name: {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total / count * 1000, 3),
+                "max_ms": round(maximum * 1000, 3),
+            }
+            for name, (count, total, maximum) in _timings.items()
+        }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
@@ -0,0 +1,204 @@
+import logging
+import random
+import threading
+import time
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+import metrics_service as metrics
+from image_service import UKURAN_INPUT_MODEL
+from inference_service import load_calibration
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MODES = ("ab", "shadow")
+
+
+class ModelEntry(NamedTuple):
+    """Model yang sudah dimuat beserta kalibrasinya"""
+
+    version: str
+    path: str
+    model: object
+    calibration: object
+    loaded_at: float
+    embedder: object = None  # model dengan output (embedding, skor), opsional
+
+
+class Routing(NamedTuple):
+    """Snapshot routing yang dibaca sekali per request"""
+
+    active: ModelEntry
+    candidate: ModelEntry = None
+    traffic: float = 0.0  # persentase trafik 0-100 ke kandidat
+    mode: str = "ab"
+
+
+class ModelRegistry:
+    """
+    Registry beberapa versi model. Model baru dimuat dan di-warm-up di luar
+    jalur request, lalu diaktifkan dengan mengganti satu referensi Routing.
+    Request yang sedang berjalan tetap memakai entri yang sudah mereka ambil,
+    sehingga tidak ada request yang terputus saat hot-swap.
+    """
+
+    def __init__(self, loader, embedder_factory=None):
+        self._loader = loader
+        self._embedder_factory = embedder_factory
+        self._lock = threading.Lock()
+        self._models = {}
+        self._routing = None
+
+    def load(self, version, path):
+        """
+        Muat model dari path, jalankan warm-up, dan simpan sebagai versi tertentu
+        """
+        logger.info("Mencoba memuat model %s dari: %s", version, path)
+        start = time.perf_counter()
+        model = self._loader(path)
+        calibration = load_calibration(path)
+
+        # Warm-up: panggilan pertama membangun graph dan mengalokasikan buffer
+        dummy = np.zeros((1, *UKURAN_INPUT_MODEL, 3), dtype=np.float32)
+        model.predict(dummy, verbose=0)
+
+        embedder = None
+        if self._embedder_factory is not None:
+            try:
+                embedder = self._embedder_factory(model)
+                embedder.predict(dummy, verbose=0)
+            except Exception as e:
+                logger.warning("Embedding tidak tersedia untuk model %s: %s", version, e)
+                embedder = None
+
+        entry = ModelEntry(version, path, model, calibration, time.time(), embedder)
+        with self._lock:
+            self._models[version] = entry
+            # Memuat ulang versi yang sedang dipakai: routing ikut diarahkan ke entri baru
+            routing = self._routing
+            if routing is not None:
+                if routing.active.version == version:
+                    routing = routing._replace(active=entry)
+                if routing.candidate is not None and routing.candidate.version == version:
+                    routing = routing._replace(candidate=entry)
+                self._routing = routing
+        metrics.observe("model.load", time.perf_counter() - start)
+        logger.info("Model %s berhasil dimuat.", version)
+        return entry
+
+    def activate(self, version):
+        """
+        Jadikan versi tertentu sebagai model aktif (atomic swap)
+        """
+        with self._lock:
+            entry = self._get(version)
+            routing = self._routing
+            if routing is not None and routing.candidate is not None and routing.candidate.version != version:
+                self._routing = routing._replace(active=entry)
+            else:
+                self._routing = Routing(active=entry)
+        metrics.inc("model.activated")
+        logger.info("Model aktif sekarang versi %s.", version)
+
+    def set_candidate(self, version, traffic, mode="ab"):
+        """
+        Arahkan sebagian trafik ke model kandidat. Mode 'ab' melayani request
+        dengan kandidat, mode 'shadow' menjalankan kandidat di belakang layar
+        sementara respons tetap dari model aktif.
+        """
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Mode routing tidak valid. Pilihan: {', '.join(ROUTING_MODES)}")
+        if not 0 <= traffic <= 100:
+            raise ValueError("Persentase trafik harus di antara 0 dan 100")
+        with self._lock:
+            entry = self._get(version)
+            if self._routing is None:
+                raise ValueError("Belum ada model aktif")
+            if entry.version == self._routing.active.version:
+                raise ValueError("Kandidat tidak boleh sama dengan model aktif")
+            self._routing = self._routing._replace(candidate=entry, traffic=float(traffic), mode=mode)
+
+    def clear_candidate(self):
+        with self._lock:
+            if self._routing is not None:
+                self._routing = Routing(active=self._routing.active)
+
+    def unload(self, version):
+        """
+        Lepaskan model yang tidak sedang aktif maupun menjadi kandidat
+        """
+        with self._lock:
+            routing = self._routing
+            in_use = {routing.active.version} if routing else set()
+            if routing and routing.candidate is not None:
+                in_use.add(routing.candidate.version)
+            if version in in_use:
+                raise ValueError(f"Model {version} sedang dipakai dan tidak dapat dilepas")
+            self._get(version)
+            del self._models[version]
+
+    def route(self, key=None):
+        """
+        Pilih model untuk satu request. Mengembalikan tuple (primary, shadow):
+        primary melayani respons, shadow (opsional) dijalankan untuk pembanding.
+        Key (mis. uid) membuat pembagian trafik stabil per pengguna.
+        """
+        routing = self._routing
+        if routing is None:
+            raise RuntimeError("Model belum dimuat")
+        if routing.candidate is None or routing.traffic <= 0:
+            return routing.active, None
+
+        if key is None:
+            bucket = random.random() * 100
+        else:
+            bucket = zlib.crc32(key.encode("utf-8")) % 10000 / 100
+        if bucket >= routing.traffic:
+            return routing.active, None
+        if routing.mode == "shadow":
+            return routing.active, routing.candidate
+        return routing.candidate, None
+
+    def get(self, version):
+        """
+        Entry model yang sudah dimuat untuk versi tertentu, atau None
+        """
+        return self._models.get(version)
+
+    @property
+    def active(self):
+        routing = self._routing
+        return routing.active if routing else None
+
+    def status(self):
+        routing = self._routing
+        with self._lock:
+            models = [
+                {
+                    "version": entry.version,
+                    "path": entry.path,
+                    "loaded_at": _to_iso(entry.loaded_at),
+                    "temperature": entry.calibration.temperature,
+                    "embedding": entry.embedder is not None,
+                }
+                for entry in self._models.values()
+            ]
+        return {
+            "active": routing.active.version if routing else None,
+            "candidate": routing.candidate.version if routing and routing.candidate else None,
+            "traffic": routing.traffic if routing else 0.0,
+            "mode": routing.mode if routing else None,
+            "models": models,
+        }
+
+    def _get(self, version):
+        entry = self._models.get(version)
+        if entry is None:
+            raise KeyError(f"Model versi {version} belum dimuat")
+        return entry
+
+
+def _to_iso(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
@@ -0,0 +1,429 @@
+import asyncio
+import fcntl
+import html
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+import metrics_service as metrics
+from content_service import get_unified_content_data, publish_content, sync_published_content
+
+logger = logging.getLogger(__name__)
+
+# Sumber berita (RSS/Atom atau halaman artikel HTML), dipisah koma.
+# Kosongkan untuk menonaktifkan ingestion.
+NEWS_SOURCES = [url.strip() for url in os.getenv("NEWS_SOURCES", "").split(",") if url.strip()]
+NEWS_REFRESH_INTERVAL = float(os.getenv("NEWS_REFRESH_INTERVAL", 1800))
+NEWS_FETCH_TIMEOUT = float(os.getenv("NEWS_FETCH_TIMEOUT", 10))
+NEWS_MAX_CONNECTIONS = int(os.getenv("NEWS_MAX_CONNECTIONS", 10))
+NEWS_PER_HOST_CONCURRENCY = int(os.getenv("NEWS_PER_HOST_CONCURRENCY", 2))
+NEWS_MAX_BYTES = int(os.getenv("NEWS_MAX_BYTES", 2 * 1024 * 1024))
+NEWS_DEFAULT_CATEGORY = os.getenv("NEWS_DEFAULT_CATEGORY", "Budidaya")
+# File kunci leader: hanya satu worker (pemegang kunci) yang menjalankan
+# ingestion berkala; hasilnya sampai ke worker lain lewat content_store
+NEWS_LEADER_LOCK = os.getenv("NEWS_LEADER_LOCK", "data/news_ingest.lock")
+
+_USER_AGENT = "tomato-api-news/1.0"
+_DESCRIPTION_LENGTH = 200
+
+# Kategori ditebak dari kata kunci di judul dan isi; urutan menentukan prioritas
+KATEGORI_KATA_KUNCI = (
+    ("Hama & Penyakit", ("hama", "penyakit", "virus", "jamur", "hawar", "layu", "tungau", "kutu")),
+    ("Pasar & Harga", ("harga", "pasar", "deflasi", "inflasi", "ekspor")),
+    ("Inovasi & Teknologi", ("teknologi", "inovasi", "aplikasi", "digital", "riset")),
+)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def clean_text(text):
+    """
+    Hapus tag HTML dan entity, rapikan spasi
+    """
+    if not text:
+        return ""
+    return _SPACE_RE.sub(" ", html.unescape(_TAG_RE.sub(" ", text))).strip()
+
+
+def to_iso(value):
+    """
+    Ubah tanggal RFC 822 (RSS) atau ISO 8601 (Atom/HTML) ke format publishedAt
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def guess_category(title, content):
+    text = f"{title} {content}".lower()
+    for category, keywords in KATEGORI_KATA_KUNCI:
+        if any(keyword in text for keyword in keywords):
+            return category
+    return NEWS_DEFAULT_CATEGORY
+
+
+def make_item(title, url, description, content, image_url, published_at, source):
+    """
+    Susun artikel ke skema item berita yang sama dengan news_service
+    """
+    title = clean_text(title)
+    content = clean_text(content) or clean_text(description)
+    description = clean_text(description) or content
+    if len(description) > _DESCRIPTION_LENGTH:
+        description = description[:_DESCRIPTION_LENGTH].rsplit(" ", 1)[0] + "..."
+    return {
+        "title": title,
+        "description": description,
+        "url": url,
+        "imageUrl": image_url,
+        "publishedAt": to_iso(published_at) or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "source": clean_text(source) or urlsplit(url).hostname,
+        "content": content,
+        "category": guess_category(title, content),
+    }
+
+
+def _local(tag):
+    # "{namespace}nama" -> "nama"
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(element, *names):
+    for child in element:
+        if _local(child.tag) in names:
+            return child
+    return None
+
+
+def _child_text(element, *names):
+    child = _child(element, *names)
+    return child.text if child is not None and child.text else ""
+
+
+def _image_of(entry):
+    # enclosure / media:content / media:thumbnail bergambar
+    for child in entry:
+        name = _local(child.tag)
+        url = child.get("url")
+        if not url:
+            continue
+        if name == "enclosure" and not (child.get("type") or "image/").startswith("image/"):
+            continue
+        if name in ("enclosure", "content", "thumbnail"):
+            return url
+    return None
+
+
+def parse_feed(body, base_url):
+    """
+    Parse RSS 2.0 atau Atom menjadi list item berita
+    """
+    root = ET.fromstring(body)
+    channel = _child(root, "channel")
+    if channel is not None:
+        source = _child_text(channel, "title")
+        entries = [child for child in channel if _local(child.tag) == "item"]
+    else:
+        source = _child_text(root, "title")
+        entries = [child for child in root if _local(child.tag) == "entry"]
+
+    items = []
+    for entry in entries:
+        link = _child_text(entry, "link").strip()
+        if not link:
+            # Atom: <link href="..."/>
+            link_element = _child(entry, "link")
+            link = link_element.get("href", "") if link_element is not None else ""
+        if not link:
+            continue
+        items.append(
+            make_item(
+                title=_child_text(entry, "title"),
+                url=urljoin(base_url, link),
+                description=_child_text(entry, "description", "summary"),
+                content=_child_text(entry, "encoded", "content"),
+                image_url=_image_of(entry),
+                published_at=_child_text(entry, "pubDate", "published", "updated", "date"),
+                source=source,
+            )
+        )
+    return items
+
+
+class _ArticleParser(HTMLParser):
+    """Ambil meta Open Graph, judul, dan teks paragraf dari halaman artikel"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.title = ""
+        self.paragraphs = []
+        self._in_title = False
+        self._paragraph = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "meta":
+            key = attrs.get("property") or attrs.get("name")
+            if key and attrs.get("content"):
+                self.meta.setdefault(key.lower(), attrs["content"])
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "p":
+            self._paragraph = []
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "p" and self._paragraph is not None:
+            text = clean_text("".join(self._paragraph))
+            if text:
+                self.paragraphs.append(text)
+            self._paragraph = None
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif self._paragraph is not None:
+            self._paragraph.append(data)
+
+
+def parse_article(body, url):
+    """
+    Parse satu halaman artikel HTML menjadi item berita
+    """
+    parser = _ArticleParser()
+    parser.feed(body)
+    meta = parser.meta
+    title = meta.get("og:title") or parser.title
+    if not clean_text(title):
+        return []
+    return [
+        make_item(
+            title=title,
+            url=meta.get("og:url") or url,
+            description=meta.get("og:description") or meta.get("description", ""),
+            content=" ".join(parser.paragraphs),
+            image_url=meta.get("og:image"),
+            published_at=meta.get("article:published_time"),
+            source=meta.get("og:site_name"),
+        )
+    ]
+
+
+def parse_document(body, url, content_type=""):
+    if "html" in content_type or body.lstrip()[:15].lower().startswith(("<!doctype html", "<html")):
+        return parse_article(body, url)
+    return parse_feed(body, url)
+
+
+class NewsIngester:
+    """
+    Pengambil berita berkala dari sumber RSS/Atom/HTML. Memakai satu
+    httpx.AsyncClient (connection pool bersama) dengan batas koneksi per
+    host, request kondisional (ETag/Last-Modified), dan timeout. Artikel
+    baru (berdasarkan URL) dipublikasikan ke index konten di thread
+    terpisah agar event loop tidak terblokir. Ingestion berkala hanya
+    berjalan di worker yang memegang kunci leader; bila worker itu mati,
+    kunci dilepas OS dan worker lain mengambil alih pada interval berikutnya.
+    """
+
+    def __init__(
+        self,
+        sources=NEWS_SOURCES,
+        interval=NEWS_REFRESH_INTERVAL,
+        timeout=NEWS_FETCH_TIMEOUT,
+        max_connections=NEWS_MAX_CONNECTIONS,
+        per_host=NEWS_PER_HOST_CONCURRENCY,
+        max_bytes=NEWS_MAX_BYTES,
+        leader_lock=NEWS_LEADER_LOCK,
+    ):
+        self.sources = list(sources)
+        self.interval = interval
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+        self._client = None
+        self._host_limits = {}
+        self._validators = {}  # url -> header kondisional dari respons terakhir
+        self._task = None
+        self.leader_lock = leader_lock
+        self._leader_fd = None
+
+    @property
+    def enabled(self):
+        return bool(self.sources)
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={"User-Agent": _USER_AGENT},
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def fetch(self, url):
+        """
+        Ambil satu sumber. Mengembalikan (body, content_type), atau None bila
+        sumber tidak berubah sejak pengambilan terakhir (304).
+        """
+        headers = self._validators.get(url, {})
+        async with self._host_limit(url):
+            start = time.perf_counter()
+            async with self._get_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    metrics.inc("news.not_modified")
+                    return None
+                response.raise_for_status()
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"Respons lebih besar dari {self.max_bytes} byte")
+                    chunks.append(chunk)
+                metrics.observe("news.fetch", time.perf_counter() - start)
+
+                validators = {}
+                if response.headers.get("etag"):
+                    validators["If-None-Match"] = response.headers["etag"]
+                if response.headers.get("last-modified"):
+                    validators["If-Modified-Since"] = response.headers["last-modified"]
+                self._validators[url] = validators
+                body = b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+                return body, response.headers.get("content-type", "")
+
+    async def _fetch_items(self, url):
+        # Semua error ditangkap per sumber (mis. httpx.InvalidURL bukan
+        # turunan HTTPError) agar satu sumber rusak tidak menggagalkan yang lain
+        try:
+            fetched = await self.fetch(url)
+        except Exception as e:
+            metrics.inc("news.fetch_failed")
+            logger.warning("Gagal mengambil sumber berita %s: %s", url, e)
+            return []
+        if fetched is None:
+            return []
+        body, content_type = fetched
+        try:
+            return parse_document(body, str(url), content_type)
+        except Exception as e:
+            metrics.inc("news.parse_failed")
+            logger.warning("Gagal mem-parse sumber berita %s: %s", url, e)
+            return []
+
+    async def refresh(self):
+        """
+        Ambil semua sumber secara bersamaan lalu publikasikan artikel yang
+        URL-nya belum ada di korpus. Mengembalikan ringkasan hasil.
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._fetch_items(url) for url in self.sources))
+        items = [item for source_items in results for item in source_items]
+        published = await asyncio.to_thread(self._publish_new, items)
+        metrics.inc("news.published", published)
+        metrics.observe("news.refresh", time.perf_counter() - start)
+        return {"sources": len(self.sources), "fetched": len(items), "published": published}
+
+    def _publish_new(self, items):
+        # Artikel yang baru dipublikasikan worker lain ikut dihitung sebagai dikenal
+        sync_published_content()
+        known = {content.get("url") for content in get_unified_content_data() if content["type"] == "berita"}
+        published = 0
+        for item in items:
+            if not item["title"] or item["url"] in known:
+                continue
+            publish_content(item, "berita")
+            known.add(item["url"])
+            published += 1
+        return published
+
+    def _try_lead(self):
+        """
+        Ambil kunci leader tanpa menunggu. Kunci fcntl dilepas otomatis bila
+        proses pemegangnya mati. Mengembalikan True bila worker ini leader.
+        """
+        if self._leader_fd is not None:
+            return True
+        directory = os.path.dirname(self.leader_lock)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.leader_lock, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        metrics.set_gauge("news.leader", 1)
+        logger.info("Worker %s menjadi leader ingestion berita", os.getpid())
+        return True
+
+    def _release_leadership(self):
+        if self._leader_fd is not None:
+            fcntl.lockf(self._leader_fd, fcntl.LOCK_UN)
+            os.close(self._leader_fd)
+            self._leader_fd = None
+            metrics.set_gauge("news.leader", 0)
+
+    async def _run(self):
+        while True:
+            try:
+                if self._try_lead():
+                    summary = await self.refresh()
+                    logger.info("Ingestion berita selesai: %s", summary)
+            except Exception as e:
+                logger.error("Ingestion berita gagal: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        Jalankan refresh berkala sebagai task background di event loop aktif
+        """
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Ingestion berita aktif untuk %s sumber", len(self.sources))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._release_leadership()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,72 @@
+import asyncio
+import ipaddress
+import socket
+from urllib.parse import urlparse
+
+import httpx
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class UnsafeUrlError(ValueError):
+    """URL tujuan request keluar tidak diizinkan (skema, host, atau alamat non-publik)"""
+
+
+async def resolve_public_url(url, schemes=("https",), allowed_hosts=None, label="URL"):
+    """
+    Pastikan url absolut dengan skema yang diizinkan, host-nya (bila
+    allowed_hosts diberikan) ada di daftar, dan seluruh alamat hasil
+    resolusinya adalah alamat publik (bukan loopback, jaringan privat, atau
+    link-local). Mengembalikan satu alamat IP yang sudah divalidasi; request
+    harus dikirim ke alamat ini (lihat pinned_request) agar host dengan DNS
+    yang berganti (rebinding) tidak bisa mengarahkan koneksi ke layanan internal.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in schemes or not parsed.hostname:
+        raise UnsafeUrlError(f"{label} harus berupa URL {'/'.join(schemes)}")
+    host = parsed.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        raise UnsafeUrlError(f"Host {label} {host} tidak diizinkan")
+    try:
+        port = parsed.port or _DEFAULT_PORTS[parsed.scheme]
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise UnsafeUrlError(f"Host {label} {host} tidak dapat di-resolve") from e
+    ips = [ipaddress.ip_address(sockaddr[0]) for *_, sockaddr in addresses]
+    if not ips or not all(ip.is_global for ip in ips):
+        raise UnsafeUrlError(f"Host {label} {host} menunjuk ke alamat non-publik")
+    return str(ips[0])
+
+
+def pinned_request(client, method, url, address, **kwargs):
+    """
+    Bangun request ke url yang koneksinya dibuka langsung ke address (hasil
+    resolve_public_url). Header Host dan SNI/verifikasi sertifikat TLS tetap
+    memakai hostname asli.
+    """
+    original = httpx.URL(url)
+    headers = httpx.Headers(kwargs.pop("headers", None))
+    headers["Host"] = original.netloc.decode("ascii")
+    return client.build_request(
+        method,
+        original.copy_with(host=address),
+        headers=headers,
+        extensions={"sni_hostname": original.host},
+        **kwargs,
+    )
+
+
+def pinned_client(timeout, user_agent):
+    """
+    AsyncClient untuk request yang dipin ke alamat IP: redirect tidak diikuti
+    otomatis dan koneksi tidak dipakai ulang, karena pool httpx dikunci per
+    alamat IP sehingga koneksi TLS milik satu host bisa terpakai untuk host
+    lain di alamat yang sama
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout),
+        headers={"User-Agent": user_agent},
+        follow_redirects=False,
+        limits=httpx.Limits(max_keepalive_connections=0),
+        trust_env=False,
+    )
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics_service as metrics
+
+logger = logging.getLogger(__name__)
+
+# Lokasi database log prediksi. Kosongkan untuk menonaktifkan logging.
+PREDICTION_LOG_PATH = os.getenv("PREDICTION_LOG_PATH", "data/predictions.db")
+PREDICTION_LOG_QUEUE = int(os.getenv("PREDICTION_LOG_QUEUE", 10000))
+PREDICTION_LOG_BATCH = int(os.getenv("PREDICTION_LOG_BATCH", 500))
+PREDICTION_LOG_FLUSH_INTERVAL = float(os.getenv("PREDICTION_LOG_FLUSH_INTERVAL", 1.0))
+
+_COLUMNS = (
+    "predict_id",
+    "timestamp",
+    "role",
+    "model_version",
+    "disease_id",
+    "confidence",
+    "top_k",
+    "image_hash",
+    "latency_ms",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    predict_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    role TEXT NOT NULL,
+    model_version TEXT,
+    disease_id TEXT,
+    confidence REAL,
+    top_k TEXT,
+    image_hash TEXT,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_predict_id ON predictions (predict_id);
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp);
+"""
+
+
+class PredictionLog:
+    """
+    Log prediksi asinkron. record() hanya memasukkan entri ke antrian
+    in-memory tanpa pernah menunggu; thread writer di belakang menulis
+    entri secara batch ke SQLite (mode WAL). Bila antrian penuh, entri
+    dibuang dan dihitung di metrik, bukan memblokir request.
+    """
+
+    def __init__(
+        self,
+        path=PREDICTION_LOG_PATH,
+        max_queue=PREDICTION_LOG_QUEUE,
+        batch_size=PREDICTION_LOG_BATCH,
+        flush_interval=PREDICTION_LOG_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="prediction-log-writer", daemon=True
+        )
+        self._thread.start()
+        logger.info("Log prediksi aktif di %s", self.path)
+
+    def stop(self, timeout=5.0):
+        """
+        Hentikan writer setelah sisa antrian ditulis
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, entry):
+        """
+        Masukkan satu entri prediksi ke antrian. Tidak pernah memblokir.
+        """
+        if not self.enabled:
+            return False
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            metrics.inc("prediction_log.dropped")
+            return False
+        metrics.inc("prediction_log.enqueued")
+        return True
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            while not (self._stop.is_set() and self._queue.empty()):
+                batch = self._drain()
+                if batch:
+                    self._write(conn, batch)
+                metrics.set_gauge("prediction_log.queue_size", self._queue.qsize())
+        except Exception as e:
+            logger.error("Writer log prediksi berhenti: %s", e)
+        finally:
+            conn.close()
+
+    def _drain(self):
+        # Tunggu entri pertama, lalu ambil sisanya tanpa menunggu sampai batch penuh
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn, batch):
+        start = time.perf_counter()
+        rows = [
+            tuple(
+                json.dumps(entry.get(column)) if column == "top_k" else entry.get(column)
+                for column in _COLUMNS
+            )
+            for entry in batch
+        ]
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO predictions ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                    rows,
+                )
+        except sqlite3.Error as e:
+            metrics.inc("prediction_log.failed", len(rows))
+            logger.error("Gagal menulis log prediksi: %s", e)
+            return
+        metrics.inc("prediction_log.written", len(rows))
+        metrics.observe("prediction_log.flush", time.perf_counter() - start)
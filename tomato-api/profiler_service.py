@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import metrics_service as metrics
+
+logger = logging.getLogger(__name__)
+
+# Batas sesi profiling yang boleh diminta lewat endpoint admin
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+PROFILE_DEFAULT_INTERVAL_MS = float(os.getenv("PROFILE_DEFAULT_INTERVAL_MS", 5))
+PROFILE_MIN_INTERVAL_MS = 1.0
+# Lokasi trace TensorFlow profiler (dibuka dengan TensorBoard)
+PROFILE_TRACE_DIR = os.getenv("PROFILE_TRACE_DIR", "data/profiles")
+# Kedalaman traceback tracemalloc dan jumlah baris diff yang dikembalikan
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 10))
+PROFILE_TRACEMALLOC_TOP = int(os.getenv("PROFILE_TRACEMALLOC_TOP", 25))
+
+PROFILE_MODES = ("cpu", "wall")
+
+
+class ProfilerBusyError(Exception):
+    """Sesi profiling lain masih berjalan"""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def collapse_stack(frame, thread_name):
+    """
+    Ubah stack sebuah thread menjadi satu baris collapsed-stack
+    (root;...;leaf), diawali nama thread
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels)).replace(" ", "_")
+
+
+class StackSampler:
+    """
+    Sampler stack statistik untuk semua thread di proses ini.
+
+    Mode 'cpu' memakai timer ITIMER_PROF (SIGPROF) sehingga sample hanya
+    diambil saat proses memakai CPU; handler berjalan di main thread dan
+    membaca stack semua thread lewat sys._current_frames(). Mode 'wall'
+    (atau bila sinyal tidak tersedia) memakai thread sampler dengan interval
+    waktu dinding, berguna untuk melihat thread yang menunggu I/O atau lock.
+    Tidak ada hook yang terpasang di luar sesi profiling.
+    """
+
+    def __init__(self, interval=PROFILE_DEFAULT_INTERVAL_MS / 1000, mode="cpu"):
+        self.interval = interval
+        self.mode = mode
+        self.samples = Counter()
+        self.sample_count = 0
+        self._previous_handler = None
+        self._thread = None
+        self._running = threading.Event()
+
+    @staticmethod
+    def signal_available():
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def _sample(self, skip_thread=None, interrupted=None):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        current = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == skip_thread:
+                continue
+            if ident == current and interrupted is not None:
+                # Stack main thread diambil dari frame yang diinterupsi sinyal,
+                # bukan frame handler ini
+                frame = interrupted
+            self.samples[collapse_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+        self.sample_count += 1
+
+    def _handle_signal(self, signum, frame):
+        self._sample(interrupted=frame)
+
+    def _run_thread(self):
+        ident = threading.get_ident()
+        while self._running.is_set():
+            self._sample(skip_thread=ident)
+            time.sleep(self.interval)
+
+    def start(self):
+        self._running.set()
+        if self.mode == "cpu" and self.signal_available():
+            self._previous_handler = signal.signal(signal.SIGPROF, self._handle_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.mode = "wall"
+            self._thread = threading.Thread(target=self._run_thread, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        elif self._previous_handler is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler)
+            self._previous_handler = None
+
+    def collapsed(self):
+        """
+        Output collapsed-stack ("stack jumlah" per baris) yang bisa langsung
+        dibaca flamegraph.pl, speedscope, atau inferno
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def top_functions(self, limit=20):
+        """
+        Fungsi dengan sample terbanyak di puncak stack (self time)
+        """
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {"function": name, "samples": count, "share": round(count / total, 4)}
+            for name, count in leaves.most_common(limit)
+        ]
+
+
+def tracemalloc_diff(before, after, limit=PROFILE_TRACEMALLOC_TOP):
+    """
+    Selisih alokasi antara dua snapshot tracemalloc, dikelompokkan per baris
+    """
+    stats = after.compare_to(before, "lineno")
+    return [
+        {
+            "location": str(stat.traceback[0]),
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+class Profiler:
+    """
+    Satu sesi profiling pada satu waktu: sampler stack, trace TensorFlow
+    profiler (opsional), dan diff snapshot tracemalloc (opsional)
+    """
+
+    def __init__(self, trace_dir=PROFILE_TRACE_DIR):
+        self.trace_dir = trace_dir
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self):
+        return self._lock.locked()
+
+    def _start_tf_trace(self):
+        import tensorflow as tf
+
+        logdir = os.path.join(self.trace_dir, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(logdir, exist_ok=True)
+        tf.profiler.experimental.start(logdir)
+        return logdir
+
+    @staticmethod
+    def _stop_tf_trace():
+        import tensorflow as tf
+
+        tf.profiler.experimental.stop()
+
+    async def run(
+        self,
+        seconds,
+        interval=PROFILE_DEFAULT_INTERVAL_MS / 1000,
+        mode="cpu",
+        memory=False,
+        tf_trace=False,
+    ):
+        """
+        Jalankan profiling selama `seconds` detik sementara worker tetap
+        melayani request, lalu kembalikan ringkasannya
+        """
+        if self.busy:
+            raise ProfilerBusyError("Sesi profiling lain masih berjalan.")
+        async with self._lock:
+            result = {"mode": mode, "seconds": seconds, "interval_ms": round(interval * 1000, 3)}
+            started_tracemalloc = False
+            before = None
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                    started_tracemalloc = True
+                before = tracemalloc.take_snapshot()
+
+            logdir = None
+            if tf_trace:
+                try:
+                    logdir = self._start_tf_trace()
+                except Exception as e:
+                    logger.warning("TensorFlow profiler tidak dapat dijalankan: %s", e)
+                    result["tf_trace_error"] = str(e)
+
+            sampler = StackSampler(interval, mode)
+            sampler.start()
+            metrics.inc("profiler.sessions")
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+                if logdir is not None:
+                    try:
+                        self._stop_tf_trace()
+                    except Exception as e:
+                        logger.warning("TensorFlow profiler gagal dihentikan: %s", e)
+                if memory:
+                    after = tracemalloc.take_snapshot()
+                    if started_tracemalloc:
+                        tracemalloc.stop()
+
+            result["mode"] = sampler.mode
+            result["samples"] = sampler.sample_count
+            result["top_functions"] = sampler.top_functions()
+            result["collapsed"] = sampler.collapsed()
+            if logdir is not None:
+                result["tf_trace_dir"] = logdir
+            if memory:
+                result["tracemalloc"] = tracemalloc_diff(before, after)
+            return result
@@ -0,0 +1,271 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Token bucket per pengguna: isi ulang RATE token per detik, kapasitas BURST
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", 0.2))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", 5))
+# Backend penyimpanan bucket: 'memory' (per worker) atau 'shared' (antar worker gunicorn)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SHARED_PATH = os.getenv(
+    "RATE_LIMIT_SHARED_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "tomato-api-ratelimit"),
+)
+# Batas jumlah prediksi yang berjalan bersamaan per worker
+MAX_CONCURRENT_PREDICTIONS = int(os.getenv("MAX_CONCURRENT_PREDICTIONS", 4))
+# Batas prediksi bersamaan untuk semua worker di host (0 = tanpa batas global).
+# Hanya berlaku dengan RATE_LIMIT_BACKEND=shared.
+MAX_CONCURRENT_PREDICTIONS_GLOBAL = int(os.getenv("MAX_CONCURRENT_PREDICTIONS_GLOBAL", 0))
+
+
+def _refill(tokens, last, now, rate, burst):
+    """
+    Hitung token setelah pengisian ulang, lalu coba ambil satu token.
+    Mengembalikan (tokens_baru, diizinkan, retry_after_detik).
+    """
+    tokens = min(burst, tokens + max(0.0, now - last) * rate)
+    if tokens >= 1.0:
+        return tokens - 1.0, True, 0.0
+    return tokens, False, (1.0 - tokens) / rate
+
+
+class InProcessBackend:
+    """
+    Bucket disimpan di dict milik worker ini saja. Bila jumlah key melebihi
+    max_keys, bucket yang paling lama tidak dipakai dibuang (O(1)); bucket
+    itu kemungkinan besar sudah penuh kembali.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._max_keys = max_keys
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens, allowed, retry_after = _refill(tokens, last, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, retry_after
+
+
+class SharedMemoryBackend:
+    """
+    Bucket disimpan di tabel hash berukuran tetap pada file yang di-mmap
+    (default di /dev/shm), sehingga semua worker gunicorn di host yang sama
+    berbagi state. Akses dikunci dengan fcntl.lockf.
+    Setiap slot: hash key (u64), tokens (f64), waktu terakhir (f64).
+    """
+
+    _SLOT = struct.Struct("<Qdd")
+    _PROBES = 4
+
+    def __init__(self, path=RATE_LIMIT_SHARED_PATH, slots=65536):
+        self.slots = slots
+        size = slots * self._SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mmap = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") | 1  # 0 berarti slot kosong
+
+    def _find_slot(self, key_hash):
+        # Linear probing singkat: slot milik key, slot kosong, atau slot tertua
+        oldest_offset, oldest_last = None, None
+        for i in range(self._PROBES):
+            offset = ((key_hash + i) % self.slots) * self._SLOT.size
+            stored_hash, tokens, last = self._SLOT.unpack_from(self._mmap, offset)
+            if stored_hash == key_hash:
+                return offset, tokens, last
+            if stored_hash == 0:
+                return offset, None, None
+            if oldest_last is None or last < oldest_last:
+                oldest_offset, oldest_last = offset, last
+        return oldest_offset, None, None
+
+    def take(self, key, rate, burst, now):
+        key_hash = self._hash(key)
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, tokens, last = self._find_slot(key_hash)
+                if tokens is None:
+                    tokens, last = burst, now
+                tokens, allowed, retry_after = _refill(tokens, last, now, rate, burst)
+                self._SLOT.pack_into(self._mmap, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return allowed, retry_after
+
+
+class SharedSlotTable:
+    """
+    Budget pekerjaan bersamaan untuk semua worker di host yang sama, pada
+    file mmap di samping tabel bucket (dikunci dengan fcntl.lockf). Setiap
+    worker mencatat jumlah slot miliknya per PID, sehingga slot milik worker
+    yang mati sebelum sempat release dibersihkan saat budget terlihat penuh.
+    Setiap entri: PID (u32), jumlah slot (u32).
+    """
+
+    _ENTRY = struct.Struct("<II")
+
+    def __init__(self, limit, path=RATE_LIMIT_SHARED_PATH + ".slots", entries=1024):
+        self.limit = limit
+        self.entries = entries
+        size = entries * self._ENTRY.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mmap = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _entries(self):
+        for index in range(self.entries):
+            offset = index * self._ENTRY.size
+            pid, count = self._ENTRY.unpack_from(self._mmap, offset)
+            yield offset, pid, count
+
+    def _reap(self):
+        # Hapus entri milik proses yang sudah tidak ada
+        for offset, pid, count in self._entries():
+            if pid == 0 or pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self._ENTRY.pack_into(self._mmap, offset, 0, 0)
+            except PermissionError:
+                pass
+
+    def _scan(self):
+        me = os.getpid()
+        total, own, free = 0, None, None
+        for offset, pid, count in self._entries():
+            if pid == me:
+                own = (offset, count)
+            elif pid == 0 and free is None:
+                free = offset
+            total += count
+        return total, own, free
+
+    def in_use(self):
+        with self._locked():
+            return self._scan()[0]
+
+    def try_acquire(self):
+        with self._locked():
+            total, own, free = self._scan()
+            if total >= self.limit:
+                self._reap()
+                total, own, free = self._scan()
+            if total >= self.limit or (own is None and free is None):
+                return False
+            offset, count = own if own is not None else (free, 0)
+            self._ENTRY.pack_into(self._mmap, offset, os.getpid(), count + 1)
+            return True
+
+    def release(self):
+        with self._locked():
+            _, own, _ = self._scan()
+            if own is not None:
+                offset, count = own
+                if count <= 1:
+                    self._ENTRY.pack_into(self._mmap, offset, 0, 0)
+                else:
+                    self._ENTRY.pack_into(self._mmap, offset, os.getpid(), count - 1)
+
+
+def create_backend(name=RATE_LIMIT_BACKEND):
+    if name == "shared":
+        try:
+            return SharedMemoryBackend()
+        except OSError as e:
+            logger.warning("Backend rate limit 'shared' gagal dibuat (%s), memakai 'memory'", e)
+    elif name != "memory":
+        logger.warning("Backend rate limit '%s' tidak dikenal, memakai 'memory'", name)
+    return InProcessBackend()
+
+
+class TokenBucketLimiter:
+    """Rate limiter token bucket per key (mis. uid Firebase)"""
+
+    def __init__(self, backend=None, rate=RATE_LIMIT_USER_RATE, burst=RATE_LIMIT_USER_BURST):
+        self.backend = backend if backend is not None else create_backend()
+        self.rate = rate
+        self.burst = burst
+
+    def take(self, key):
+        """
+        Ambil satu token untuk key. Mengembalikan (diizinkan, retry_after_detik).
+        """
+        return self.backend.take(key, self.rate, self.burst, time.time())
+
+
+def create_slot_table(name=RATE_LIMIT_BACKEND, limit=MAX_CONCURRENT_PREDICTIONS_GLOBAL):
+    """
+    Tabel slot global antar worker, atau None bila tidak dipakai
+    """
+    if not limit:
+        return None
+    if name != "shared":
+        logger.warning("MAX_CONCURRENT_PREDICTIONS_GLOBAL hanya berlaku dengan RATE_LIMIT_BACKEND=shared")
+        return None
+    try:
+        return SharedSlotTable(limit)
+    except OSError as e:
+        logger.warning("Budget prediksi global tidak dapat dibuat (%s), hanya batas per worker", e)
+        return None
+
+
+class ConcurrencyLimiter:
+    """
+    Budget jumlah pekerjaan yang berjalan bersamaan, tanpa antrian: batas
+    per worker, ditambah batas global antar worker bila `shared` diberikan
+    """
+
+    def __init__(self, limit=MAX_CONCURRENT_PREDICTIONS, shared=None):
+        self.limit = limit
+        self.shared = shared
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            if self.shared is not None and not self.shared.try_acquire():
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            if self.shared is not None:
+                self.shared.release()
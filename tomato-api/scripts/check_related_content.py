@@ -0,0 +1,65 @@
+"""
+Periksa konten terkait per kelas penyakit pada korpus bawaan.
+
+    python scripts/check_related_content.py
+
+Untuk setiap kelas dicek bahwa:
+- tidak ada konten yang judulnya menyebut penyakit kelas lain (frasa pembeda
+  kelas lain) tanpa menyebut penyakit kelas itu sendiri,
+- kelas Healthy tidak diberi konten kategori hama & penyakit,
+- kelas yang punya artikel khusus di korpus mendapat artikel itu di urutan pertama.
+
+Keluar dengan status 1 bila ada pelanggaran.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import content_service  # noqa: E402
+from content_service import _KELAS_SEHAT, _RELATED_QUERIES, content_index, load_content_index  # noqa: E402
+
+# Kata di judul artikel pertama yang diharapkan untuk kelas dengan artikel khusus
+EXPECTED_TOP = {
+    "Early_blight": ("hawar dini", "early blight"),
+    "Spider_mites": ("tungau",),
+    "YellowLeaf__Curl_Virus": ("kutu kebul", "keriting"),
+}
+KATEGORI_PENYAKIT = "Hama & Penyakit"
+
+
+def mentions(title, phrases):
+    return any(phrase in title for phrase in phrases)
+
+
+def check():
+    load_content_index()
+    snapshot = content_index.snapshot()
+    # related_index diganti referensinya saat dibangun, jadi dibaca dari modul
+    table = content_service.related_index
+    failures = []
+    for kelas, (_, phrases, _) in _RELATED_QUERIES.items():
+        entries = table.get(kelas, ())
+        titles = []
+        for key, score in entries:
+            content = snapshot.get(key)
+            title = (content.get("title") or "").lower()
+            titles.append(title)
+            for other, (_, other_phrases, _) in _RELATED_QUERIES.items():
+                if other != kelas and mentions(title, other_phrases) and not mentions(title, phrases):
+                    failures.append(f"{kelas}: '{content['title']}' membahas {other}")
+            if kelas == _KELAS_SEHAT and content.get("category") == KATEGORI_PENYAKIT:
+                failures.append(f"{kelas}: '{content['title']}' adalah konten penyakit")
+        expected = EXPECTED_TOP.get(kelas)
+        if expected and (not titles or not mentions(titles[0], expected)):
+            failures.append(f"{kelas}: artikel pertama bukan artikel {'/'.join(expected)}")
+        print(f"{kelas}: {len(entries)} konten" + (f", teratas '{titles[0]}'" if titles else ""))
+    return failures
+
+
+if __name__ == "__main__":
+    problems = check()
+    for problem in problems:
+        print(f"GAGAL {problem}")
+    sys.exit(1 if problems else 0)
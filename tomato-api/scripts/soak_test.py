@@ -0,0 +1,148 @@
+"""
+Soak test memori: kirim prediksi terus-menerus ke server yang sedang
+berjalan dan pastikan RSS tidak terus naik.
+
+    python scripts/soak_test.py daun.jpg --url http://localhost:8000 --token $ID_TOKEN \\
+        --duration 1800 --concurrency 4 --pid $(pgrep -o -f "gunicorn.*main:app")
+
+RSS dibaca dari /proc untuk --pid beserta seluruh proses turunannya (master
+gunicorn dan semua worker). Tanpa --pid, RSS diambil dari gauge
+memory.rss_bytes di /metrics, yang hanya akurat bila server berjalan dengan
+satu worker. Setelah masa pemanasan, median RSS pada jendela terakhir
+dibandingkan dengan jendela pertama; script keluar dengan status 1 bila
+kenaikannya melebihi --max-growth-mb.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Field setelah "(comm)": state, ppid, ...
+        if int(stat[stat.rindex(b")") + 2 :].split()[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def process_tree_rss(pid):
+    """
+    Total RSS (bytes) sebuah proses dan seluruh turunannya
+    """
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm", "rb") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except OSError:
+            continue
+        pending.extend(_children(current))
+    return total
+
+
+async def metrics_rss(client):
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    return response.json()["data"]["gauges"].get("memory.rss_bytes", 0)
+
+
+async def drive(client, path, image, content_type, deadline, statuses):
+    while time.monotonic() < deadline:
+        try:
+            response = await client.post(path, files={"file": ("soak.jpg", image, content_type)})
+            statuses[response.status_code] += 1
+            if response.status_code in (429, 503):
+                await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+            await asyncio.sleep(1)
+
+
+async def sample(client, args, deadline, samples):
+    start = time.monotonic()
+    while time.monotonic() < deadline:
+        try:
+            rss = process_tree_rss(args.pid) if args.pid else await metrics_rss(client)
+        except (OSError, httpx.HTTPError, KeyError, ValueError) as e:
+            print(f"Gagal membaca RSS: {e}", file=sys.stderr)
+        else:
+            elapsed = time.monotonic() - start
+            samples.append((elapsed, rss))
+            print(f"{elapsed:7.0f}s  RSS {rss / 1024 / 1024:8.1f} MB", flush=True)
+        await asyncio.sleep(args.sample_interval)
+
+
+def window_median(samples, begin, end):
+    values = [rss for elapsed, rss in samples if begin <= elapsed < end]
+    return statistics.median(values) if values else None
+
+
+async def run(args):
+    with open(args.image, "rb") as f:
+        image = f.read()
+    content_type = "image/png" if args.image.lower().endswith(".png") else "image/jpeg"
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    statuses = Counter()
+    samples = []
+    deadline = time.monotonic() + args.duration
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=60) as client:
+        await asyncio.gather(
+            sample(client, args, deadline, samples),
+            *(drive(client, args.path, image, content_type, deadline, statuses) for _ in range(args.concurrency)),
+        )
+
+    print("Status respons:", dict(statuses))
+    first = window_median(samples, args.warmup, args.warmup + args.window)
+    last = window_median(samples, args.duration - args.window, args.duration + args.sample_interval)
+    if first is None or last is None or args.duration < args.warmup + 2 * args.window:
+        print("Durasi terlalu pendek untuk membandingkan RSS (butuh warmup + 2 x window)")
+        return 1
+    growth = (last - first) / 1024 / 1024
+    print(f"Median RSS awal {first / 1024 / 1024:.1f} MB, akhir {last / 1024 / 1024:.1f} MB, naik {growth:.1f} MB")
+    if statuses[200] == 0:
+        print("GAGAL tidak ada prediksi yang berhasil")
+        return 1
+    if growth > args.max_growth_mb:
+        print(f"GAGAL RSS naik lebih dari {args.max_growth_mb} MB")
+        return 1
+    print("OK RSS stabil")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test memori endpoint prediksi")
+    parser.add_argument("image", help="Gambar daun yang dikirim berulang kali")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/predict", help="Endpoint prediksi (mis. /predict?tta=true)")
+    parser.add_argument("--token", default=os.getenv("SOAK_ID_TOKEN"), help="Firebase ID token (default SOAK_ID_TOKEN)")
+    parser.add_argument("--pid", type=int, help="PID server (master gunicorn); RSS dijumlah dengan semua turunannya")
+    parser.add_argument("--duration", type=float, default=1800, help="Lama test (detik)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=float, default=120, help="Detik awal yang diabaikan (model, cache, arena)")
+    parser.add_argument("--window", type=float, default=120, help="Panjang jendela pembanding (detik)")
+    parser.add_argument("--sample-interval", type=float, default=5)
+    parser.add_argument("--max-growth-mb", type=float, default=50)
+    return asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
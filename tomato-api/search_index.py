@@ -0,0 +1,428 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import metrics_service as metrics
+
+logger = logging.getLogger(__name__)
+
+# Field yang diindeks untuk pencarian teks
+SEARCH_FIELDS = ("title", "description", "content")
+
+# Field yang dihitung sebagai facet (jumlah dokumen per kombinasi nilai)
+FACET_FIELDS = ("type", "category")
+
+# Merge dijalankan di background bila jumlah segmen melebihi batas ini
+MAX_SEGMENTS = 8
+
+# Jarak edit maksimum yang didukung index penghapusan (SymSpell)
+MAX_EDIT_DISTANCE = 2
+
+# Parameter BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Pecah teks menjadi token kata huruf kecil
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text):
+    """
+    Himpunan substring 3 karakter dari teks (sudah huruf kecil)
+    """
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def max_edits_for(term):
+    """
+    Jarak edit yang diizinkan berdasarkan panjang kata: kata pendek harus persis
+    """
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return MAX_EDIT_DISTANCE
+
+
+def deletes(term, distance):
+    """
+    Semua variasi kata dengan menghapus hingga 'distance' karakter (termasuk kata aslinya)
+    """
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {
+            word[:i] + word[i + 1 :] for word in frontier if len(word) > 1 for i in range(len(word))
+        }
+        results |= frontier
+    return results
+
+
+class Segment:
+    """
+    Segmen index yang tidak berubah setelah dibuat. Menyimpan dokumen,
+    posting trigram (untuk pencarian substring), posting term dengan
+    frekuensi (untuk ranking), serta tombstone untuk dokumen yang dihapus
+    atau diganti pada segmen yang lebih lama.
+    """
+
+    __slots__ = (
+        "docs", "texts", "order", "facets", "grams", "terms", "lengths", "tombstones", "_deletes"
+    )
+
+    def __init__(self, entries=(), tombstones=()):
+        # entries: iterable (key, doc, order)
+        self.docs = {}
+        self.texts = {}
+        self.order = {}
+        self.facets = {}
+        self.grams = {}
+        self.terms = {}
+        self.lengths = {}
+        self.tombstones = frozenset(tombstones)
+        self._deletes = None
+        for key, doc, order in entries:
+            self._add(key, doc, order)
+
+    def _add(self, key, doc, order):
+        texts = tuple((doc.get(field) or "").lower() for field in SEARCH_FIELDS)
+        self.docs[key] = doc
+        self.texts[key] = texts
+        self.order[key] = order
+        self.facets[key] = tuple(doc.get(field) for field in FACET_FIELDS)
+
+        grams = set()
+        counts = Counter()
+        for text in texts:
+            grams |= trigrams(text)
+            counts.update(tokenize(text))
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(key)
+        for term, frequency in counts.items():
+            self.terms.setdefault(term, {})[key] = frequency
+        self.lengths[key] = sum(counts.values())
+
+    def __len__(self):
+        return len(self.docs)
+
+    def deletion_index(self):
+        """
+        Index penghapusan SymSpell untuk kosakata segmen ini: variasi hapus-karakter
+        -> himpunan term asli. Dibangun sekali saat pertama kali dibutuhkan.
+        """
+        if self._deletes is None:
+            index = {}
+            for term in self.terms:
+                for variant in deletes(term, max_edits_for(term)):
+                    index.setdefault(variant, set()).add(term)
+            self._deletes = index
+        return self._deletes
+
+
+class Snapshot:
+    """
+    Tampilan index yang konsisten: tuple segmen dari yang terlama ke terbaru.
+    Dokumen pada segmen yang lebih baru (atau tombstone) menimpa yang lebih lama.
+    Snapshot tidak pernah berubah, sehingga query yang sedang berjalan tidak
+    terpengaruh oleh update. Jumlah dokumen hidup per kombinasi facet dan
+    total panjang dokumen hidup (untuk BM25) dibawa dari snapshot
+    sebelumnya dan diperbarui per segmen baru.
+    """
+
+    def __init__(self, segments, version, facet_counts=None, total_length=0):
+        self.segments = segments
+        self.version = version
+        self.facet_counts = facet_counts if facet_counts is not None else Counter()
+        self.total_length = total_length
+        self._documents = None
+        self._live = None
+
+    def _is_live(self, key, position):
+        # Dokumen hidup bila tidak ditimpa atau dihapus oleh segmen yang lebih baru
+        for newer in self.segments[position + 1 :]:
+            if key in newer.docs or key in newer.tombstones:
+                return False
+        return True
+
+    def _locate(self, key):
+        for segment in reversed(self.segments):
+            if key in segment.docs:
+                return segment
+            if key in segment.tombstones:
+                return None
+        return None
+
+    def get(self, key):
+        segment = self._locate(key)
+        return segment.docs[key] if segment is not None else None
+
+    def live(self):
+        """
+        Dict key -> segmen tempat dokumen hidup berada (di-cache per snapshot)
+        """
+        if self._live is None:
+            live = {}
+            removed = set()
+            for segment in reversed(self.segments):
+                for key in segment.docs:
+                    if key not in live and key not in removed:
+                        live[key] = segment
+                removed |= segment.tombstones
+            self._live = live
+        return self._live
+
+    def documents(self):
+        """
+        Semua dokumen hidup, terurut publishedAt menurun (di-cache per snapshot)
+        """
+        if self._documents is None:
+            live = self.live()
+            self._documents = self._sorted(live)
+        return self._documents
+
+    def _sorted(self, keyed_segments):
+        ordered = sorted(
+            keyed_segments.items(),
+            key=lambda item: (
+                item[1].docs[item[0]].get("publishedAt", ""),
+                -item[1].order[item[0]],
+            ),
+            reverse=True,
+        )
+        return [segment.docs[key] for key, segment in ordered]
+
+    def search_keys(self, query):
+        """
+        Key dokumen hidup yang mengandung query sebagai substring di salah satu
+        field pencarian (perilaku sama dengan pencarian 'in' sebelumnya).
+        Query >= 3 karakter memakai posting trigram untuk memilih kandidat.
+        """
+        query = query.lower()
+        grams = trigrams(query)
+        found = {}
+        for position, segment in enumerate(self.segments):
+            if grams:
+                postings = [segment.grams.get(gram) for gram in grams]
+                if not all(postings):
+                    continue
+                postings.sort(key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = segment.docs.keys()
+            for key in candidates:
+                if any(query in text for text in segment.texts[key]) and self._is_live(key, position):
+                    found[key] = segment
+        return found
+
+    def search(self, query):
+        return self._sorted(self.search_keys(query))
+
+    def count_facets(self, keys):
+        """
+        Jumlah dokumen per kombinasi facet untuk sekumpulan key hidup
+        (mis. hasil search_keys), dibaca dari nilai facet yang disimpan segmen
+        """
+        live = self.live()
+        return Counter(live[key].facets[key] for key in keys if key in live)
+
+    def vocabulary_candidates(self, variant):
+        """
+        Term dari semua segmen yang memiliki variasi hapus-karakter tertentu
+        """
+        found = set()
+        for segment in self.segments:
+            found |= segment.deletion_index().get(variant, set())
+        return found
+
+    def _bm25_stats(self, term):
+        # (segmen, posting) untuk sebuah term dan IDF-nya; jumlah dokumen
+        # hidup dan panjang rata-rata dibaca dari statistik yang dibawa snapshot
+        postings = [
+            (segment, segment.terms[term]) for segment in self.segments if term in segment.terms
+        ]
+        frequency = sum(len(posting) for _, posting in postings)
+        total = sum(self.facet_counts.values())
+        if frequency == 0 or total == 0:
+            return postings, 0.0
+        return postings, math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+
+    def _bm25(self, tf, length, idf):
+        average_length = self.total_length / max(1, sum(self.facet_counts.values()))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / max(average_length, 1e-9))
+        return idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    def score(self, weighted_terms):
+        """
+        Skor BM25 untuk dokumen hidup. weighted_terms: dict term -> bobot.
+        Mengembalikan dict key -> skor.
+        """
+        live = self.live()
+        if not live:
+            return {}
+
+        scores = {}
+        for term, weight in weighted_terms.items():
+            postings, idf = self._bm25_stats(term)
+            if idf == 0.0:
+                continue
+            for segment, posting in postings:
+                for key, tf in posting.items():
+                    if live.get(key) is not segment:
+                        continue
+                    score = weight * self._bm25(tf, segment.lengths[key], idf)
+                    scores[key] = scores.get(key, 0.0) + score
+        return scores
+
+    def score_document(self, key, weighted_terms):
+        """
+        Skor BM25 satu dokumen, sama dengan score()[key] tetapi tanpa
+        memindai posting dokumen lain (biaya sebanding jumlah term query)
+        """
+        segment = self._locate(key)
+        if segment is None:
+            return 0.0
+        total = 0.0
+        for term, weight in weighted_terms.items():
+            tf = segment.terms.get(term, {}).get(key)
+            if tf:
+                _, idf = self._bm25_stats(term)
+                total += weight * self._bm25(tf, segment.lengths[key], idf)
+        return total
+
+    def contains(self, key, query):
+        """
+        True bila dokumen hidup `key` mengandung query sebagai substring
+        (kriteria yang sama dengan search_keys)
+        """
+        segment = self._locate(key)
+        query = query.lower()
+        return segment is not None and any(query in text for text in segment.texts[key])
+
+
+class SearchIndex:
+    """
+    Index pencarian berbasis segmen (gaya LSM). Setiap add/update/delete
+    membuat satu segmen kecil berisi dokumen tersebut sehingga biayanya
+    O(ukuran dokumen), lalu snapshot baru dipublikasikan secara atomik.
+    Segmen-segmen kecil digabung secara berkala di background thread.
+    """
+
+    def __init__(self, max_segments=MAX_SEGMENTS):
+        self.max_segments = max_segments
+        self._write_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._snapshot = Snapshot((), 0)
+        self._next_order = 0
+
+    def snapshot(self):
+        return self._snapshot
+
+    def _publish(self, segment):
+        # Dipanggil dengan _write_lock dipegang
+        current = self._snapshot
+        facet_counts = current.facet_counts.copy()
+        total_length = current.total_length
+        for key in segment.tombstones.union(segment.docs):
+            previous = current._locate(key)
+            if previous is not None:
+                facet_counts[previous.facets[key]] -= 1
+                total_length -= previous.lengths[key]
+        for facets in segment.facets.values():
+            facet_counts[facets] += 1
+        total_length += sum(segment.lengths.values())
+        self._snapshot = Snapshot(
+            current.segments + (segment,), current.version + 1, +facet_counts, total_length
+        )
+        metrics.set_gauge("search_index.segments", len(self._snapshot.segments))
+
+    def _order_for(self, key):
+        # Pertahankan urutan awal dokumen yang di-update, dokumen baru di belakang
+        segment = self._snapshot._locate(key)
+        if segment is not None:
+            return segment.order[key]
+        self._next_order += 1
+        return self._next_order
+
+    def bulk_load(self, entries):
+        """
+        Bangun satu segmen dari banyak dokumen sekaligus (untuk startup)
+        """
+        with self._write_lock:
+            items = []
+            for key, doc in entries:
+                self._next_order += 1
+                items.append((key, doc, self._next_order))
+            segment = Segment(items)
+            segment.deletion_index()
+            self._publish(segment)
+
+    def upsert(self, key, doc):
+        """
+        Tambah atau ganti satu dokumen
+        """
+        start = time.perf_counter()
+        with self._write_lock:
+            self._publish(Segment([(key, doc, self._order_for(key))]))
+        metrics.observe("search_index.upsert", time.perf_counter() - start)
+        self.maybe_merge()
+
+    def delete(self, key):
+        """
+        Hapus satu dokumen dengan menulis tombstone. Mengembalikan False
+        bila dokumen tidak ada.
+        """
+        with self._write_lock:
+            if self._snapshot.get(key) is None:
+                return False
+            self._publish(Segment(tombstones=[key]))
+        self.maybe_merge()
+        return True
+
+    def maybe_merge(self):
+        if len(self._snapshot.segments) <= self.max_segments or self._merge_lock.locked():
+            return
+        threading.Thread(target=self.merge, name="search-index-merge", daemon=True).start()
+
+    def merge(self):
+        """
+        Gabungkan semua segmen pada snapshot saat ini menjadi satu segmen.
+        Segmen yang ditambahkan selama merge berjalan tetap dipertahankan.
+        """
+        if not self._merge_lock.acquire(blocking=False):
+            return
+        try:
+            start = time.perf_counter()
+            snapshot = self._snapshot
+            merged_count = len(snapshot.segments)
+            if merged_count <= 1:
+                return
+            live = snapshot.live()
+            merged = Segment(
+                (key, segment.docs[key], segment.order[key]) for key, segment in live.items()
+            )
+            merged.deletion_index()
+            with self._write_lock:
+                current = self._snapshot
+                # Segmen yang di-merge selalu merupakan prefix dari snapshot terbaru
+                self._snapshot = Snapshot(
+                    (merged,) + current.segments[merged_count:],
+                    current.version + 1,
+                    current.facet_counts,
+                    current.total_length,
+                )
+            metrics.inc("search_index.merges")
+            metrics.set_gauge("search_index.segments", len(self._snapshot.segments))
+            metrics.observe("search_index.merge", time.perf_counter() - start)
+        finally:
+            self._merge_lock.release()
+        # Segmen baru mungkin menumpuk selama merge berjalan
+        self.maybe_merge()
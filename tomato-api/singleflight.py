@@ -0,0 +1,34 @@
+import asyncio
+
+import metrics_service as metrics
+
+
+class SingleFlight:
+    """
+    Gabungkan pemanggilan identik yang berjalan bersamaan. Pemanggil pertama
+    untuk sebuah key menjalankan pekerjaan sebagai task; pemanggil lain dengan
+    key yang sama menunggu task tersebut alih-alih menghitung ulang.
+    Pekerjaan tidak ikut dibatalkan bila salah satu pemanggil terputus.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, func, *args):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            metrics.inc(f"singleflight.{self.name}.leader")
+        else:
+            metrics.inc(f"singleflight.{self.name}.shared")
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Tandai exception sudah diambil bila semua pemanggil sudah terputus
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,273 @@
+import asyncio
+import fcntl
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urljoin
+
+import httpx
+from PIL import Image
+
+import metrics_service as metrics
+from image_service import decode_image, probe_image
+from outbound_http import UnsafeUrlError, pinned_client, pinned_request, resolve_public_url
+
+logger = logging.getLogger(__name__)
+
+# Lebar thumbnail yang dibuat untuk setiap gambar; permintaan dibulatkan ke atas
+THUMB_WIDTHS = tuple(
+    sorted(int(width) for width in os.getenv("THUMB_WIDTHS", "160,320,640").split(","))
+)
+THUMB_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", 80))
+# Lokasi dan batas ukuran cache thumbnail di disk. Kosongkan direktori untuk
+# menonaktifkan cache (thumbnail dibuat ulang setiap request).
+THUMB_CACHE_DIR = os.getenv("THUMB_CACHE_DIR", "data/thumbs")
+THUMB_CACHE_MAX_BYTES = int(os.getenv("THUMB_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Batas pengambilan gambar sumber
+THUMB_FETCH_TIMEOUT = float(os.getenv("THUMB_FETCH_TIMEOUT", 10))
+THUMB_MAX_SOURCE_BYTES = int(os.getenv("THUMB_MAX_SOURCE_BYTES", 10 * 1024 * 1024))
+THUMB_MAX_REDIRECTS = int(os.getenv("THUMB_MAX_REDIRECTS", 5))
+
+_USER_AGENT = "tomato-api-thumbnail/1.0"
+
+
+class SourceImageError(Exception):
+    """Gambar sumber tidak dapat diambil atau bukan gambar yang valid"""
+
+
+def snap_width(width, widths=THUMB_WIDTHS):
+    """
+    Bulatkan lebar yang diminta ke lebar tetap terdekat di atasnya
+    """
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+def render_variants(source_bytes, widths=THUMB_WIDTHS, formats=tuple(THUMB_FORMATS)):
+    """
+    Decode gambar sumber sekali (draft/reduce untuk lebar terbesar), lalu
+    buat semua kombinasi lebar x format. Mengembalikan dict (lebar, format) -> bytes.
+    Gambar yang lebih kecil dari lebar target tidak diperbesar.
+    """
+    probe, image = probe_image(source_bytes)
+    largest = max(widths)
+    target = (largest, max(1, round(probe.height * largest / probe.width)))
+    base = decode_image(image, probe, target)
+
+    variants = {}
+    for width in sorted(widths, reverse=True):
+        if base.width > width:
+            base = base.resize(
+                (width, max(1, round(base.height * width / base.width))), Image.LANCZOS
+            )
+        for name in formats:
+            pil_format, _ = THUMB_FORMATS[name]
+            buffer = io.BytesIO()
+            base.save(buffer, pil_format, quality=THUMB_QUALITY)
+            variants[(width, name)] = buffer.getvalue()
+    return variants
+
+
+class ThumbnailCache:
+    """
+    Cache thumbnail di disk yang dialamatkan dengan isi: setiap variant
+    disimpan sebagai <sha256>.<format>, sehingga isi yang sama hanya
+    disimpan sekali dan nama file sekaligus menjadi ETag. Peta
+    (url, lebar, format) -> nama file disimpan sebagai file kecil di keys/.
+    Semua state ada di direktori cache, jadi dipakai bersama oleh semua
+    worker: bila total ukuran file di direktori melebihi batas, file dengan
+    waktu akses (mtime) terlama dihapus (LRU) di bawah kunci file antar proses.
+    """
+
+    def __init__(self, directory=THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        if self.enabled:
+            os.makedirs(self._path("keys"), exist_ok=True)
+            with self._file_lock():
+                self._evict()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    @staticmethod
+    def _key_name(url, width, name):
+        return hashlib.sha256(f"{url}|{width}|{name}".encode()).hexdigest()
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Kunci eviction antar proses (dan antar thread di proses ini)
+        """
+        with self._lock:
+            if self._lock_fd is None:
+                self._lock_fd = os.open(self._path("cache.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    def _write_atomic(self, path, data):
+        # Nama sementara unik per proses/thread agar worker lain tidak menimpanya
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    def get(self, url, width, name):
+        """
+        Path file variant bila ada di cache (dan tandai baru diakses), atau None
+        """
+        if not self.enabled:
+            return None
+        link = self._path("keys", self._key_name(url, width, name))
+        try:
+            with open(link, encoding="ascii") as f:
+                filename = f.read().strip()
+        except OSError:
+            return None
+        path = self._path(filename)
+        try:
+            # mtime adalah waktu akses terakhir untuk urutan LRU
+            os.utime(path)
+        except OSError:
+            # Variant sudah dihapus eviction (mungkin oleh worker lain)
+            try:
+                os.remove(link)
+            except OSError:
+                pass
+            return None
+        return path
+
+    def put(self, url, variants):
+        """
+        Simpan semua variant untuk satu url lalu jalankan eviction LRU
+        """
+        if not self.enabled:
+            return
+        for (width, name), data in variants.items():
+            filename = f"{hashlib.sha256(data).hexdigest()}.{name}"
+            path = self._path(filename)
+            try:
+                os.utime(path)
+            except OSError:
+                self._write_atomic(path, data)
+            self._write_atomic(self._path("keys", self._key_name(url, width, name)), filename.encode("ascii"))
+        with self._file_lock():
+            self._evict()
+
+    def _evict(self):
+        # Dipanggil dengan _file_lock dipegang. Pemakaian dihitung ulang dari
+        # direktori sehingga mencakup file yang ditulis semua worker.
+        files, total = [], 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.rpartition(".")[2] in THUMB_FORMATS:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+                total += stat.st_size
+        files.sort()
+        evicted = 0
+        # File yang baru diakses/ditulis (terakhir di urutan) selalu disisakan
+        for _, filename, size in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(filename))
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            metrics.inc("thumb_cache.evicted", evicted)
+        metrics.set_gauge("thumb_cache.bytes", total)
+        return total
+
+
+class ThumbnailService:
+    """
+    Ambil gambar sumber sekali per url, buat semua variant thumbnail di
+    thread terpisah, lalu simpan ke cache disk
+    """
+
+    def __init__(self, cache=None, timeout=THUMB_FETCH_TIMEOUT, max_source_bytes=THUMB_MAX_SOURCE_BYTES):
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.timeout = timeout
+        self.max_source_bytes = max_source_bytes
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = pinned_client(self.timeout, _USER_AGENT)
+        return self._client
+
+    async def fetch_source(self, url):
+        """
+        Ambil gambar sumber. imageUrl bisa berasal dari feed eksternal, jadi
+        setiap request (termasuk setiap redirect) hanya boleh ke http(s) pada
+        alamat publik, dan koneksi dibuka ke alamat yang sudah divalidasi.
+        """
+        start = time.perf_counter()
+        client = self._get_client()
+        try:
+            for _ in range(THUMB_MAX_REDIRECTS + 1):
+                address = await resolve_public_url(url, schemes=("http", "https"), label="gambar sumber")
+                response = await client.send(pinned_request(client, "GET", url, address), stream=True)
+                try:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    response.raise_for_status()
+                    chunks, size = [], 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_source_bytes:
+                            raise SourceImageError("Gambar sumber terlalu besar")
+                        chunks.append(chunk)
+                    break
+                finally:
+                    await response.aclose()
+            else:
+                raise SourceImageError("Gambar sumber terlalu banyak redirect")
+        except (httpx.HTTPError, UnsafeUrlError) as e:
+            metrics.inc("thumb.fetch_failed")
+            raise SourceImageError(f"Gagal mengambil gambar sumber: {e}") from e
+        metrics.observe("thumb.fetch", time.perf_counter() - start)
+        return b"".join(chunks)
+
+    async def generate(self, url):
+        """
+        Ambil gambar sumber dan simpan semua variant ke cache
+        """
+        source = await self.fetch_source(url)
+        start = time.perf_counter()
+        try:
+            variants = await asyncio.to_thread(render_variants, source)
+        except (ValueError, OSError, SyntaxError) as e:
+            # OSError/SyntaxError: gambar terpotong atau rusak setelah header
+            metrics.inc("thumb.render_failed")
+            raise SourceImageError(f"Gambar sumber tidak valid: {e}") from e
+        metrics.observe("thumb.render", time.perf_counter() - start)
+        await asyncio.to_thread(self.cache.put, url, variants)
+        return variants
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None